@@ -0,0 +1,276 @@
+"""Runs the benchmark suite on synthetic registers and compares each result with the recorded baseline.
+
+Run from the repository root with: python benchmarks/run.py [names...] [--quick] [--save]
+Each benchmark reports the best of several runs. One that runs more than --tolerance slower than its baseline
+is flagged and the runner exits with status 1. --save records the results as the new baseline.
+Baselines only apply to the machine they were recorded on, so record one before comparing anything."""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable
+
+# Anything the package caches next to the scrapes, like canonical firm names, goes in a scratch folder
+SCRATCH = tempfile.TemporaryDirectory()
+os.environ["TTIPABOT_SCRAPES"] = SCRATCH.name
+
+import numpy as np
+import pandas as pd
+
+import synthetic
+from ttipabot import analyser, firm_rules, scraper
+
+BASELINE_PATH = Path(__file__).parent / "baseline.json"
+
+class Benchmark:
+    """A named piece of work, made by <setup> from the sizes in <params>, with <params> scaled down by --quick.
+    <fresh> benchmarks modify what they work on, so are set up again before each run."""
+
+    def __init__(self, name: str, setup: Callable, params: dict, fresh: bool = False):
+        self.name = name
+        self.setup = setup
+        self.params = params
+        self.fresh = fresh
+
+BENCHMARKS: dict[str, Benchmark] = {}
+
+def benchmark(name: str, fresh: bool = False, **params):
+    """Registers a setup function that returns the work to time. The work may return its own time in seconds,
+    for work like starting a process whose overhead shouldn't count."""
+    def register(setup):
+        BENCHMARKS[name] = Benchmark(name, setup, params, fresh)
+        return setup
+    return register
+
+def chunked(data: bytes, size: int = scraper.CHUNK_SIZE) -> list[bytes]:
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+@benchmark("parse", rows=5000)
+def parse_setup(workDir: Path, rows: int):
+    """Decoding, unescaping and parsing a downloaded register, as a scrape does."""
+    df = synthetic.synthetic_register(rows, firmNoise=0.05)
+    chunks = chunked(synthetic.register_response(df))
+    parse = lambda: scraper.parse_register_html(scraper.unescape_stream(scraper.decode_stream(chunks, "utf-8")))
+    assert parse() == df.values.tolist(), "synthetic register didn't parse back to its rows"
+    return parse
+
+@benchmark("parse-soup", rows=1000)
+def parse_soup_setup(workDir: Path, rows: int):
+    """Parsing with BeautifulSoup, the slower path get_full_register takes."""
+    from bs4 import BeautifulSoup
+    df = synthetic.synthetic_register(rows, firmNoise=0.05)
+    rawHTML = synthetic.clean_html(synthetic.register_response(df))
+    def parse():
+        soup = BeautifulSoup(rawHTML, 'lxml')
+        return scraper.parse_register(soup.find_all(class_="list-item attorney"))
+    assert parse() == df.values.tolist(), "synthetic register didn't parse back to its rows"
+    return parse
+
+@benchmark("diff", rows=100_000, rate=0.01)
+def diff_setup(workDir: Path, rows: int, rate: float):
+    """Diffing consecutive snapshots, and projecting the diff for every comparison mode."""
+    df1 = synthetic.synthetic_register(rows, firmNoise=0.02)
+    df2 = synthetic.churn(df1, rate)
+    return lambda: analyser.project_diffs(analyser.diff_dfs(df1, df2, False, False), list(analyser.COMPARE_MODES))
+
+@benchmark("diff-merge", rows=100_000, rate=0.01)
+def diff_merge_setup(workDir: Path, rows: int, rate: float):
+    """The merge on every column that get_diffs_df replaced, kept to show what the keyed join saves."""
+    df1 = synthetic.synthetic_register(rows)
+    df2 = synthetic.churn(df1, rate)
+    return lambda: merge_diffs_df(df1, df2)
+
+def merge_diffs_df(df_date1: pd.DataFrame, df_date2: pd.DataFrame) -> pd.DataFrame:
+    df_diff = pd.merge(df_date1, df_date2, how="outer", indicator="Exist")
+    df_diff = df_diff.query("Exist != 'both'")
+    df_left = df_diff.query("Exist == 'left_only'").sort_values(by = 'Name')
+    df_right = df_diff.query("Exist == 'right_only'").sort_values(by = 'Name')
+    df_diffs = pd.merge(df_left, df_right, on='Name', how="outer", indicator="NameExist")
+    df_diffs['Change'] = np.select([df_diffs['NameExist'] == 'right_only', df_diffs['NameExist'] == 'left_only',
+                                    (df_diffs['Firm_x'] != df_diffs['Firm_y']).fillna(False).to_numpy(dtype=bool)],
+                                   ['new', 'lapsed', 'moved'], default='changed')
+    return df_diffs
+
+@benchmark("renames", rows=20_000, rate=0.05, renames=0.02)
+def renames_setup(workDir: Path, rows: int, rate: float, renames: float):
+    """Pairing lapsed attorneys with new ones under another name."""
+    df1 = synthetic.synthetic_register(rows)
+    df2 = synthetic.churn(df1, rate, renames=renames)
+    diffs = analyser.get_diffs_df(df1, df2)
+    return lambda: analyser.match_renames(diffs)
+
+@benchmark("consolidate", fresh=True, rows=100_000, noise=0.1)
+def consolidate_setup(workDir: Path, rows: int, noise: float):
+    """Working out the canonical name of every firm, with no names remembered from earlier runs."""
+    firms = synthetic.synthetic_register(rows, firmNoise=noise)['Firm']
+    rules = firm_rules.FirmRules.load()
+    return lambda: rules.canonicalise(firms)
+
+@benchmark("consolidate-cached", rows=100_000, noise=0.1)
+def consolidate_cached_setup(workDir: Path, rows: int, noise: float):
+    """Canonicalising firms again, once every name has been seen."""
+    firms = synthetic.synthetic_register(rows, firmNoise=noise)['Firm']
+    rules = firm_rules.FirmRules.load()
+    rules.canonicalise(firms)
+    return lambda: rules.canonicalise(firms)
+
+@benchmark("rank", rows=100_000, noise=0.1)
+def rank_setup(workDir: Path, rows: int, noise: float):
+    """Loading a snapshot and ranking its names and firms, as the rank command does."""
+    csvPath = workDir / "2020-01-01.csv"
+    synthetic.write_csv(synthetic.synthetic_register(rows, firmNoise=noise), csvPath)
+    return lambda: [analyser.rank_data(csvPath, 20, False, False, mode) for mode in ('names', 'firms')]
+
+@benchmark("filter", rows=100_000)
+def filter_setup(workDir: Path, rows: int):
+    """Loading a snapshot's columnar copy and filtering it by registration type, as every --pat or --tm load does."""
+    from ttipabot import store
+    csvPath = workDir / "2020-01-01.csv"
+    synthetic.write_csv(synthetic.synthetic_register(rows), csvPath)
+    store.write_columnar(csvPath)
+    columns = analyser.masked(analyser.COMPARE_COLUMNS, True, True)
+    return lambda: [analyser.filter_attorneys(analyser.csv_to_df(csvPath, columns), pat, tm)
+                    for pat, tm in [(True, False), (False, True), (True, True)]]
+
+@benchmark("render", rows=100_000)
+def render_setup(workDir: Path, rows: int):
+    """Writing a whole register out as markdown, NDJSON and CSV, as a full export does."""
+    import io
+    from ttipabot import writers
+    df = synthetic.synthetic_register(rows)
+    df.index += 1
+    return lambda: [writers.write(df, io.StringIO(), format) for format in ('markdown', 'ndjson', 'csv')]
+
+@benchmark("clean", fresh=True, snapshots=100, rows=2000)
+def clean_setup(workDir: Path, snapshots: int, rows: int):
+    """Hashing an archive and mapping repeated snapshots onto earlier ones, with no hashes recorded yet."""
+    template = workDir / "template"
+    if not template.exists():
+        template.mkdir()
+        synthetic.snapshot_archive(template, snapshots, rows)
+    archive = synthetic.copy_archive(template, workDir / f"archive{time.perf_counter_ns()}")
+    return lambda: scraper.clean_csvs(False, archive)
+
+HEAVY_MODULES = ['pandas', 'numpy', 'pyarrow', 'requests', 'bs4', 'lxml']
+
+PROBE = """
+import sys, time
+start = time.perf_counter()
+sys.argv = ['ttipabot'] + sys.argv[1:]
+from ttipabot.cli import cli
+try:
+    cli()
+except SystemExit:
+    pass
+heavy = [module for module in {heavy!r} if module in sys.modules]
+print(time.perf_counter() - start, ','.join(heavy), file=sys.stderr)
+"""
+
+def startup_setup(args: list[str]):
+    """Starting the CLI against a large archive, timed inside the process so interpreter start up doesn't count.
+    None of these commands should import a heavy module."""
+    def setup(workDir: Path, snapshots: int):
+        archive = workDir / "archive"
+        if not archive.exists():
+            archive.mkdir()
+            synthetic.dated_archive(archive, snapshots)
+        env = {**os.environ, "TTIPABOT_SCRAPES": str(archive)}
+        def run() -> float:
+            result = subprocess.run([sys.executable, "-c", PROBE.format(heavy=HEAVY_MODULES), *args],
+                                    env=env, capture_output=True, text=True, check=True)
+            seconds, _, heavy = result.stderr.strip().splitlines()[-1].partition(' ')
+            assert not heavy, f"'ttipabot {' '.join(args)}' imported {heavy}"
+            return float(seconds)
+        return run
+    return setup
+
+for name, args in {"startup-help": ['--help'], "startup-dates": ['dates', '-n', '5'],
+                   "startup-chained": ['dates', '-n', '5', 'scrape', '--help']}.items():
+    benchmark(name, snapshots=5000)(startup_setup(args))
+
+def time_benchmark(bench: Benchmark, workDir: Path, repeat: int, scale: float) -> dict:
+    """Returns the best and median time of <repeat> runs, after a warm up run."""
+    params = {key: max(int(value * scale), 1) if isinstance(value, int) else value for key, value in bench.params.items()}
+    times = []
+    work = None
+    for i in range(repeat + 1):
+        if work is None or bench.fresh:
+            work = bench.setup(workDir, **params)
+        start = time.perf_counter()
+        seconds = work()
+        elapsed = time.perf_counter() - start
+        # The first run warms caches and imports
+        if i:
+            times.append(seconds if isinstance(seconds, float) else elapsed)
+    return {"params": params, "best": min(times), "median": statistics.median(times)}
+
+def machine() -> dict:
+    return {"python": platform.python_version(), "pandas": pd.__version__, "platform": platform.platform(),
+            "processor": platform.machine(), "cpus": os.cpu_count()}
+
+def read_baseline(path: Path) -> dict:
+    if not path.exists():
+        return {}
+    with path.open('r', encoding="utf-8") as f:
+        return json.load(f)
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("names", nargs="*", help=f"benchmarks to run, out of {', '.join(BENCHMARKS)} (default all)")
+    parser.add_argument("--quick", action="store_true", help="run at a tenth of the size, for a fast check")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs of each benchmark")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="slowdown over the baseline flagged as a regression")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH, help="baseline file to compare with")
+    parser.add_argument("--save", action="store_true", help="record these results in the baseline file")
+    options = parser.parse_args()
+    unknown = [name for name in options.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark {', '.join(unknown)}")
+
+    baseline = read_baseline(options.baseline)
+    if baseline and baseline.get("machine") != machine():
+        print(f"Baseline was recorded on another machine ({baseline['machine']['platform']}, "
+              f"{baseline['machine']['cpus']} cpus), so differences may not be regressions", file=sys.stderr)
+    recorded = baseline.get("results", {})
+    results = {}
+    regressions = []
+    print(f"{'Benchmark':<20} {'Best (ms)':>10} {'Median (ms)':>12} {'Baseline (ms)':>14} {'Change':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in options.names or BENCHMARKS:
+            workDir = Path(tmp) / name
+            workDir.mkdir()
+            result = time_benchmark(BENCHMARKS[name], workDir, options.repeat, 0.1 if options.quick else 1)
+            results[name] = result
+            previous = recorded.get(name)
+            # Results are only comparable at the same sizes
+            if previous is not None and previous["params"] == result["params"]:
+                change = result["best"] / previous["best"] - 1
+                flag = "  REGRESSION" if change > options.tolerance else ""
+                if flag:
+                    regressions.append(name)
+                comparison = f"{previous['best'] * 1000:>14.1f} {change:>+7.0%}{flag}"
+            else:
+                comparison = f"{'-':>14} {'-':>8}"
+            print(f"{name:<20} {result['best'] * 1000:>10.1f} {result['median'] * 1000:>12.1f} {comparison}", flush=True)
+
+    if options.save:
+        results = {**recorded, **results} if baseline.get("machine") == machine() else results
+        with options.baseline.open('w', encoding="utf-8") as f:
+            json.dump({"machine": machine(), "recorded": time.strftime("%Y-%m-%d"),
+                       "results": {name: {**result, "best": round(result["best"], 6), "median": round(result["median"], 6)}
+                                   for name, result in results.items()}}, f, indent=2)
+            f.write("\n")
+        print(f"Saved results to {options.baseline}")
+    if regressions:
+        print(f"{len(regressions)} regressed beyond {options.tolerance:.0%}: {', '.join(regressions)}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
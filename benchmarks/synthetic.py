@@ -0,0 +1,230 @@
+"""Synthetic registers for the benchmarks: snapshots as dataframes, the register response the scraper downloads,
+and archives of dated csvs, each with configurable size, churn between snapshots and noise in how firms are spelt."""
+import html
+import json
+import shutil
+from datetime import date, timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+COLUMNS = ['Name', 'Phone', 'Email', 'Firm', 'Address', 'Registered as']
+
+FIRST_NAMES = ["James", "Sarah", "Michael", "Emma", "David", "Olivia", "Daniel", "Chloe", "Andrew", "Jessica",
+               "Matthew", "Hannah", "Peter", "Grace", "Thomas", "Rebecca", "Benjamin", "Lauren", "Nicholas", "Amy",
+               "Christopher", "Rachel", "Mark", "Sophie", "Samuel", "Kate", "Richard", "Megan", "Paul", "Alice",
+               "Wei", "Mei", "Rohan", "Priya", "Hiroshi", "Yuki", "Mohammed", "Fatima", "Liam", "Aroha"]
+MIDDLE_NAMES = ["John", "Anne", "Robert", "Louise", "William", "Marie", "Edward", "Jane", "George", "Elizabeth",
+                "Charles", "Rose", "Henry", "May", "Joseph", "Claire", "Arthur", "Kim", "Lee", "Jean"]
+SURNAMES = ["Smith", "Jones", "Williams", "Brown", "Wilson", "Taylor", "Johnson", "White", "Martin", "Anderson",
+            "Thompson", "Nguyen", "Thomas", "Walker", "Harris", "Lee", "Ryan", "Robinson", "Kelly", "King",
+            "Davis", "Wright", "Evans", "Roberts", "Green", "Hall", "Wood", "Jackson", "Clarke", "Patel",
+            "Khan", "Lewis", "James", "Phillips", "Singh", "Mitchell", "O'Brien", "Campbell", "Murphy", "Chen",
+            "Wang", "Li", "Zhang", "Kim", "Tanaka", "Sato", "Ngata", "Parata", "MacDonald", "McKenzie",
+            "Fitzpatrick", "Hughes", "Edwards", "Collins", "Stewart", "Morris", "Turner", "Cooper", "Ward", "Baker",
+            "Scott", "Young", "Adams", "Hill", "Bell", "Allen", "Graham", "Morgan", "Cook", "Price",
+            "Bennett", "Gray", "Russell", "Marshall", "Ross", "Wallace", "Hamilton", "Hunt", "Ellis", "Shaw"]
+STREETS = ["Collins", "George", "Queen", "Elizabeth", "Pitt", "King", "William", "Hay", "Adelaide", "Murray",
+           "Flinders", "Bourke", "Lambton", "Victoria", "Albert", "Market", "Clarence", "Kent", "Macquarie", "Wakefield"]
+LOCALITIES = [("Melbourne", "VIC", 3000), ("Sydney", "NSW", 2000), ("Brisbane", "QLD", 4000), ("Perth", "WA", 6000),
+              ("Adelaide", "SA", 5000), ("Canberra", "ACT", 2600), ("Hobart", "TAS", 7000), ("Parramatta", "NSW", 2150),
+              ("Southbank", "VIC", 3006), ("Auckland", "", 1010), ("Wellington", "", 6011), ("Christchurch", "", 8011)]
+# A few large firms, as on the real register, named so the consolidation rules have something to do
+LARGE_FIRMS = ["Spruson & Ferguson", "Griffith Hack", "Davies Collison Cave", "Wrays", "Phillips Ormonde Fitzpatrick",
+               "Pizzeys", "FPA Patent Attorneys", "Shelston IP", "AJ Park", "Baldwins Intellectual Property"]
+SUFFIXES = [" Pty Ltd", " Pty. Ltd.", " Limited", " Pty Ltd Patent & Trade Mark Attorneys", ""]
+WEBMAIL = ["gmail.com", "outlook.com", "bigpond.com", "xtra.co.nz"]
+REGISTRATIONS = np.array(["Patents", "Trade marks", "Patents, Trade marks"])
+REGISTRATION_WEIGHTS = [0.45, 0.35, 0.2]
+
+def names(count: int, start: int = 0, rng: np.random.Generator = None) -> list[str]:
+    """Returns <count> distinct full names, numbered from <start> so separate calls don't collide."""
+    rng = rng or np.random.default_rng(start)
+    combinations = len(FIRST_NAMES) * len(MIDDLE_NAMES) * len(SURNAMES)
+    result = []
+    for i in range(start, start + count):
+        first = FIRST_NAMES[i % len(FIRST_NAMES)]
+        middle = MIDDLE_NAMES[(i // len(FIRST_NAMES)) % len(MIDDLE_NAMES)]
+        surname = SURNAMES[(i // (len(FIRST_NAMES) * len(MIDDLE_NAMES))) % len(SURNAMES)]
+        # Beyond every combination, number the repeats like a second given name would distinguish them
+        repeat = i // combinations
+        result.append(f"{first} {middle} {surname}" + (f" {repeat + 1}" if repeat else ""))
+    return [result[i] for i in rng.permutation(count)]
+
+def firm_pool(rows: int) -> tuple[list[str], np.ndarray]:
+    """Returns firm names for a register of <rows> attorneys, and the chance of an attorney being at each.
+    Firm sizes fall away like the real register's, from a few firms of hundreds to many sole practices."""
+    smallFirms = [f"{SURNAMES[i % len(SURNAMES)]} {['IP', 'Patents', 'Lawyers', 'Intellectual Property'][i % 4]}"
+                  + (f" {i // len(SURNAMES) + 1}" if i >= len(SURNAMES) else "") for i in range(max(rows // 8, 10))]
+    firms = LARGE_FIRMS + smallFirms
+    weights = 1 / np.arange(1, len(firms) + 1) ** 0.9
+    return firms, weights / weights.sum()
+
+def misspell(firm: str, rng: np.random.Generator) -> str:
+    """Returns one of the ways <firm> might be entered differently on the register."""
+    kind = rng.integers(5)
+    if kind == 0:
+        return firm.upper()
+    if kind == 1:
+        return firm + str(rng.choice(SUFFIXES[:-1]))
+    if kind == 2:
+        return firm.replace(" & ", " and ")
+    if kind == 3:
+        return firm + ","
+    # A dropped letter
+    i = int(rng.integers(1, len(firm))) if len(firm) > 1 else 0
+    return firm[:i] + firm[i + 1:]
+
+def domain(firm: str) -> str:
+    return "".join(c for c in firm.lower() if c.isalnum())[:16] + ".com.au"
+
+def synthetic_register(rows: int, seed: int = 0, firmNoise: float = 0.0, blankFirms: float = 0.15,
+                       nameStart: int = 0) -> pd.DataFrame:
+    """Makes a register of <rows> attorneys with realistic column repetition. Each firm is written one canonical way,
+    except for a <firmNoise> share of attorneys whose firm is spelt some other way, and <blankFirms> have no firm."""
+    rng = np.random.default_rng(seed)
+    firms, weights = firm_pool(rows)
+    firmChoice = rng.choice(len(firms), rows, p=weights)
+    suffixes = {firm: SUFFIXES[i % len(SUFFIXES)] for i, firm in enumerate(firms)}
+    firmNames = [firms[i] + suffixes[firms[i]] for i in firmChoice]
+    for i in np.flatnonzero(rng.random(rows) < firmNoise):
+        # The register never shows surrounding spaces
+        firmNames[i] = misspell(firmNames[i], rng).strip()
+    blank = rng.random(rows) < blankFirms
+    firmNames = ["" if isBlank else firm for firm, isBlank in zip(firmNames, blank)]
+
+    attorneyNames = names(rows, nameStart, rng)
+    emails = []
+    for name, firmIndex, isBlank in zip(attorneyNames, firmChoice, blank):
+        first, middle, *rest = name.lower().replace("'", "").split()
+        local = ".".join([first, middle[0], *rest])
+        emails.append(f"{local}@{WEBMAIL[firmIndex % len(WEBMAIL)] if isBlank else domain(firms[firmIndex])}")
+    # Attorneys at a firm mostly share its switchboard and address
+    firmPhones = rng.integers(20000000, 99999999, len(firms))
+    firmAddresses = rng.integers(1, 400, len(firms))
+    ownPhone = blank | (rng.random(rows) < 0.3)
+    phones = np.where(ownPhone, rng.integers(20000000, 99999999, rows), firmPhones[firmChoice])
+    numbers = np.where(blank, rng.integers(1, 400, rows), firmAddresses[firmChoice])
+    localities = (firmChoice + blank * rng.integers(0, len(LOCALITIES), rows)) % len(LOCALITIES)
+    addresses = [f"Level {number % 40 + 1} {number} {STREETS[(number + place) % len(STREETS)]} Street "
+                 f"{LOCALITIES[place][0]} {LOCALITIES[place][1]} {LOCALITIES[place][2]} "
+                 f"{'New Zealand' if not LOCALITIES[place][1] else 'Australia'}".replace("  ", " ")
+                 for number, place in zip(numbers, localities)]
+    area = {0: "03", 1: "02", 2: "07", 3: "08", 4: "08", 5: "02", 6: "03", 7: "02", 8: "03", 9: "+64 9", 10: "+64 4", 11: "+64 3"}
+    phoneText = [f"{area[place]} {str(phone)[:4]} {str(phone)[4:]}" for phone, place in zip(phones, localities)]
+    # Some attorneys list no contact details
+    phoneText = np.where(rng.random(rows) < 0.05, "", phoneText)
+    emails = np.where(rng.random(rows) < 0.05, "", emails)
+
+    df = pd.DataFrame({
+        'Name': attorneyNames,
+        'Phone': phoneText,
+        'Email': emails,
+        'Firm': firmNames,
+        'Address': addresses,
+        'Registered as': rng.choice(REGISTRATIONS, rows, p=REGISTRATION_WEIGHTS),
+    })
+    return df.astype('string')
+
+def churn(df: pd.DataFrame, rate: float, seed: int = 1, renames: float = 0.0, firmNoise: float = 0.0) -> pd.DataFrame:
+    """Returns a later snapshot with a <rate> share of attorneys lapsed, the same share moved to another firm and
+    the same number newly registered. A <renames> share of attorneys change surname but keep their contact details."""
+    rng = np.random.default_rng(seed)
+    changes = int(len(df) * rate)
+    df = df.drop(rng.choice(len(df), changes, replace=False)).reset_index(drop=True)
+    moved = rng.choice(len(df), changes, replace=False)
+    df.loc[moved, 'Firm'] = rng.choice(df['Firm'].unique(), changes)
+    renamed = rng.choice(len(df), int(len(df) * renames), replace=False)
+    df.loc[renamed, 'Name'] = [name.rsplit(" ", 1)[0] + " " + SURNAMES[(seed + i) % len(SURNAMES)] + "-Renamed"
+                               for i, name in zip(renamed, df.loc[renamed, 'Name'])]
+    new = synthetic_register(changes, seed, firmNoise, nameStart=len(df) + 1_000_000 + seed * changes)
+    return pd.concat([df, new], ignore_index=True).sample(frac=1, random_state=seed).reset_index(drop=True)
+
+ATTORNEY_HTML = ('      <div class="list-item attorney">      <div class="block">        <span> Attorney </span>'
+                 '        <h4>{name}</h4>      </div>      <div class="contact block">{contact}      </div>{firm}'
+                 '{address}{registered}          </div>  ')
+CONTACT_HTML = ('                  <div class="block-{n}">            <span> {label} </span>            <span>'
+                '              <a href="{scheme}:{value}" class="btn btn-secondary btn-textOnly">{value}</a>'
+                '            </span>          </div>')
+FIRM_HTML = '              <div class="block">          <span> Firm </span><span> {firm} </span>        </div>'
+ADDRESS_HTML = ('                    <div class="block">          <span> Address </span><span>'
+                '            {address}          </span>        </div>')
+TAG_HTML = '                               <span class="ipr-tag ipr-{code}">{registration}</span>'
+REGISTERED_HTML = ('                     <div class="block">          <span> Registered as</span>          <div class="tags">'
+                   '{tags}                      </div>        </div>')
+FIRM_LISTING_HTML = ('    <div class="list-item firm">      <div class="block">        <span> Firm </span>'
+                     '        <h4>{firm}</h4>      </div>      <div class="contact block">      </div>    </div>    ')
+BLANK_HTML = ('      <div class="list-item attorney">      <div class="block">        <span> Attorney </span>'
+              '        <h4></h4>      </div>      <div class="contact block">                              </div>'
+              '                      </div>  ')
+
+def attorney_html(name: str, phone: str, email: str, firm: str, address: str, registered: str) -> str:
+    escape = lambda value: html.escape(value, quote=False)
+    contact = ""
+    if phone:
+        contact += CONTACT_HTML.format(n=1, label="Phone", scheme="tel", value=escape(phone))
+    if email:
+        contact += CONTACT_HTML.format(n=2, label="Email", scheme="mailto", value=escape(email))
+    tags = "".join(TAG_HTML.format(code="P" if registration == "Patents" else "TM", registration=registration)
+                   for registration in registered.split(", ") if registration)
+    return ATTORNEY_HTML.format(name=escape(name), contact=contact,
+                                firm=FIRM_HTML.format(firm=escape(firm)) if firm else "",
+                                address=ADDRESS_HTML.format(address=escape(address)) if address else "",
+                                registered=REGISTERED_HTML.format(tags=tags) if tags else "")
+
+def register_response(df: pd.DataFrame, firmListings: float = 0.3, blanks: float = 0.01, seed: int = 0) -> bytes:
+    """Returns the body the register sends for the attorneys in <df>: JSON results holding escaped HTML, with line
+    breaks in the markup, interleaved with firm listings and blank attorney entries the scraper must skip."""
+    rng = np.random.default_rng(seed)
+    results = []
+    firms = [firm for firm in df['Firm'].unique() if firm]
+    for row in df.itertuples(index=False):
+        if firms and rng.random() < firmListings:
+            results.append(FIRM_LISTING_HTML.format(firm=html.escape(str(rng.choice(firms)), quote=False)))
+        if rng.random() < blanks:
+            results.append(BLANK_HTML)
+        results.append(attorney_html(*row))
+    results = [{"Id": f"{i:08x}-0000-0000-0000-000000000000", "Language": "en", "Name": None,
+                "Html": result.replace("      <div class=", "\r\n      <div class=")} for i, result in enumerate(results)]
+    body = {"TotalTime": 0, "CountTime": 0, "QueryTime": 0, "Count": len(results), "Results": results}
+    return json.dumps(body, ensure_ascii=False).encode("utf-8")
+
+def clean_html(response: bytes) -> str:
+    """Returns a register response as get_register_html leaves it, with escaped control characters removed."""
+    return response.decode("utf-8").replace("\\r", "").replace("\\n", "").replace("\\", "")
+
+def write_csv(df: pd.DataFrame, path: Path) -> None:
+    df.to_csv(path, index=False)
+
+def snapshot_archive(dirPath: Path, snapshots: int, rows: int, rate: float = 0.005, repeats: float = 0.5,
+                     seed: int = 0) -> list[str]:
+    """Fills <dirPath> with <snapshots> weekly csvs of a register of <rows> attorneys, returning their dates.
+    A <repeats> share of scrapes find the register unchanged since the previous one, and the rest find <rate> churn."""
+    rng = np.random.default_rng(seed)
+    df = synthetic_register(rows, seed)
+    day = date(2020, 1, 1)
+    dates = []
+    for i in range(snapshots):
+        if i and rng.random() >= repeats:
+            df = churn(df, rate, seed + i)
+        write_csv(df, dirPath / f"{day.isoformat()}.csv")
+        dates.append(day.isoformat())
+        day += timedelta(weeks=1)
+    return dates
+
+def copy_archive(source: Path, dirPath: Path) -> Path:
+    shutil.copytree(source, dirPath, dirs_exist_ok=True)
+    return dirPath
+
+def dated_archive(dirPath: Path, snapshots: int) -> None:
+    """Fills <dirPath> with <snapshots> single attorney csvs, and a date table mapping every other day to one of them.
+    Cheap to write in any number, for timing what the CLI does with a large archive before it reads any snapshot."""
+    header = ",".join(COLUMNS) + "\n"
+    day = date(2000, 1, 1)
+    with (dirPath / "date_table.txt").open('w') as table:
+        for i in range(snapshots):
+            (dirPath / f"{day.isoformat()}.csv").write_text(header + f"Attorney {i},,,,,Patents\n")
+            substitute = day + timedelta(days=1)
+            table.write(f"{substitute.isoformat()} : {day.isoformat()}\n")
+            day += timedelta(days=2)
@@ -1 +1,9 @@
-from .api import scrape_register, get_dates, get_latest_date, count_dates, compare_data, rank_data, cleanup
\ No newline at end of file
+# The api is imported on first use rather than with the package, so that cli startup only pays for
+# the modules a command actually needs
+__all__ = ["scrape_register", "get_dates", "get_latest_date", "count_dates", "resolve_dates", "compare_data", "compare_data_modes", "compare_views", "write_comparison", "consecutive_pairs", "batch_compare", "CompareContext", "rank_data", "timeline_data", "history_data", "firm_history_data", "cleanup", "migrate", "pack"]
+
+def __getattr__(name: str):
+    if name in __all__:
+        from ttipabot import api
+        return getattr(api, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,61 +1,166 @@
 import datetime
+import sys
 from pathlib import Path
+import numpy as np
 import pandas as pd
 from typing import NamedTuple, Iterable
 
+from ttipabot import store, deltas, firm_rules, identity, profiling, registrations
+
+# Columns each analysis needs, so snapshots can be loaded without the rest
+COMPARE_COLUMNS = ['Name', 'Firm', 'Registered as']
+# Matching renamed attorneys also needs their contact details
+IDENTITY_COLUMNS = COMPARE_COLUMNS + ['Email', 'Phone']
+RANK_COLUMNS = {'names': ['Name', 'Registered as'], 'firms': ['Firm', 'Registered as']}
+
+def masked(columns: list[str], pat: bool, tm: bool) -> list[str]:
+    """Returns <columns> along with the registration mask if attorneys are to be filtered by it."""
+    return columns + [registrations.MASK_COLUMN] if pat or tm else columns
+
 def compare_data(csv1: Path, csv2: Path, pat: bool, tm: bool, mode: str = 'registrations') -> pd.DataFrame:    
     """Returns a dataframe with comparison data from to csv filepaths."""
-    df1, df2 = csvs_to_dfs([csv1, csv2])
+    return compare_data_modes(csv1, csv2, pat, tm, [mode])[mode]
+
+def compare_data_modes(csv1: Path, csv2: Path, pat: bool, tm: bool, modes: Iterable[str], identify: bool = False) -> dict[str, pd.DataFrame]:
+    """Returns a dataframe for each comparison mode, all projected from a single diff of the two csvs.
+    With <identify>, renamed attorneys are matched up rather than reported as a lapse and a registration."""
+    df1, df2 = csvs_to_dfs([csv1, csv2], masked(IDENTITY_COLUMNS if identify else COMPARE_COLUMNS, pat, tm))
+    return project_diffs(diff_dfs(df1, df2, pat, tm, identify), modes)
+
+def diff_dfs(df1: pd.DataFrame, df2: pd.DataFrame, pat: bool, tm: bool, identify: bool = False) -> pd.DataFrame:
+    """Filters two snapshots down to the attorneys of interest and diffs them."""
     # Filter out attorneys not of interest before performing comparisons
-    df1 = filter_attorneys(df1, pat, tm)
-    df2 = filter_attorneys(df2, pat, tm)
-    diffs_df = get_diffs_df(df1, df2)
-    
-    if mode == 'registrations':
-        return get_new_attorneys_df(diffs_df)
-    elif mode == 'movements':
-        return get_firmChanges_df(diffs_df)
-    elif mode == 'lapses':
-        return get_lapsed_df(diffs_df)
-    raise ValueError("Invalid comparison mode.")
+    with profiling.stage("filter"):
+        df1 = filter_attorneys(df1, pat, tm)
+        df2 = filter_attorneys(df2, pat, tm)
+    with profiling.stage("diff") as stage:
+        df_diffs = get_diffs_df(df1, df2)
+        if identify:
+            df_diffs = match_renames(df_diffs)
+        stage.rows = len(df_diffs)
+    return df_diffs
+
+def project_diffs(diffs_df: pd.DataFrame, modes: Iterable[str]) -> dict[str, pd.DataFrame]:
+    """Returns the view of a diff for each comparison mode."""
+    if any(mode not in COMPARE_MODES for mode in modes):
+        raise ValueError("Invalid comparison mode.")
+    return {mode: COMPARE_MODES[mode](diffs_df) for mode in modes}
 
 def rank_data(csv: Path, num: int, pat: bool, tm: bool, mode: str = 'names'):
-    df = csv_to_df(csv)
+    columns = RANK_COLUMNS.get(mode)
+    return rank_df(csv_to_df(csv, masked(columns, pat, tm) if columns else None), num, pat, tm, mode)
+
+def rank_df(df: pd.DataFrame, num: int, pat: bool, tm: bool, mode: str = 'names'):
+    """Ranks the attorneys of an already loaded snapshot, which gains a column when ranking names."""
     # Filter out attorneys not of interest before performing comparisons
-    df = filter_attorneys(df, pat, tm)
+    with profiling.stage("filter"):
+        df = filter_attorneys(df, pat, tm)
     
-    if mode == 'names':
-        return name_rank_df(df, num)[['Name', 'Length']]
-    elif mode == 'firms':
-        return firm_rank_df(df, num)[['Firm', 'Attorneys']]
+    with profiling.stage("rank"):
+        if mode == 'names':
+            return name_rank_df(df, num)[['Name', 'Length']]
+        elif mode == 'firms':
+            return firm_rank_df(df, num)[['Firm', 'Attorneys']]
     raise ValueError("Invalid ranking mode.")
 
-def csv_to_df(csvPath: Path) -> pd.DataFrame:
-    """Converts a csv to a dataframe"""
-    return pd.read_csv(csvPath, dtype='string').fillna('')
+def csv_to_df(csvPath: Path, columns: list[str] = None, compact: bool = False) -> pd.DataFrame:
+    """Converts a csv to a dataframe, optionally of only some <columns>, using a columnar copy if available.
+    Snapshots stored as deltas are reconstructed from the nearest full csv.
+    A <compact> frame holds its repetitive columns as categoricals, for keeping many snapshots in memory."""
+    with profiling.stage("load") as stage:
+        if deltas.is_delta(csvPath):
+            df = deltas.read_delta(csvPath, columns)
+        else:
+            df = store.read_snapshot(csvPath, columns)
+        stage.rows = len(df)
+        return store.compact_frame(df) if compact else df
 
-def csvs_to_dfs(datePaths: list[Path]) -> list[pd.DataFrame]:
+def csvs_to_dfs(datePaths: list[Path], columns: list[str] = None) -> list[pd.DataFrame]:
     """Returns a list of dataframes from a list of filepaths to csvs."""
     #Read the CSV data into dataframes
-    return [csv_to_df(datePath) for datePath in datePaths]
+    return [csv_to_df(datePath, columns) for datePath in datePaths]
 
 def get_diffs_df(df_date1: pd.DataFrame, df_date2: pd.DataFrame) -> pd.DataFrame:
-    """Return a dataframe showing all the differences in data between two input dataframes."""
-    # Merge the dataframes so that differences can be compared
-    df_diff = pd.merge(df_date1, df_date2, how="outer", indicator="Exist")
+    """Return a dataframe showing all the differences in data between two input dataframes.
+    Rows are matched by name in a single keyed join, and the Change column classifies each
+    as 'new', 'lapsed', 'moved' or 'changed' (same firm, other details differ)."""
+    df_date2 = df_date2[list(df_date1.columns)]
+    unchanged1, unchanged2 = get_unchanged_masks(df_date1, df_date2)
+
+    # Separate rows that have changed into a pair of dataframes, as plain strings even from compact frames
+    df_left = store.expand_frame(df_date1[~unchanged1])
+    df_right = store.expand_frame(df_date2[~unchanged2])
+
+    # Outer joins come back sorted by name
+    df_diffs = pd.merge(df_left, df_right, on='Name', how="outer", indicator="NameExist")
+    nameExist = df_diffs['NameExist'].to_numpy()
+    # Firms are compared in canonical form, so a change in how a firm is spelt isn't taken for a move
+    firmChanged = (firm_rules.canonicalise(df_diffs['Firm_x']) != firm_rules.canonicalise(df_diffs['Firm_y'])).fillna(False).to_numpy(dtype=bool)
+    df_diffs['Change'] = np.select([nameExist == 'right_only', nameExist == 'left_only', firmChanged],
+                                   ['new', 'lapsed', 'moved'], default='changed')
+    return df_diffs
 
-    # Query which rows are different
-    df_diff = df_diff.query("Exist != 'both'")
+def match_renames(df_diffs: pd.DataFrame) -> pd.DataFrame:
+    """Merges each lapsed attorney that looks like a newly registered one under another name into a single 'renamed' row,
+    under the new name with the old one as Former name. Needs diffs of snapshots with Email and Phone columns."""
+    lapsed = df_diffs[df_diffs['Change'] == 'lapsed']
+    new = df_diffs[df_diffs['Change'] == 'new']
+    left = lapsed[['Name', 'Firm_x', 'Email_x', 'Phone_x']].set_axis(['Name', 'Firm', 'Email', 'Phone'], axis=1)
+    right = new[['Name', 'Firm_y', 'Email_y', 'Phone_y']].set_axis(['Name', 'Firm', 'Email', 'Phone'], axis=1)
+    pairs = identity.find_renames(left, right)
+    df_diffs = df_diffs.assign(**{'Former name': pd.Series(pd.NA, index=df_diffs.index, dtype='string')})
+    if not pairs:
+        return df_diffs
+    leftRows = lapsed.index[[i for i, _ in pairs]]
+    rightRows = new.index[[j for _, j in pairs]]
+    oldColumns = [column for column in df_diffs.columns if column.endswith('_x')]
+    df_diffs.loc[rightRows, oldColumns] = df_diffs.loc[leftRows, oldColumns].to_numpy()
+    df_diffs.loc[rightRows, 'Former name'] = df_diffs.loc[leftRows, 'Name'].to_numpy()
+    df_diffs.loc[rightRows, 'Change'] = 'renamed'
+    return df_diffs.drop(index=leftRows)
 
-    # Separate rows that have changed into a pair of dataframes
-    df_left = df_diff.query("Exist == 'left_only'").sort_values(by = 'Name')
-    df_right = df_diff.query("Exist == 'right_only'").sort_values(by = 'Name')
+def get_unchanged_masks(df_date1: pd.DataFrame, df_date2: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
+    """Returns masks of the rows in each dataframe that appear identically in the other."""
+    # Factorize names from both dates together so the codes act as a shared join key
+    codes, _ = pd.factorize(pd.concat([df_date1['Name'], df_date2['Name']], ignore_index=True))
+    codes1, codes2 = codes[:len(df_date1)], codes[len(df_date1):]
+    counts1 = np.bincount(codes1, minlength=codes.max() + 1 if len(codes) else 0)
+    counts2 = np.bincount(codes2, minlength=len(counts1))
 
-    return pd.merge(df_left, df_right, on='Name', how="outer", indicator="NameExist")
+    # Names appearing once on each side can be compared directly, row against row
+    single = (counts1 == 1) & (counts2 == 1)
+    rows2 = np.full(len(counts1), -1)
+    rows2[codes2] = np.arange(len(codes2))
+    rows1 = np.flatnonzero(single[codes1])
+    rows2 = rows2[codes1[rows1]]
+    same = np.ones(len(rows1), dtype=bool)
+    for column in df_date1.columns:
+        same &= columns_equal(df_date1[column].array.take(rows1), df_date2[column].array.take(rows2))
+    unchanged1 = np.zeros(len(df_date1), dtype=bool)
+    unchanged2 = np.zeros(len(df_date2), dtype=bool)
+    unchanged1[rows1[same]] = True
+    unchanged2[rows2[same]] = True
+
+    # Repeated names fall back to matching whole rows by hash
+    repeated1 = ~single[codes1] & (counts2[codes1] > 0)
+    repeated2 = ~single[codes2] & (counts1[codes2] > 0)
+    if repeated1.any() and repeated2.any():
+        hashes1 = pd.util.hash_pandas_object(df_date1[repeated1], index=False)
+        hashes2 = pd.util.hash_pandas_object(df_date2[repeated2], index=False)
+        unchanged1[np.flatnonzero(repeated1)] = hashes1.isin(hashes2).to_numpy()
+        unchanged2[np.flatnonzero(repeated2)] = hashes2.isin(hashes1).to_numpy()
+    return unchanged1, unchanged2
+
+def columns_equal(values1, values2) -> np.ndarray:
+    """Elementwise equality of two equal length column arrays, in their native representation where possible."""
+    if isinstance(values1, pd.Categorical) or isinstance(values2, pd.Categorical):
+        # Categoricals only compare directly when their categories match
+        values1, values2 = np.asarray(values1, dtype=object), np.asarray(values2, dtype=object)
+    return pd.array(values1 == values2).fillna(False).to_numpy(dtype=bool)
 
 def get_new_attorneys_df(df_diffs: pd.DataFrame) -> pd.DataFrame:
     # TODO: Consider doing a comparison of registrations and capturing those going from single to dual registered
-    df_newAttorneys = df_diffs.query("NameExist == 'right_only'")
+    df_newAttorneys = df_diffs[df_diffs['Change'] == 'new']
     # Prep the needed data, replace missing values with empty strings to assist comparisons later on
     df_newAttorneys = df_newAttorneys[['Name', 'Firm_y', 'Registered as_y']].fillna('')
     # Reformat for readability
@@ -64,21 +169,33 @@ def get_new_attorneys_df(df_diffs: pd.DataFrame) -> pd.DataFrame:
     return df_newAttorneys
 
 def get_firmChanges_df(df_diffs: pd.DataFrame) -> pd.DataFrame:
-    df_changedDetails = df_diffs.query("NameExist == 'both'")
-    # TODO - name change detect logic?
-    df_changedFirms = df_changedDetails.query("Firm_x != Firm_y")
+    df_changedFirms = df_diffs[df_diffs['Change'] == 'moved']
     df_changedFirms = df_changedFirms[['Name', 'Firm_x', 'Firm_y']].fillna('')
     df_changedFirms = df_changedFirms.rename(columns={"Firm_x": "Old firm", "Firm_y": "New firm"}).reset_index(drop=True)
     df_changedFirms.index += 1
     return df_changedFirms
 
 def get_lapsed_df(df_diffs: pd.DataFrame):
-    df_lapsedAttorneys = df_diffs.query("NameExist == 'left_only'")
+    df_lapsedAttorneys = df_diffs[df_diffs['Change'] == 'lapsed']
     df_lapsedAttorneys = df_lapsedAttorneys[['Name', 'Firm_x']].fillna('')
     df_lapsedAttorneys = df_lapsedAttorneys.rename(columns={"Firm_x": "Firm"}).reset_index(drop=True)
     df_lapsedAttorneys.index += 1
     return df_lapsedAttorneys
 
+def get_renamed_df(df_diffs: pd.DataFrame) -> pd.DataFrame:
+    df_renamed = df_diffs[df_diffs['Change'] == 'renamed'].reindex(columns=['Former name', 'Name', 'Firm_x', 'Firm_y'])
+    df_renamed = df_renamed.fillna('').rename(columns={"Firm_x": "Old firm", "Firm_y": "New firm"}).reset_index(drop=True)
+    df_renamed.index += 1
+    return df_renamed
+
+# Projections of a diff for each comparison mode
+COMPARE_MODES = {
+    'registrations': get_new_attorneys_df,
+    'movements': get_firmChanges_df,
+    'lapses': get_lapsed_df,
+    'renames': get_renamed_df,
+}
+
 def name_rank_df(df: pd.DataFrame, num: int) -> pd.DataFrame:
     """Make a dataframe of <num> rows ranked by name length"""
     df['Length'] = df['Name'].apply(lambda col: len(col))
@@ -87,60 +204,30 @@ def name_rank_df(df: pd.DataFrame, num: int) -> pd.DataFrame:
     df.index += 1
     return df.head(num)
 
-def filter_attorneys(df: pd.DataFrame, pat: bool, tm: bool) -> pd.DataFrame:
-    """Filter attorneys based on registration type"""
-    if pat:
-        filter = df['Registered as'].str.contains('Patents')
-        df = df[filter]
-    if tm:
-        filter = df['Registered as'].str.contains('Trade marks')
-        df = df[filter]
-    return df
+def filter_attorneys(df: pd.DataFrame, pat: bool, tm: bool, jurisdiction: str = None, firms: Iterable[str] = ()) -> pd.DataFrame:
+    """Filter attorneys based on registration type, and optionally on the jurisdiction ('AU' or 'NZ') they're based in
+    and the <firms> they're at. Filters combine as bits of the registration mask, which is used if loaded and then dropped."""
+    firms = list(firms)
+    if registrations.MASK_COLUMN in df.columns:
+        mask = df[registrations.MASK_COLUMN].to_numpy()
+        df = df.drop(columns=registrations.MASK_COLUMN)
+    elif pat or tm or jurisdiction is not None:
+        if jurisdiction is not None and 'Address' not in df.columns:
+            raise ValueError("Filtering by jurisdiction needs the registration mask or addresses loaded.")
+        mask = registrations.compute_mask(df)
+    rows = np.ones(len(df), dtype=bool)
+    if pat or tm or jurisdiction is not None:
+        rows &= registrations.select(mask, registrations.required_bits(pat, tm), jurisdiction)
+    if firms:
+        # Firms are matched in canonical form, like in rankings
+        canonical = firm_rules.canonicalise(pd.Series(firms, dtype='string'))
+        rows &= firm_rules.canonicalise(df['Firm']).isin(canonical).fillna(False).to_numpy(dtype=bool)
+    return df if rows.all() else df[rows]
 
 def consolidate_firms(df: pd.DataFrame) -> pd.DataFrame:
     """Apply consolidation rules to account for variation in firm spelling"""
-    
-    # Uppercase everything as initial consolidation
-    df['Firm'] = df['Firm'].str.upper()
-    
-    # Manual consolidation dictionary
-    di = {' AND ':' & ', 
-          'GRIFFTH' : 'GRIFFITH',
-          'INTELLECTUAL PROPERTY OFFICE OF NZ' : 'IPONZ',
-          'INTELLECTUAL PROPERTY OFFICE OF NEW ZEALAND' : 'IPONZ',
-          'ORIGIN IP' : 'ORIGIN',
-          'IP SOLVED ANZ' : 'IP SOLVED (ANZ)',
-          'PATENTS ATTORNEYS' : 'PATENT ATTORNEYS',
-          'FPA PATENTS' : 'FPA PATENT ATTORNEYS',
-          'DAVIES COLLISION' : 'DAVIES COLLISON'
-          }
-    
-    # Firm specific consolidations
-    firms = ['SPRUSON & FERGUSON', 
-             'GRIFFITH HACK',
-             'DAVIES COLLISON CAVE',
-             'WRAYS',
-             'PHILLIPS ORMONDE FITZPATRICK',
-             'PIZZEYS'
-    ]
-    
-    for firm in firms:
-        df.loc[df['Firm'].str.contains(firm), 'Firm'] = firm
-
-    for old, new in di.items():
-        df['Firm'] = df['Firm'].str.replace(old, new)
-
-    #TODO Improve the suffix elimination to better account for variations
-    for suffix in [' LIMITED', ' LTD', ' LTD.', 
-                   ' PTE', ' PTY', ' PTY.',
-                   ' PATENT & TRADE MARK ATTORNEYS', 
-                   ' PATENT & TRADE MARKS ATTORNEYS',
-                   ' PATENT & TRADEMARK ATTORNEYS',
-                   ' PATENT & TRADEMARK ATTORNEY',
-                   ','
-                   ]:
-        df['Firm'] = df['Firm'].str.removesuffix(suffix)
-
+    # The rules live in firm_rules.json, and each distinct name is only consolidated once per run
+    df['Firm'] = firm_rules.canonicalise(df['Firm'])
     return df
 
 def firm_rank_df(df: pd.DataFrame, num: int) -> pd.DataFrame:
@@ -155,6 +242,66 @@ def firm_rank_df(df: pd.DataFrame, num: int) -> pd.DataFrame:
 
     return firm_df.head(num)
 
+def timeline_df(snapshots: Iterable[tuple[str, Path]], pat: bool, tm: bool, firms: Iterable[str] = (), period: str = 'date') -> pd.DataFrame:
+    """Make a dataframe of attorney and firm counts at each snapshot, with the registrations, lapses and moves
+    since the previous one. Each snapshot is loaded once and only diffed against its predecessor.
+    Headcounts for any <firms> are included, and rows can be totalled by 'month' or 'year' <period>."""
+    firms = list(firms)
+    canonical_firms = consolidate_firms(pd.DataFrame({'Firm': firms}, dtype='string'))['Firm'].tolist()
+    rows = []
+    previous_df = None
+    for date, path in snapshots:
+        df = filter_attorneys(csv_to_df(path, masked(COMPARE_COLUMNS, pat, tm)), pat, tm)
+        row = {'Date': date, 'Attorneys': len(df), 'Firms': 0, 'Registrations': 0, 'Lapses': 0, 'Moves': 0}
+        # The first snapshot has nothing to be compared against
+        if previous_df is not None:
+            with profiling.stage("diff"):
+                changes = get_diffs_df(previous_df, df)['Change'].value_counts()
+            row.update(Registrations=changes.get('new', 0), Lapses=changes.get('lapsed', 0), Moves=changes.get('moved', 0))
+        firm_counts = consolidate_firms(df[['Firm']].copy())['Firm'].value_counts()
+        firm_counts = firm_counts[firm_counts.index != ""]
+        row['Firms'] = len(firm_counts)
+        for firm, canonical_firm in zip(firms, canonical_firms):
+            row[firm] = firm_counts.get(canonical_firm, 0)
+        rows.append(row)
+        previous_df = df
+
+    timeline = pd.DataFrame(rows, columns=['Date', 'Attorneys', 'Firms', 'Registrations', 'Lapses', 'Moves'] + firms)
+    timeline.insert(5, 'Net', timeline['Registrations'] - timeline['Lapses'])
+    if period == 'date':
+        return timeline
+    if period not in ('month', 'year'):
+        raise ValueError("Invalid timeline period.")
+    # Changes add up over a period, while headcounts are as at the last snapshot in it
+    key = timeline['Date'].str[:7 if period == 'month' else 4]
+    totals = {column: 'sum' for column in ['Registrations', 'Lapses', 'Net', 'Moves']}
+    lasts = {column: 'last' for column in ['Attorneys', 'Firms'] + firms}
+    timeline = timeline.groupby(key).agg({**lasts, **totals})
+    return timeline.reset_index()[['Date', 'Attorneys', 'Firms', 'Registrations', 'Lapses', 'Net', 'Moves'] + firms]
+
+class Attorney(NamedTuple):
+    """One attorney's register entry, for working with attorneys outside of pandas."""
+    name: str
+    phone: str = ''
+    email: str = ''
+    firm: str = ''
+    address: str = ''
+    registered_as: str = ''
+
+ATTORNEY_COLUMNS = ['Name', 'Phone', 'Email', 'Firm', 'Address', 'Registered as']
+
+def df_to_attorneys(df: pd.DataFrame) -> list[Attorney]:
+    """Converts a dataframe of attorneys to records, sharing one copy of each repeated string between them."""
+    columns = [column for column in ATTORNEY_COLUMNS if column in df.columns]
+    fields = [Attorney._fields[ATTORNEY_COLUMNS.index(column)] for column in columns]
+    values = df[columns].fillna('').itertuples(index=False, name=None)
+    return [Attorney(**dict(zip(fields, map(sys.intern, row)))) for row in values]
+
 def attorneys_df_to_lines(attorneys_df: pd.DataFrame) -> list[str]:
     """Convert a dataframe of attorneys to a list of strings to act as lines for display."""
-    return [f"{attorney.Name}." if attorney.Firm == '' else f"{attorney.Name} of {attorney.Firm}." for attorney in attorneys_df.itertuples()]
\ No newline at end of file
+    # Formatted a column at a time rather than an attorney at a time
+    names = attorneys_df['Name'].astype('string').fillna('')
+    if 'Firm' not in attorneys_df.columns:
+        return (names + ".").tolist()
+    firms = attorneys_df['Firm'].astype('string').fillna('')
+    return (names + (" of " + firms).where(firms != '', '') + ".").tolist()
\ No newline at end of file
@@ -1,20 +1,35 @@
+from __future__ import annotations
+
+import datetime
 import logging
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-import pandas as pd
+from typing import Iterator, TextIO, TYPE_CHECKING
 
 # Custom modules
-from ttipabot import scraper, analyser
+from ttipabot import scraper, store, history, profiling, result_cache, registrations, writers
+
+# pandas and the analyser are imported by the functions that need them, so that commands like
+# listing dates don't pay for them
+if TYPE_CHECKING:
+    import pandas as pd
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(filename='ttipabot.log', encoding='utf-8', format='%(asctime)s %(message)s', level=logging.DEBUG)
 
-def scrape_register() -> bool:
-    """Scrapes the register, parses all the data, and writes it to a csv file."""
-    return scraper.scrape_register()
+def scrape_register(pageSize: int = 0, workers: int = 4) -> bool:
+    """Scrapes the register, parses all the data, and writes it to a csv file.
+    A non-zero <pageSize> splits the scrape into pages fetched by <workers> concurrent threads."""
+    return scraper.scrape_register(pageSize, workers)
 
-def get_dates(num: int, oldest: bool = False, changesOnly: bool = False) -> list[str]:
-    """Gets <num> dates from among those with available scrapes, and pads with blanks up to a date pair."""
-    dates = scraper.get_dates(num, oldest, changesOnly)
+def get_dates(num: int, oldest: bool = False, changesOnly: bool = False, since: str = None, until: str = None) -> list[str]:
+    """Gets <num> dates from among those with available scrapes, and pads with blanks up to a date pair.
+    <since> and <until> limit the dates to a range, and can be ISO or relative dates like '30d' or 'today'."""
+    since = scraper.parse_date_spec(since)[0] if since else None
+    until = scraper.parse_date_spec(until)[0] if until else None
+    dates = scraper.get_dates(num, oldest, changesOnly, since=since, until=until)
     # Blanks to allow cli default calls without errors when there's no scrapes
     if len(dates) < 2 and num <= 2:
         diff = num-len(dates)
@@ -29,32 +44,239 @@ def count_dates(changes_only=False) -> int:
     """Returns the total number of dates available."""
     return scraper.count_dates(changes_only=False)
 
-def compare_data(dates: tuple[str, str], pat: bool, tm: bool, mode: str, json: bool = False) -> str:
+def resolve_dates(dates: list[str], snap: str = None) -> list[str]:
+    """Maps ISO or relative dates onto dates with available scrapes, according to the <snap> mode:
+    exact
+    before
+    after
+    nearest
+    Without a mode, ISO dates must have a scrape and relative dates take the latest scrape on or before."""
+    return scraper.resolve_dates(dates, snap)
+
+class CompareContext:
+    """Snapshots and diffs loaded during one invocation, so chained commands comparing the same dates share them.
+    Cached frames are shared between callers and must not be modified."""
+
+    def __init__(self):
+        self.frames: dict[Path, pd.DataFrame] = {}
+        self.diffs: dict[tuple, pd.DataFrame] = {}
+
+    def load(self, csv: Path, identify: bool = False, masked: bool = False) -> pd.DataFrame:
+        """Returns the columns of a snapshot needed for comparing, with the registration mask too if <masked>."""
+        from ttipabot import analyser
+        columns = analyser.IDENTITY_COLUMNS if identify else analyser.COMPARE_COLUMNS
+        if masked:
+            columns = columns + [registrations.MASK_COLUMN]
+        frame = self.frames.get(csv)
+        # Keep one frame per snapshot, loading it again only when more columns are needed
+        if frame is None or not set(columns) <= set(frame.columns):
+            frame = self.frames[csv] = analyser.csv_to_df(csv, columns, compact=True)
+        return frame if list(frame.columns) == columns else frame[columns]
+
+    def diff(self, csv1: Path, csv2: Path, pat: bool, tm: bool, identify: bool = False) -> pd.DataFrame:
+        from ttipabot import analyser
+        key = (csv1, csv2, pat, tm, identify)
+        if key not in self.diffs:
+            masked = pat or tm
+            self.diffs[key] = analyser.diff_dfs(self.load(csv1, identify, masked), self.load(csv2, identify, masked), pat, tm, identify)
+        return self.diffs[key]
+
+    def rank(self, csv: Path, num: int, pat: bool, tm: bool, mode: str) -> pd.DataFrame:
+        from ttipabot import analyser
+        if mode not in analyser.RANK_COLUMNS:
+            raise ValueError("Invalid ranking mode.")
+        # Selecting the columns makes a new frame, so ranking can add to it without touching the shared one
+        return analyser.rank_df(self.load(csv, masked=pat or tm)[analyser.masked(analyser.RANK_COLUMNS[mode], pat, tm)], num, pat, tm, mode)
+
+def compare_data(dates: tuple[str, str], pat: bool, tm: bool, mode: str, json: bool = False, context: CompareContext = None,
+                 snap: str = None, identify: bool = False) -> str:
     """Compares scraped data between two different dates according to a specified mode from among the following:
     registrations
     movements
-    lapses"""
-    dates = sorted(list(dates))
+    lapses
+    renames"""
+    return compare_data_modes(dates, pat, tm, [mode], json, context, snap, identify)[mode]
+
+def compare_data_modes(dates: tuple[str, str], pat: bool, tm: bool, modes: list[str], json: bool = False, context: CompareContext = None,
+                       snap: str = None, identify: bool = False) -> dict[str, str]:
+    """Compares scraped data between two dates once, and returns the output for each of the requested modes.
+    Passing the same <context> to later calls reuses the snapshots and diff already loaded.
+    With <identify>, attorneys who changed name are reported as renames instead of a lapse and a registration,
+    which the renames mode always does."""
+    dates = sorted(resolve_dates(dates, snap))
     csv1, csv2 = scraper.dates_to_filepaths(dates)
-    logger.debug(f"Comparing dates {dates[0]} and {dates[1]}")
-    comparison_df = analyser.compare_data(csv1, csv2, pat, tm, mode)
-    
-    if json: 
-        return comparison_df.to_json(orient = "records")
-    # If there's no results, output empty string instead of the headers
-    if comparison_df.empty: 
-        return ""
-    return comparison_df.to_markdown()
-    
+    logger.debug(f"Comparing dates {dates[0]} and {dates[1]} for {', '.join(modes)}")
+    return compare_paths(csv1, csv2, pat, tm, modes, json, context, identify)
+
+def compare_paths(csv1: Path, csv2: Path, pat: bool, tm: bool, modes: list[str], json: bool = False, context: CompareContext = None,
+                  identify: bool = False) -> dict[str, str]:
+    """Compares two snapshots for each of <modes>, only diffing them if some output isn't already cached."""
+    identify = identify or 'renames' in modes
+    cache = result_cache.get_cache()
+    keys = {mode: result_cache.make_key("compare", [csv1, csv2], mode, pat, tm, identify, json) for mode in modes}
+    outputs = {mode: cache.get(key) for mode, key in keys.items()}
+    missing = [mode for mode, output in outputs.items() if output is None]
+    if missing:
+        # Only imported on a miss, so cached answers don't wait for pandas
+        from ttipabot import analyser
+        if context is None:
+            context = CompareContext()
+        views = analyser.project_diffs(context.diff(csv1, csv2, pat, tm, identify), missing)
+        for mode, view in views.items():
+            outputs[mode] = comparison_to_str(view, json)
+            cache.put(keys[mode], outputs[mode])
+    return outputs
+
+def compare_views(dates: tuple[str, str], pat: bool, tm: bool, modes: list[str], context: CompareContext = None,
+                  snap: str = None, identify: bool = False) -> dict[str, pd.DataFrame]:
+    """Compares scraped data between two dates once, and returns the frame for each of the requested modes,
+    for writing out with write_comparison rather than as whole strings. These aren't cached."""
+    from ttipabot import analyser
+    dates = sorted(resolve_dates(dates, snap))
+    csv1, csv2 = scraper.dates_to_filepaths(dates)
+    logger.debug(f"Comparing dates {dates[0]} and {dates[1]} for {', '.join(modes)}")
+    if context is None:
+        context = CompareContext()
+    return analyser.project_diffs(context.diff(csv1, csv2, pat, tm, identify or 'renames' in modes), modes)
+
+def write_comparison(views: dict[str, pd.DataFrame], stream: TextIO, format: str, headings: dict[str, str] = None) -> None:
+    """Streams the frames of a comparison to <stream> as they're formatted. Markdown tables follow their <headings>
+    as in the text output, while NDJSON and CSV rows lead with their mode."""
+    if format != 'markdown':
+        writers.write_sections(views, stream, format)
+        return
+    for mode, view in views.items():
+        if headings:
+            stream.write(f"{headings[mode]}\n")
+        # An empty comparison is a blank line, as in the text output
+        if view.empty:
+            stream.write("\n")
+        else:
+            writers.write(view, stream, format)
 
-def rank_data(date: str, num: int, pat: bool, tm: bool, mode: str, json: bool=False) -> str:
-    csv = scraper.dates_to_filepaths([date])[0]
-    ranking_df = analyser.rank_data(csv, num, pat, tm, mode)
+def consecutive_pairs(since: str = None, until: str = None, changesOnly: bool = True) -> list[tuple[str, str]]:
+    """Pairs each date from <since> to <until> with the date before it, by default only among dates with changed data."""
+    dates = get_dates(count_dates(), changesOnly=changesOnly, since=since, until=until)
+    dates = [date for date in dates if date]
+    if since and dates:
+        # The first date in the range pairs with the last one before it
+        before = datetime.date.fromisoformat(scraper.parse_date_spec(since)[0]) - datetime.timedelta(days=1)
+        previous = scraper.get_catalogue().at_or_before(before.isoformat(), changes_only=changesOnly)
+        if previous is not None:
+            dates.insert(0, previous)
+    return list(zip(dates, dates[1:]))
+
+def compare_chunk(task: tuple) -> list[tuple[tuple, dict[str, str]]]:
+    """Compares a run of date pairs in a worker process. Adjacent pairs share a snapshot, which is only loaded once."""
+    pairs, pat, tm, modes, json, identify = task
+    context = CompareContext()
+    results = []
+    for key, csv1, csv2 in pairs:
+        results.append((key, compare_paths(csv1, csv2, pat, tm, modes, json, context, identify)))
+        # Only the newer snapshot can be needed by the next pair, if it was loaded at all rather than found cached
+        context.frames = {csv: frame for csv, frame in context.frames.items() if csv == csv2}
+        context.diffs = {}
+    return results
+
+def compare_many(pairs: list[tuple[tuple, Path, Path]], pat: bool, tm: bool, modes: list[str], json: bool = False,
+                 workers: int = 4, identify: bool = False, chunkSize: int = None) -> Iterator[tuple[tuple, dict[str, str]]]:
+    """Compares each (key, csv1, csv2) of <pairs>, spread over <workers> processes, yielding each key with its outputs.
+    Pairs are split into runs of consecutive pairs so workers reuse the snapshots they share, and results come out
+    in the order of <pairs> as soon as each run is done."""
+    if chunkSize is None:
+        # A few runs per worker keeps them all busy until the end, while keeping most neighbours together
+        chunkSize = max(1, math.ceil(len(pairs) / (max(workers, 1) * 4)))
+    tasks = [(pairs[i:i + chunkSize], pat, tm, modes, json, identify) for i in range(0, len(pairs), chunkSize)]
+    # More processes than cores only adds overhead
+    workers = min(workers, os.cpu_count() or 1)
+    if workers <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            yield from compare_chunk(task)
+        return
+    # Imported before the pool starts, so forked workers inherit pandas rather than each importing it
+    from ttipabot import analyser
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for results in executor.map(compare_chunk, tasks):
+            yield from results
+
+def batch_compare(pairs: list[tuple[str, str]], pat: bool, tm: bool, modes: list[str], json: bool = False,
+                  workers: int = 4, identify: bool = False, snap: str = None) -> Iterator[tuple[tuple[str, str], dict[str, str]]]:
+    """Compares every date pair in <pairs> in parallel, yielding the dates and the output for each mode of each pair,
+    in the order given."""
+    resolved = [tuple(sorted(resolve_dates(list(pair), snap))) for pair in pairs]
+    logger.debug(f"Batch comparing {len(resolved)} date pairs for {', '.join(modes)}")
+    pathPairs = [(dates, *scraper.dates_to_filepaths(list(dates))) for dates in resolved]
+    return compare_many(pathPairs, pat, tm, modes, json, workers, identify)
+
+def comparison_to_str(comparison_df: pd.DataFrame, json: bool = False) -> str:
+    with profiling.stage("render") as stage:
+        stage.rows = len(comparison_df)
+        if json: 
+            return comparison_df.to_json(orient = "records")
+        # If there's no results, output empty string instead of the headers
+        if comparison_df.empty: 
+            return ""
+        return writers.render(comparison_df, 'markdown')
+
+def rank_data(date: str, num: int, pat: bool, tm: bool, mode: str, json: bool=False, snap: str = None,
+              context: CompareContext = None) -> str:
+    """Ranks the attorneys on the register at <date> by name length or firm headcount, unless already cached.
+    With a <context>, the snapshot is taken from or kept in it."""
+    csv = scraper.dates_to_filepaths(resolve_dates([date], snap))[0]
+    cache = result_cache.get_cache()
+    key = result_cache.make_key("rank", [csv], mode, num, pat, tm, json)
+    output = cache.get(key)
+    if output is not None:
+        return output
+    from ttipabot import analyser
+    if context is not None:
+        ranking_df = context.rank(csv, num, pat, tm, mode)
+    else:
+        ranking_df = analyser.rank_data(csv, num, pat, tm, mode)
+    with profiling.stage("render") as stage:
+        stage.rows = len(ranking_df)
+        output = ranking_df.to_json(orient = "records") if json else writers.render(ranking_df, 'markdown')
+    cache.put(key, output)
+    return output
+
+def timeline_data(pat: bool, tm: bool, firms: list[str] = (), period: str = 'date', json: bool = False) -> str:
+    """Summarises every scrape with changed data in date order, in a single pass over the archive."""
+    from ttipabot import analyser
+    changes = scraper.get_catalogue().changes()
+    timeline_df = analyser.timeline_df(changes, pat, tm, firms, period)
     if json:
-        return ranking_df.to_json(orient = "records")
-    return ranking_df.to_markdown()
+        return timeline_df.to_json(orient = "records")
+    return timeline_df.to_markdown(index=False)
+
+def history_data(name: str, json: bool = False) -> str:
+    """Lists the firms and registrations held by attorneys with names containing <name>, and when."""
+    scraper.update_history()
+    return history_to_str(history.attorney_history(scraper.CSV_FOLDER, name), json)
+
+def firm_history_data(firm: str, json: bool = False) -> str:
+    """Lists the attorneys that have been at firms with names containing <firm>, and when."""
+    scraper.update_history()
+    return history_to_str(history.firm_history(scraper.CSV_FOLDER, firm), json)
+
+def history_to_str(intervals: list[tuple], json: bool = False) -> str:
+    # Formatted without pandas so lookups answered from the index stay fast
+    if json:
+        import json as json_module
+        return json_module.dumps([dict(zip(history.COLUMNS, interval)) for interval in intervals], separators=(',', ':'))
+    if not intervals:
+        return ""
+    from tabulate import tabulate
+    return tabulate(intervals, headers=history.COLUMNS, tablefmt="pipe")
 
 def cleanup() -> int:
     """Cleans up duplicate csv files by mapping dupes to earlier dates, and returns the number of csvs cleaned."""
     return scraper.clean_csvs(recentOnly=False)
-    
\ No newline at end of file
+
+def migrate() -> int:
+    """Writes mask sidecars and, with pyarrow installed, columnar copies of any csv snapshots lacking them,
+    and returns the number of snapshots written to."""
+    return store.migrate(scraper.get_csv_filepaths(scraper.CSV_FOLDER))
+
+def pack(keyframeInterval: int) -> int:
+    """Switches to delta storage, keeping a full csv every <keyframeInterval> snapshots, and returns the number of csvs replaced."""
+    return scraper.pack_csvs(keyframeInterval)
@@ -0,0 +1,112 @@
+"""Sorted index of every available date and the snapshot holding its data, so date lookups don't rescan the scrapes folder."""
+from __future__ import annotations
+
+from bisect import bisect_left, bisect_right
+from pathlib import Path
+import datetime
+import re
+
+# How a date without a scrape of its own is resolved to one that has
+SNAP_MODES = ['exact', 'before', 'after', 'nearest']
+
+# Relative dates, as a number of days or weeks before today
+RELATIVE_DATE = re.compile(r"(\d+)([dw])")
+
+def parse_date_spec(spec: str, today: datetime.date = None) -> tuple[str, bool]:
+    """Returns the ISO date meant by <spec>, and whether it was given relative to today.
+    Accepts ISO dates, 'today', 'yesterday', and offsets like '30d' or '2w' meaning that long ago."""
+    today = today or datetime.date.today()
+    spec = spec.strip().lower()
+    if spec == 'today':
+        return str(today), True
+    if spec == 'yesterday':
+        return str(today - datetime.timedelta(days=1)), True
+    match = RELATIVE_DATE.fullmatch(spec)
+    if match:
+        days = int(match[1]) * (7 if match[2] == 'w' else 1)
+        return str(today - datetime.timedelta(days=days)), True
+    try:
+        return str(datetime.date.fromisoformat(spec)), False
+    except ValueError:
+        raise ValueError("Missing or incorrectly formatted date, should be YYYY-MM-DD")
+
+class DateCatalogue:
+    """All dates with stored snapshots plus those mapped onto them by the date table, in time order.
+    <stamp> identifies the state of the folder the catalogue was built from."""
+
+    def __init__(self, dirPath: Path, snapshots: dict[str, Path], table: dict[str, str], stamp: tuple = ()):
+        self.dirPath = dirPath
+        self.stamp = stamp
+        self.snapshots = snapshots
+        self.paths = dict(snapshots)
+        for date, substitute_date in table.items():
+            self.paths.setdefault(date, snapshots.get(substitute_date, dirPath / (f"{substitute_date}.csv")))
+        self.dates = sorted(self.paths)
+        # Dates whose data differs from the date before. Repeats of any earlier snapshot are mapped onto it, so a
+        # register going back to an earlier state is a change even though it stores no snapshot of its own.
+        self.changed_dates = [date for i, date in enumerate(self.dates) if i == 0 or self.paths[date] != self.paths[self.dates[i - 1]]]
+
+    def changes(self) -> list[tuple[str, Path]]:
+        """Returns each date with changed data, along with the snapshot holding it."""
+        return [(date, self.paths[date]) for date in self.changed_dates]
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def __contains__(self, date: str) -> bool:
+        return date in self.paths
+
+    def _dates(self, changes_only: bool) -> list[str]:
+        return self.changed_dates if changes_only else self.dates
+
+    def path(self, date: str) -> Path:
+        """Returns the snapshot holding the data for <date>."""
+        if date not in self.paths:
+            raise ValueError(f"No file exists for {date}")
+        return self.paths[date]
+
+    def count(self, changes_only: bool = False) -> int:
+        return len(self._dates(changes_only))
+
+    def select(self, num: int, oldest: bool = False, changes_only: bool = False) -> list[str]:
+        """Returns the <num> oldest or newest dates."""
+        dates = self._dates(changes_only)
+        return dates[:num] if oldest else dates[-num:]
+
+    def between(self, start: str = None, end: str = None, changes_only: bool = False) -> list[str]:
+        """Returns the dates from <start> to <end> inclusive, with either bound left open if not given."""
+        dates = self._dates(changes_only)
+        lo = bisect_left(dates, start) if start else 0
+        hi = bisect_right(dates, end) if end else len(dates)
+        return dates[lo:hi]
+
+    def at_or_before(self, date: str, changes_only: bool = False) -> str | None:
+        """Returns the latest available date no later than <date>, or None if there isn't one."""
+        dates = self._dates(changes_only)
+        i = bisect_right(dates, date)
+        return dates[i - 1] if i else None
+
+    def at_or_after(self, date: str, changes_only: bool = False) -> str | None:
+        """Returns the earliest available date no earlier than <date>, or None if there isn't one."""
+        dates = self._dates(changes_only)
+        i = bisect_left(dates, date)
+        return dates[i] if i < len(dates) else None
+
+    def resolve(self, date: str, snap: str = 'exact') -> str:
+        """Returns the available date <date> resolves to under the <snap> mode:
+        exact requires a scrape on <date>, before and after take the closest scrape on that side,
+        and nearest takes the closest scrape either side, preferring the earlier one on a tie."""
+        if snap == 'exact':
+            self.path(date)
+            return date
+        earlier = self.at_or_before(date) if snap in ('before', 'nearest') else None
+        later = self.at_or_after(date) if snap in ('after', 'nearest') else None
+        if snap == 'nearest' and earlier and later:
+            day = datetime.date.fromisoformat(date)
+            gap = lambda other: abs((datetime.date.fromisoformat(other) - day).days)
+            return earlier if gap(earlier) <= gap(later) else later
+        resolved = earlier or later
+        if resolved is None:
+            side = {'before': "on or before ", 'after': "on or after ", 'nearest': "near "}[snap]
+            raise ValueError(f"No scrape exists {side}{date}")
+        return resolved
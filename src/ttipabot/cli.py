@@ -1,27 +1,62 @@
+import datetime
+import sys
 import ttipabot as tt
+from ttipabot import profiling, store
+from ttipabot.catalogue import SNAP_MODES
+from ttipabot.writers import WRITERS
 import click
 
 # Thin wrappers for cli commands
 @click.group(chain=True)
-def cli():
+@click.option('--profile', is_flag=True, default=False, help='Print the time spent in each stage once done.')
+@click.option('--profile-stats', type=click.Path(dir_okay=False), default=None, help='Write cProfile stats of the run to this file, for pstats.')
+@click.option('--profile-json', type=click.Path(dir_okay=False), default=None, help='Append the stage timings of the run to this file as a JSON line.')
+@click.pass_context
+def cli(ctx, profile, profile_stats, profile_json):
     """Command line tool for interacting with the TTIPA register."""
-    pass
+    # Shared by chained commands so each date pair is only loaded and diffed once
+    ctx.obj = tt.CompareContext()
+    if profile or profile_stats or profile_json:
+        profiling.start(" ".join(sys.argv[1:]), cprofile=profile_stats is not None)
+        # Reported once every chained command has run
+        ctx.call_on_close(lambda: finish_profile(profile, profile_stats, profile_json))
+
+def finish_profile(profile, profile_stats, profile_json):
+    run = profiling.stop()
+    # On stderr, so the output of the commands themselves stays parseable
+    if profile:
+        click.echo(run.report(), err=True)
+    if profile_stats:
+        run.dump_stats(profile_stats)
+    if profile_json:
+        profiling.append_record(run, profile_json)
         
 @cli.command()
-def scrape():
+@click.option('--page-size', default=0, help='Scrape in pages of this many results instead of one request.')
+@click.option('--workers', default=4, show_default=True, help='Number of pages to fetch concurrently.')
+def scrape(page_size, workers):
     """Scrape the TTIPA register."""
-    if tt.scrape_register():
+    if tt.scrape_register(page_size, workers):
         click.echo("Finished today's register scrape.")
     else:
         click.echo("Already scraped the register today.")
 
 # Define some options shared between commands
-dates_option = click.option('-d', '--dates', nargs=2, default=tt.get_dates(num=2, oldest=False, changesOnly=True), help='Dates to compare, in format: YY-MM-DD YY-MM-DD')
-date_option = click.option('-d', '--date', default=tt.get_latest_date(), help='Date to do ranking on.')
+# Defaults are callables so the archive is only scanned when a command actually needs them
+dates_option = click.option('-d', '--dates', nargs=2, default=lambda: tt.get_dates(num=2, oldest=False, changesOnly=True), help="Dates to compare, as YYYY-MM-DD or relative like '30d' or 'today'.")
+date_option = click.option('-d', '--date', default=lambda: tt.get_latest_date(), help="Date to do ranking on, as YYYY-MM-DD or relative like '30d' or 'today'.")
 json_option = click.option('--json', is_flag=True, default=False, show_default=True, help='Output in JSON format.')
 pat_option = click.option('--pat', is_flag=True, show_default=True, default=False, help='Filter by patent attorneys.')
 tm_option = click.option('--tm', is_flag=True, show_default=True, default=False, help='Filter by TM attorneys.')
 num_option = click.option('-n', '--num', default=10, help='Number of places in ranking.')
+renames_option = click.option('--renames', is_flag=True, default=False, show_default=True,
+                              help='Match up attorneys who changed name, instead of listing a lapse and a registration.')
+format_option = click.option('--format', 'fmt', type=click.Choice(list(WRITERS)), default=None,
+                             help='Stream rows out as they are formatted, skipping the result cache. NDJSON and CSV rows lead with their mode.')
+output_option = click.option('-o', '--output', type=click.File('w', encoding='utf-8', lazy=True), default='-',
+                             help='Write to this file instead of the terminal.')
+snap_option = click.option('--snap', type=click.Choice(SNAP_MODES), default=None,
+                           help='Use the nearest scrape for dates without one. Relative dates default to before.')
 
 # For use with filtering options
 def describe_attorney_filter(pat, tm):
@@ -34,16 +69,29 @@ def describe_attorney_filter(pat, tm):
     else:
         return "IP"
 
+def describe_comparison(mode, dates, pat, tm):
+    kind = describe_attorney_filter(pat, tm)
+    if mode == 'registrations':
+        return f"Congratulations to the new {kind} attorneys registered between {dates[0]} and {dates[1]}:"
+    elif mode == 'movements':
+        return f"The following {kind} attorneys changed firms between {dates[0]} and {dates[1]}:"
+    elif mode == 'renames':
+        return f"The following {kind} attorneys changed their names between {dates[0]} and {dates[1]}:"
+    return f"The following {kind} attorneys had their registrations lapse between {dates[0]} and {dates[1]}:"
+
 @cli.command()
 @dates_option
 @json_option
 @pat_option
 @tm_option 
-def regos(dates, json, pat, tm):
+@snap_option
+@renames_option
+@click.pass_obj
+def regos(context, dates, json, pat, tm, snap, renames):
     """Show new attorney registrations."""
-    dates = sorted(dates)
-    output = tt.compare_data(dates, pat, tm, mode='registrations', json=json)
-    click.echo(f"Congratulations to the new {describe_attorney_filter(pat, tm)} attorneys registered between {dates[0]} and {dates[1]}:")
+    dates = sorted(tt.resolve_dates(dates, snap))
+    output = tt.compare_data(dates, pat, tm, mode='registrations', json=json, context=context, identify=renames)
+    click.echo(describe_comparison('registrations', dates, pat, tm))
     # TODO Refactor to avoid multiple return types from compare_registrations
     
     click.echo(output)
@@ -52,21 +100,98 @@ def regos(dates, json, pat, tm):
 @dates_option
 @pat_option
 @tm_option
-def moves(dates, pat, tm):
+@snap_option
+@renames_option
+@click.pass_obj
+def moves(context, dates, pat, tm, snap, renames):
     """Show movements of attorneys between firms."""
-    dates = sorted(dates)
-    output = tt.compare_data(dates, pat, tm, mode='movements')
-    click.echo(f"The following {describe_attorney_filter(pat, tm)} attorneys changed firms between {dates[0]} and {dates[1]}:\n{output}")
+    dates = sorted(tt.resolve_dates(dates, snap))
+    output = tt.compare_data(dates, pat, tm, mode='movements', context=context, identify=renames)
+    click.echo(f"{describe_comparison('movements', dates, pat, tm)}\n{output}")
     
 @cli.command()
 @dates_option
 @pat_option
 @tm_option
-def lapses(dates, pat, tm):
+@snap_option
+@renames_option
+@click.pass_obj
+def lapses(context, dates, pat, tm, snap, renames):
     """Show attorneys that let their registration lapse."""
-    dates = sorted(dates)
-    output = tt.compare_data(dates, pat, tm, mode='lapses')
-    click.echo(f"The following {describe_attorney_filter(pat, tm)} attorneys had their registrations lapse between {dates[0]} and {dates[1]}:\n{output}")
+    dates = sorted(tt.resolve_dates(dates, snap))
+    output = tt.compare_data(dates, pat, tm, mode='lapses', context=context, identify=renames)
+    click.echo(f"{describe_comparison('lapses', dates, pat, tm)}\n{output}")
+
+@cli.command()
+@dates_option
+@json_option
+@pat_option
+@tm_option
+@snap_option
+@click.pass_obj
+def renames(context, dates, json, pat, tm, snap):
+    """Show attorneys whose name changed, matched by email, phone and name."""
+    dates = sorted(tt.resolve_dates(dates, snap))
+    output = tt.compare_data(dates, pat, tm, mode='renames', json=json, context=context)
+    click.echo(describe_comparison('renames', dates, pat, tm))
+    click.echo(output)
+
+@cli.command()
+@dates_option
+@click.option('-m', '--mode', 'modes', multiple=True, default=['registrations', 'movements', 'lapses'], show_default=True,
+              type=click.Choice(['registrations', 'movements', 'lapses', 'renames']), help='Comparison to include, can be repeated.')
+@json_option
+@format_option
+@output_option
+@pat_option
+@tm_option
+@snap_option
+@renames_option
+@click.pass_obj
+def compare(context, dates, modes, json, fmt, output, pat, tm, snap, renames):
+    """Show registrations, movements and lapses from a single comparison."""
+    if json and fmt is not None:
+        raise click.UsageError("Use either --json or --format, not both.")
+    dates = sorted(tt.resolve_dates(dates, snap))
+    if fmt is not None:
+        views = tt.compare_views(dates, pat, tm, list(modes), context=context, identify=renames)
+        headings = {mode: describe_comparison(mode, dates, pat, tm) for mode in modes}
+        tt.write_comparison(views, output, fmt, headings)
+        return
+    outputs = tt.compare_data_modes(dates, pat, tm, list(modes), json=json, context=context, identify=renames)
+    if json:
+        # Each output is already a JSON array, so combine them into one object keyed by mode
+        click.echo("{" + ", ".join(f'"{mode}": {output}' for mode, output in outputs.items()) + "}", file=output)
+        return
+    for mode, modeOutput in outputs.items():
+        click.echo(f"{describe_comparison(mode, dates, pat, tm)}\n{modeOutput}", file=output)
+
+@cli.command()
+@click.option('-p', '--pair', 'pairs', nargs=2, multiple=True, help='Date pair to compare, can be repeated.')
+@click.option('--since', default=None, help="Without pairs, compare each scrape from this date on with the one before.")
+@click.option('--until', default=None, help="Without pairs, compare each scrape up to this date with the one before.")
+@click.option('-m', '--mode', 'modes', multiple=True, default=['registrations', 'movements', 'lapses'], show_default=True,
+              type=click.Choice(['registrations', 'movements', 'lapses', 'renames']), help='Comparison to include, can be repeated.')
+@click.option('--workers', default=4, show_default=True, help='Number of processes comparing pairs at once.')
+@json_option
+@pat_option
+@tm_option
+@snap_option
+@renames_option
+def batch(pairs, since, until, modes, workers, json, pat, tm, snap, renames):
+    """Compare many date pairs at once, by default every scrape with changed data against the one before it.
+    Prints a JSON line or a markdown section per pair, in date order."""
+    if not pairs:
+        pairs = tt.consecutive_pairs(since, until)
+    for dates, outputs in tt.batch_compare(list(pairs), pat, tm, list(modes), json, workers, renames, snap):
+        if json:
+            # Each output is already a JSON array, so combine them into one line keyed by mode
+            fields = [f'"dates": ["{dates[0]}", "{dates[1]}"]'] + [f'"{mode}": {output}' for mode, output in outputs.items()]
+            click.echo("{" + ", ".join(fields) + "}")
+            continue
+        click.echo(f"## {dates[0]} to {dates[1]}")
+        for mode, output in outputs.items():
+            click.echo(f"{describe_comparison(mode, dates, pat, tm)}\n{output}")
 
 @cli.command()
 @date_option
@@ -74,20 +199,27 @@ def lapses(dates, pat, tm):
 @json_option
 @pat_option
 @tm_option 
-def names(date, num, json, pat, tm):
+@snap_option
+def names(date, num, json, pat, tm, snap):
     """Rank the longest names on the register."""
+    date = tt.resolve_dates([date], snap)[0]
     output = tt.rank_data(date, num, pat, tm,  mode='names', json=json)
     click.echo(f"The top {num} names by length as of {date} are:")
     # TODO Refactor to avoid multiple return types from rank_names
     click.echo(output)
 
 @cli.command()
-@click.option('-n', '--num', default=tt.count_dates(), help='number of recent scraped dates to print')
+@click.option('-n', '--num', type=int, default=lambda: tt.count_dates(), help='number of recent scraped dates to print')
 @click.option('--oldest/--newest', default=False, show_default=True)
-def dates(num, oldest):
+@click.option('--since', default=None, help="Only list dates from this one on, as YYYY-MM-DD or relative like '30d'.")
+@click.option('--until', default=None, help="Only list dates up to this one, as YYYY-MM-DD or relative like '30d'.")
+def dates(num, oldest, since, until):
     """Show dates with scraped data available."""
-    click.echo(f"Listing {num} {"oldest" if oldest else "newest"} dates out of {tt.count_dates()} dates available:")
-    dates = tt.get_dates(num, oldest)
+    dates = tt.get_dates(num, oldest, since=since, until=until)
+    if since or until:
+        click.echo(f"Listing {len(dates)} {'oldest' if oldest else 'newest'} dates from {since or 'the first scrape'} to {until or 'the last scrape'}:")
+    else:
+        click.echo(f"Listing {num} {'oldest' if oldest else 'newest'} dates out of {tt.count_dates()} dates available:")
     # Order the dates so the newest/oldest one is easily visible at the bottom
     for date in reversed(dates) if oldest else dates:
         click.echo(date)
@@ -97,11 +229,46 @@ def dates(num, oldest):
 @num_option
 @pat_option
 @tm_option
-def firms(date, num, pat, tm):
+@snap_option
+def firms(date, num, pat, tm, snap):
     """Print the dates of previous scrapes."""
+    date = tt.resolve_dates([date], snap)[0]
     output = output = tt.rank_data(date, num, pat, tm,  mode='firms')
     click.echo(f"The biggest {num} firms by attorney count as of {date} are:\n{output}")
 
+@cli.command()
+@click.option('-f', '--firm', 'firms', multiple=True, help='Firm to track the headcount of, can be repeated.')
+@click.option('-p', '--period', default='date', show_default=True, type=click.Choice(['date', 'month', 'year']), help='Total the changes over each period.')
+@json_option
+@pat_option
+@tm_option
+def timeline(firms, period, json, pat, tm):
+    """Show registrations, lapses, moves and headcounts over time."""
+    output = tt.timeline_data(pat, tm, list(firms), period, json=json)
+    if not json:
+        click.echo(f"Changes in {describe_attorney_filter(pat, tm)} attorneys by {period} across all scrapes:")
+    click.echo(output)
+
+@cli.command()
+@click.argument('name')
+@json_option
+def history(name, json):
+    """Show the firms and registrations of attorneys matching NAME over time."""
+    output = tt.history_data(name, json=json)
+    if not json:
+        click.echo(f"Register history of attorneys matching '{name}':")
+    click.echo(output)
+
+@cli.command('firm-history')
+@click.argument('firm')
+@json_option
+def firm_history(firm, json):
+    """Show the attorneys at firms matching FIRM over time."""
+    output = tt.firm_history_data(firm, json=json)
+    if not json:
+        click.echo(f"Register history of attorneys at firms matching '{firm}':")
+    click.echo(output)
+
 @cli.command()
 def cleanup():
     """Clean up duplicate scrapes."""
@@ -109,4 +276,45 @@ def cleanup():
     if csvs_deleted > 0:
         click.echo(f"Deleted {csvs_deleted} scraped csv files and mapped to earlier dates.")
     else:
-        click.echo("Nothing to clean up.")
\ No newline at end of file
+        click.echo("Nothing to clean up.")
+
+@cli.command()
+def migrate():
+    """Write registration masks and columnar copies of existing scrapes for faster loading."""
+    written = tt.migrate()
+    if written > 0:
+        click.echo(f"Wrote registration masks or columnar copies of {written} scraped csv files.")
+    else:
+        click.echo("All scrapes are already migrated.")
+    if not store.available():
+        click.echo("Columnar copies need pyarrow, install with: pip install ttipabot[columnar]")
+
+@cli.command()
+@click.option('-k', '--keyframe-interval', default=30, show_default=True, help='Keep a full csv once every this many scrapes.')
+def pack(keyframe_interval):
+    """Store scrapes as deltas against the previous scrape."""
+    packed = tt.pack(keyframe_interval)
+    click.echo(f"Replaced {packed} scraped csv files with deltas, keeping a full csv every {keyframe_interval} scrapes.")
+
+def parse_time(ctx, param, value):
+    try:
+        return datetime.time.fromisoformat(value)
+    except ValueError:
+        raise click.BadParameter("should be a time of day as HH:MM")
+
+@cli.command()
+@click.option('--host', default='127.0.0.1', show_default=True, help='Address to listen on.')
+@click.option('--port', default=8765, show_default=True, help='Port to listen on.')
+@click.option('--socket', 'socket_path', type=click.Path(dir_okay=False), default=None, help='Listen on this Unix socket instead of a port.')
+@click.option('--keep', default=3, show_default=True, help='Number of recent snapshots to keep loaded, with the diffs between them.')
+@click.option('--scrape-at', default='09:00', show_default=True, callback=parse_time, help='Time of day to scrape the register.')
+@click.option('--no-schedule', is_flag=True, default=False, help="Only answer queries, leaving scrapes to cron or POST /scrape.")
+def serve(host, port, socket_path, keep, scrape_at, no_schedule):
+    """Scrape daily and answer dates, compare and rank queries over a local JSON API.
+
+    Queries are GET /dates, /compare, /rank and /status, taking the options of the commands as query
+    parameters, like /compare?date=30d&date=today&mode=movements&pat=1. POST /scrape scrapes now."""
+    from ttipabot import server
+    click.echo(f"Serving on {socket_path or f'http://{host}:{port}'}"
+               + ("" if no_schedule else f", scraping daily at {scrape_at.strftime('%H:%M')}") + ". Stop with Ctrl+C.")
+    server.serve(host, port, socket_path, keep, None if no_schedule else scrape_at)
@@ -0,0 +1,115 @@
+"""Row level deltas between snapshots, so most dates need not store a full copy of the register."""
+from __future__ import annotations
+
+from collections import OrderedDict
+from pathlib import Path
+from typing import TYPE_CHECKING
+import json
+
+from ttipabot import store, registrations
+
+# pandas is imported where used, as listing snapshots shouldn't need it
+if TYPE_CHECKING:
+    import pandas as pd
+
+DELTA_SUFFIX = ".delta.json"
+COLUMNS = ['Name', 'Phone', 'Email', 'Firm', 'Address', 'Registered as']
+
+# Number of reconstructed frames kept in memory, so chains of deltas aren't replayed on every load
+CACHE_SIZE = 8
+_cache: OrderedDict = OrderedDict()
+
+def is_delta(path: Path) -> bool:
+    return path.name.endswith(DELTA_SUFFIX)
+
+def delta_path(dirPath: Path, date: str) -> Path:
+    return dirPath / f"{date}{DELTA_SUFFIX}"
+
+def row_keys(df: pd.DataFrame) -> pd.MultiIndex:
+    """Keys rows by name, numbering repeats of a name so duplicated names stay distinct."""
+    import pandas as pd
+    return pd.MultiIndex.from_arrays([df['Name'], df.groupby('Name').cumcount()])
+
+def to_runs(positions: list[int]) -> list[list[int]]:
+    """Compresses a list of row positions into [start, length] runs of consecutive positions."""
+    runs = []
+    for position in positions:
+        if runs and runs[-1][0] + runs[-1][1] == position:
+            runs[-1][1] += 1
+        else:
+            runs.append([position, 1])
+    return runs
+
+def from_runs(runs: list[list[int]]) -> list[int]:
+    return [position for start, length in runs for position in range(start, start + length)]
+
+def compute_delta(base: pd.DataFrame, df: pd.DataFrame) -> dict:
+    """Returns the rows added, removed and changed going from <base> to <df>, keyed by name.
+    The row order of <df> is kept as runs of positions into the base rows followed by the added rows."""
+    import pandas as pd
+    base = base[COLUMNS].set_axis(row_keys(base))
+    df = df[COLUMNS].set_axis(row_keys(df))
+    removed = base.index.difference(df.index, sort=False)
+    added = df.index.difference(base.index, sort=False)
+    common = df.index.intersection(base.index, sort=False)
+    differs = (base.loc[common] != df.loc[common]).any(axis=1)
+    changed = common[differs.to_numpy()]
+
+    positions = pd.Series(range(len(base)), index=base.index)
+    positions = pd.concat([positions, pd.Series(range(len(base), len(base) + len(added)), index=added)])
+    return {
+        "removed": [list(key) for key in removed],
+        "changed": df.loc[changed].values.tolist(),
+        "changed_keys": [int(key[1]) for key in changed],
+        "added": df.loc[added].values.tolist(),
+        "order": to_runs(positions.loc[df.index].tolist()),
+    }
+
+def apply_delta(base: pd.DataFrame, delta: dict) -> pd.DataFrame:
+    """Rebuilds a snapshot from the snapshot it was computed against."""
+    import pandas as pd
+    base = base[COLUMNS].set_axis(row_keys(base))
+    if delta["changed"]:
+        changed = pd.DataFrame(delta["changed"], columns=COLUMNS, dtype='string')
+        keys = pd.MultiIndex.from_arrays([changed['Name'], delta["changed_keys"]])
+        base.loc[keys, COLUMNS] = changed.values
+    added = pd.DataFrame(delta["added"], columns=COLUMNS, dtype='string')
+    rows = pd.concat([base.reset_index(drop=True), added], ignore_index=True)
+    return rows.iloc[from_runs(delta["order"])].reset_index(drop=True)
+
+def write_delta(path: Path, baseDate: str, delta: dict) -> None:
+    with path.open('w', encoding="utf-8") as f:
+        json.dump({"base": baseDate, **delta}, f, ensure_ascii=False)
+
+def read_delta(path: Path, columns: list[str] = None) -> pd.DataFrame:
+    """Reconstructs the snapshot stored as a delta at <path>, replaying from the nearest full snapshot."""
+    key = str(path.resolve())
+    if key in _cache:
+        _cache.move_to_end(key)
+        df = _cache[key]
+    else:
+        with path.open('r', encoding="utf-8") as f:
+            delta = json.load(f)
+        basePath = delta_path(path.parent, delta["base"])
+        if is_delta(basePath) and basePath.exists():
+            base = read_delta(basePath)
+        else:
+            base = store.read_snapshot(path.parent / f"{delta['base']}.csv")
+        # Cached compact, as the cache holds several snapshots at once, and with the registration mask worked out
+        # once rather than on every load
+        df = store.compact_frame(apply_delta(base, delta))
+        df[registrations.MASK_COLUMN] = registrations.compute_mask(df)
+        _cache[key] = df
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    if columns is None:
+        columns = [column for column in df.columns if column != registrations.MASK_COLUMN]
+    # Expanding copies, so callers modifying the frame can't corrupt the cache
+    return store.expand_frame(df[columns])
+
+def set_cache_size(size: int) -> None:
+    """Sets how many reconstructed snapshots are kept in memory."""
+    global CACHE_SIZE
+    CACHE_SIZE = size
+    while len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
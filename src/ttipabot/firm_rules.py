@@ -0,0 +1,187 @@
+"""Rules consolidating variant spellings of firm names, loaded from firm_rules.json and applied once per distinct name.
+The canonical form of every name seen is kept in a cache file next to the scrapes, so it is only worked out once."""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import re
+from pathlib import Path
+from typing import Callable, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+RULES_PATH = Path(__file__).parents[0] / "firm_rules.json"
+CACHE_NAME = "firm_cache.json"
+
+# Rule types the rules file can use, keyed by the name in its "type" field
+RULE_TYPES: dict[str, Callable] = {}
+
+def rule_type(name: str):
+    """Registers a rule type for use in the rules file."""
+    def register(cls):
+        RULE_TYPES[name] = cls
+        return cls
+    return register
+
+# Each rule has the same effect as the pandas string method it replaced run over the whole column,
+# but most names can't be changed by a rule, so a single combined check rules them out first
+
+@rule_type("upper")
+class Upper:
+    def apply(self, firm: str) -> str:
+        return firm.upper()
+
+@rule_type("contains")
+class Contains:
+    """Replaces a name containing one of <firms> with that firm, checking the firms in order."""
+    def __init__(self, firms: list[str]):
+        self.firms = firms
+        self.pattern = re.compile("|".join(map(re.escape, firms)))
+
+    def apply(self, firm: str) -> str:
+        if self.pattern.search(firm) is None:
+            return firm
+        for candidate in self.firms:
+            if candidate in firm:
+                firm = candidate
+        return firm
+
+@rule_type("replace")
+class Replace:
+    """Replaces each occurrence of a key of <replacements> with its value, in order."""
+    def __init__(self, replacements: dict[str, str]):
+        self.replacements = replacements
+        self.pattern = re.compile("|".join(map(re.escape, replacements)))
+
+    def apply(self, firm: str) -> str:
+        if self.pattern.search(firm) is None:
+            return firm
+        for old, new in self.replacements.items():
+            firm = firm.replace(old, new)
+        return firm
+
+@rule_type("removesuffix")
+class RemoveSuffix:
+    """Removes each of <suffixes> from the end of the name, in order."""
+    def __init__(self, suffixes: list[str]):
+        self.suffixes = suffixes
+        self.endings = tuple(suffixes)
+
+    def apply(self, firm: str) -> str:
+        if not firm.endswith(self.endings):
+            return firm
+        for suffix in self.suffixes:
+            firm = firm.removesuffix(suffix)
+        return firm
+
+class FirmRules:
+    """An ordered list of rules, remembering the canonical form of every name already seen.
+    <version> identifies the rule set, so remembered names are only reused with the rules that produced them.
+    <cachePath> can be a function returning the path, to follow a scrapes folder that may change."""
+
+    def __init__(self, rules: list, version: str = "", cachePath: Path | Callable[[], Path] = None):
+        self.rules = rules
+        self.version = version
+        self.cachePath = cachePath
+        self.canonical: dict[str, str] = {}
+        self.unsaved = False
+
+    @classmethod
+    def load(cls, path: Path = RULES_PATH, cachePath: Path | Callable[[], Path] = None) -> FirmRules:
+        """Loads the rules at <path>, and any names already worked out with them from the cache at <cachePath>."""
+        content = path.read_bytes()
+        spec = json.loads(content)
+        rules = []
+        for rule in spec["rules"]:
+            rule = dict(rule)
+            kind = rule.pop("type")
+            if kind not in RULE_TYPES:
+                raise ValueError(f"Unknown firm rule type '{kind}' in {path.name}")
+            rules.append(RULE_TYPES[kind](**rule))
+        firmRules = cls(rules, content_version(content), cachePath)
+        firmRules.read_cache()
+        return firmRules
+
+    def cache_file(self) -> Path | None:
+        return self.cachePath() if callable(self.cachePath) else self.cachePath
+
+    def read_cache(self) -> None:
+        cachePath = self.cache_file()
+        if cachePath is None or not cachePath.exists():
+            return
+        try:
+            with cachePath.open('r', encoding="utf-8") as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            # A damaged cache only costs working the names out again
+            return
+        if cache.get("rules_version") == self.version:
+            self.canonical.update(cache["canonical"])
+
+    def save(self) -> None:
+        """Writes any newly seen names to the cache file, if it can be written."""
+        cachePath = self.cache_file()
+        if cachePath is None or not self.unsaved:
+            return
+        self.unsaved = False
+        # Write then rename, so an interrupted save never leaves a partial cache, with a file per process
+        # so that batch workers saving at once don't write over each other
+        tmpPath = cachePath.with_name(f"{cachePath.name}.{os.getpid()}.tmp")
+        try:
+            with tmpPath.open('w', encoding="utf-8") as f:
+                json.dump({"rules_version": self.version, "canonical": self.canonical}, f, ensure_ascii=False)
+            os.replace(tmpPath, cachePath)
+        except OSError as ex:
+            # The cache only saves time, so a read-only install still answers queries
+            logger.debug(f"Couldn't save the firm name cache to {cachePath}: {ex}")
+            tmpPath.unlink(missing_ok=True)
+
+    def canonicalise_name(self, firm: str) -> str:
+        if firm not in self.canonical:
+            canonical = firm
+            for rule in self.rules:
+                canonical = rule.apply(canonical)
+            self.canonical[firm] = canonical
+            self.unsaved = True
+        return self.canonical[firm]
+
+    def canonicalise(self, firms: pd.Series) -> pd.Series:
+        """Returns the canonical form of every name in <firms>, working out each distinct name only once."""
+        import pandas as pd
+        codes, uniques = pd.factorize(firms)
+        canonical = pd.array([self.canonicalise_name(firm) for firm in uniques], dtype='string')
+        self.save()
+        return pd.Series(canonical.take(codes, allow_fill=True), index=firms.index, name=firms.name)
+
+def content_version(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()[:16]
+
+_versions: dict[Path, str] = {}
+
+def rules_version(path: Path = RULES_PATH) -> str:
+    """Returns the version of the rules at <path> without loading them, for keying anything worked out with them."""
+    if path not in _versions:
+        _versions[path] = content_version(path.read_bytes())
+    return _versions[path]
+
+_rules: FirmRules = None
+
+def default_cache_path() -> Path:
+    """Returns the cache file in the scrapes folder currently in use."""
+    from ttipabot import scraper
+    return scraper.CSV_FOLDER / CACHE_NAME
+
+def get_rules() -> FirmRules:
+    """Returns the rules from the rules file, loading them on first use so names are remembered across snapshots."""
+    global _rules
+    if _rules is None:
+        _rules = FirmRules.load(cachePath=default_cache_path)
+    return _rules
+
+def canonicalise(firms: pd.Series) -> pd.Series:
+    return get_rules().canonicalise(firms)
@@ -0,0 +1,104 @@
+"""Index of the periods each attorney was on the register with a given firm and registration,
+kept up to date as scrapes are added so lookups never need to read the csvs."""
+from pathlib import Path
+import sqlite3
+
+from ttipabot import firm_rules
+
+INDEX_NAME = "history.sqlite"
+COLUMNS = ['Name', 'Firm', 'Registered as', 'First seen', 'Last seen']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS intervals (name TEXT, firm TEXT, registered_as TEXT, first_seen TEXT, last_seen TEXT, canonical_firm TEXT);
+CREATE INDEX IF NOT EXISTS intervals_name ON intervals (name);
+CREATE INDEX IF NOT EXISTS intervals_firm ON intervals (firm);
+CREATE INDEX IF NOT EXISTS intervals_last_seen ON intervals (last_seen);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+def connect(dirPath: Path) -> sqlite3.Connection:
+    connection = sqlite3.connect(dirPath / INDEX_NAME)
+    connection.executescript(SCHEMA)
+    # Indexes built before firms were consolidated lack the column, which is filled in on the next update
+    columns = [row[1] for row in connection.execute("PRAGMA table_info(intervals)")]
+    if 'canonical_firm' not in columns:
+        connection.execute("ALTER TABLE intervals ADD COLUMN canonical_firm TEXT")
+    return connection
+
+def last_indexed_date(connection: sqlite3.Connection) -> str:
+    row = connection.execute("SELECT value FROM meta WHERE key = 'last_date'").fetchone()
+    return row[0] if row else ""
+
+def add_snapshot(connection: sqlite3.Connection, date: str, rows) -> None:
+    """Extends the intervals still open at the last indexed date that carry on in <rows>, and opens new ones for the rest.
+    <rows> are (name, firm, registered as) tuples, or None if the data is unchanged since the last indexed date."""
+    last = last_indexed_date(connection)
+    if rows is None:
+        connection.execute("UPDATE intervals SET last_seen = ? WHERE last_seen = ?", (date, last))
+    else:
+        open_intervals = {}
+        for rowid, *key in connection.execute("SELECT rowid, name, firm, registered_as FROM intervals WHERE last_seen = ?", (last,)):
+            open_intervals.setdefault(tuple(key), []).append(rowid)
+        extended, opened = [], []
+        for row in rows:
+            rowids = open_intervals.get(tuple(row))
+            if rowids:
+                extended.append((date, rowids.pop()))
+            else:
+                opened.append((*row, date, date))
+        connection.executemany("UPDATE intervals SET last_seen = ? WHERE rowid = ?", extended)
+        connection.executemany("INSERT INTO intervals VALUES (?, ?, ?, ?, ?, NULL)", opened)
+    connection.execute("INSERT OR REPLACE INTO meta VALUES ('last_date', ?)", (date,))
+
+def canonicalise_firms(connection: sqlite3.Connection, rules: firm_rules.FirmRules) -> None:
+    """Fills in the canonical firm of any intervals lacking one, redoing them all if the rules have changed."""
+    version = connection.execute("SELECT value FROM meta WHERE key = 'firm_rules_version'").fetchone()
+    if version is None or version[0] != rules.version:
+        connection.execute("UPDATE intervals SET canonical_firm = NULL")
+    firms = [row[0] for row in connection.execute("SELECT DISTINCT firm FROM intervals WHERE canonical_firm IS NULL")]
+    connection.executemany("UPDATE intervals SET canonical_firm = ? WHERE firm = ? AND canonical_firm IS NULL",
+                           [(rules.canonicalise_name(firm), firm) for firm in firms])
+    rules.save()
+    connection.execute("INSERT OR REPLACE INTO meta VALUES ('firm_rules_version', ?)", (rules.version,))
+
+def update_index(dirPath: Path, date_paths: dict[str, Path], load, rebuild: bool = False) -> int:
+    """Adds any dates in <date_paths> later than the last indexed date, loading snapshots with <load>.
+    Dates resolving to the same snapshot as the previous date are added without loading anything.
+    Returns the number of dates added."""
+    with connect(dirPath) as connection:
+        if rebuild:
+            connection.execute("DELETE FROM intervals")
+            connection.execute("DELETE FROM meta")
+        last = last_indexed_date(connection)
+        previous_path = date_paths.get(last)
+        added = 0
+        for date in sorted(date_paths):
+            if date <= last:
+                continue
+            path = date_paths[date]
+            if path == previous_path:
+                add_snapshot(connection, date, None)
+            else:
+                df = load(path)
+                add_snapshot(connection, date, df[['Name', 'Firm', 'Registered as']].itertuples(index=False, name=None))
+            previous_path = path
+            added += 1
+        canonicalise_firms(connection, firm_rules.get_rules())
+    connection.close()
+    return added
+
+def query(dirPath: Path, columns: list[str], pattern: str, order: str) -> list[tuple]:
+    """Returns the intervals where any of <columns> contains <pattern>, ignoring case."""
+    condition = " OR ".join(f"{column} LIKE ?" for column in columns)
+    with connect(dirPath) as connection:
+        rows = connection.execute(f"SELECT name, firm, registered_as, first_seen, last_seen FROM intervals "
+                                  f"WHERE {condition} ORDER BY {order}", [f"%{pattern}%"] * len(columns)).fetchall()
+    connection.close()
+    return rows
+
+def attorney_history(dirPath: Path, name: str) -> list[tuple]:
+    return query(dirPath, ["name"], name, "name, first_seen")
+
+def firm_history(dirPath: Path, firm: str) -> list[tuple]:
+    """Matches <firm> against both the firm as listed and its canonical form, so every spelling of a firm is found."""
+    return query(dirPath, ["firm", "canonical_firm"], firm, "first_seen, name")
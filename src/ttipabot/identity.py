@@ -0,0 +1,97 @@
+"""Pairs attorneys that left the register with attorneys that joined it, to find those who were renamed rather than replaced.
+Candidates are only compared within blocks sharing an email, email domain, phone number or surname, never all pairs."""
+from __future__ import annotations
+
+import re
+from collections import Counter
+from difflib import SequenceMatcher
+from typing import TYPE_CHECKING
+
+from ttipabot import firm_rules
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Blocks larger than this share a common value like a webmail domain, and would make the search close to all pairs
+MAX_BLOCK = 50
+# How alike two names at the same firm must be to be taken as a respelling of one name
+NAME_SIMILARITY = 0.85
+# Mailboxes that belong to a firm rather than an attorney
+GENERIC_MAILBOXES = {'info', 'admin', 'mail', 'email', 'office', 'reception', 'contact', 'enquiries', 'enquiry',
+                     'ip', 'patents', 'trademarks', 'records', 'general'}
+# Trailing digits of a phone number compared, so local and international formats of a number agree
+PHONE_DIGITS = 8
+
+def phone_key(phone: str) -> str:
+    digits = re.sub(r"\D", "", phone)
+    return digits[-PHONE_DIGITS:] if len(digits) >= PHONE_DIGITS else ""
+
+def name_tokens(name: str) -> list[str]:
+    return re.findall(r"[a-z]+", name.lower())
+
+def records(df: pd.DataFrame) -> list[tuple]:
+    """Returns the normalised (name tokens, email, phone, canonical firm) of each row of <df>."""
+    firms = firm_rules.canonicalise(df['Firm'].fillna('')).tolist()
+    return [(name_tokens(name), email.strip().lower(), phone_key(phone), firm)
+            for name, email, phone, firm in zip(df['Name'].fillna(''), df['Email'].fillna(''), df['Phone'].fillna(''), firms)]
+
+def block_keys(record: tuple) -> list[tuple]:
+    tokens, email, phone, _ = record
+    keys = []
+    if email:
+        keys += [('email', email), ('domain', email.partition('@')[2])]
+    if phone:
+        keys.append(('phone', phone))
+    if tokens:
+        keys.append(('surname', tokens[-1]))
+    return keys
+
+def score_pair(left: tuple, right: tuple, personalEmails: set[str]) -> float:
+    """Returns how likely two records are the same attorney under different names, or 0 if they shouldn't be paired.
+    A pair needs the same personal email, the same phone and a name in common, or a near identical name at the same firm."""
+    leftTokens, leftEmail, leftPhone, leftFirm = left
+    rightTokens, rightEmail, rightPhone, rightFirm = right
+    sameEmail = bool(leftEmail) and leftEmail == rightEmail and leftEmail in personalEmails
+    samePhone = bool(leftPhone) and leftPhone == rightPhone
+    sameFirm = bool(leftFirm) and leftFirm == rightFirm
+    similarity = SequenceMatcher(None, " ".join(leftTokens), " ".join(rightTokens)).ratio()
+    sharesName = bool(set(leftTokens) & set(rightTokens))
+    if sameEmail or (samePhone and sharesName) or (sameFirm and similarity >= NAME_SIMILARITY):
+        return sameEmail + samePhone + sameFirm + similarity
+    return 0.0
+
+def find_renames(left: pd.DataFrame, right: pd.DataFrame) -> list[tuple[int, int]]:
+    """Pairs rows of <left> (attorneys no longer listed) with rows of <right> (attorneys newly listed) that look like
+    the same attorney under a new name. Returns (left position, right position) pairs, each row used at most once."""
+    leftRecords, rightRecords = records(left), records(right)
+    # An email listed for more than one attorney on either side, or a firm's mailbox, identifies nobody
+    leftEmails = Counter(record[1] for record in leftRecords)
+    rightEmails = Counter(record[1] for record in rightRecords)
+    personalEmails = {email for email, count in leftEmails.items()
+                      if count == 1 and rightEmails[email] == 1 and email.partition('@')[0] not in GENERIC_MAILBOXES}
+
+    blocks: dict[tuple, list[int]] = {}
+    for j, record in enumerate(rightRecords):
+        for key in block_keys(record):
+            blocks.setdefault(key, []).append(j)
+
+    scored = []
+    for i, record in enumerate(leftRecords):
+        candidates = set()
+        for key in block_keys(record):
+            block = blocks.get(key, ())
+            if len(block) <= MAX_BLOCK:
+                candidates.update(block)
+        for j in candidates:
+            score = score_pair(record, rightRecords[j], personalEmails)
+            if score:
+                scored.append((score, i, j))
+
+    # Best pairs first, so each attorney goes to their most likely match
+    pairs, usedLeft, usedRight = [], set(), set()
+    for score, i, j in sorted(scored, key=lambda pair: -pair[0]):
+        if i not in usedLeft and j not in usedRight:
+            pairs.append((i, j))
+            usedLeft.add(i)
+            usedRight.add(j)
+    return sorted(pairs)
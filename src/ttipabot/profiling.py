@@ -0,0 +1,151 @@
+"""Timings, row counts and byte counts for each stage of a scrape or analysis, collected only while profiling is on.
+Stage times are exclusive: time spent in a stage nested inside another only counts towards the inner one."""
+from __future__ import annotations
+
+import datetime
+import json
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
+
+class Profile:
+    """Totals for each stage of one run. Stages can run on several threads at once, in which case their times add up."""
+
+    def __init__(self, command: str = "", cprofile: bool = False):
+        self.command = command
+        self.started = datetime.datetime.now().isoformat(timespec='seconds')
+        self.start = time.perf_counter()
+        self.stages: dict[str, dict] = {}
+        self.lock = threading.Lock()
+        # Each thread's open stages, as [name, time spent in nested stages]
+        self.local = threading.local()
+        self.profiler = None
+        if cprofile:
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def stack(self) -> list:
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+    def enter(self, name: str) -> None:
+        self.stack().append([name, 0.0])
+
+    def exit(self, elapsed: float, rows: int = 0, size: int = 0) -> None:
+        stack = self.stack()
+        name, nested = stack.pop()
+        if stack:
+            stack[-1][1] += elapsed
+        with self.lock:
+            totals = self.stages.setdefault(name, {"calls": 0, "seconds": 0.0, "rows": 0, "bytes": 0})
+            totals["seconds"] += elapsed - nested
+            totals["rows"] += rows
+            totals["bytes"] += size
+
+    def count(self, name: str) -> None:
+        with self.lock:
+            self.stages.setdefault(name, {"calls": 0, "seconds": 0.0, "rows": 0, "bytes": 0})["calls"] += 1
+
+    def stop(self) -> float:
+        if self.profiler is not None:
+            self.profiler.disable()
+        return time.perf_counter() - self.start
+
+    def record(self) -> dict:
+        """Returns the run as a JSON serialisable record."""
+        return {"command": self.command, "started": self.started, "seconds": round(time.perf_counter() - self.start, 6),
+                "stages": {name: {**totals, "seconds": round(totals["seconds"], 6)} for name, totals in self.stages.items()}}
+
+    def report(self) -> str:
+        """Returns a table of the time, rows and bytes of each stage."""
+        total = time.perf_counter() - self.start
+        lines = [f"{'Stage':<10} {'Time (ms)':>10} {'Share':>6} {'Calls':>6} {'Rows':>8} {'Bytes':>12}"]
+        for name, totals in self.stages.items():
+            share = totals["seconds"] / total * 100 if total else 0
+            lines.append(f"{name:<10} {totals['seconds'] * 1000:>10.1f} {share:>5.1f}% {totals['calls']:>6} {totals['rows']:>8} {totals['bytes']:>12}")
+        # Time outside any stage, like imports and argument parsing
+        other = total - sum(totals["seconds"] for totals in self.stages.values())
+        lines.append(f"{'other':<10} {other * 1000:>10.1f} {other / total * 100 if total else 0:>5.1f}%")
+        lines.append(f"{'total':<10} {total * 1000:>10.1f}")
+        return "\n".join(lines)
+
+    def dump_stats(self, path: Path) -> None:
+        """Writes the cProfile stats of the run, for loading with pstats."""
+        self.profiler.dump_stats(path)
+
+_active: Profile = None
+
+def start(command: str = "", cprofile: bool = False) -> Profile:
+    """Starts collecting stage timings, and if <cprofile> a full cProfile of the run."""
+    global _active
+    _active = Profile(command, cprofile)
+    return _active
+
+def stop() -> Profile:
+    global _active
+    profile, _active = _active, None
+    if profile is not None:
+        profile.stop()
+    return profile
+
+def active() -> Profile:
+    return _active
+
+class Stage:
+    """An open stage, for recording the rows and bytes it handled."""
+    __slots__ = ("rows", "bytes")
+
+    def __init__(self):
+        self.rows = 0
+        self.bytes = 0
+
+@contextmanager
+def _stage(profile: Profile, name: str) -> Iterator[Stage]:
+    record = Stage()
+    profile.count(name)
+    profile.enter(name)
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        profile.exit(time.perf_counter() - start, record.rows, record.bytes)
+
+_idle = nullcontext(Stage())
+
+def stage(name: str):
+    """Times the enclosed block as stage <name> while profiling, and does nothing otherwise."""
+    if _active is None:
+        return _idle
+    return _stage(_active, name)
+
+def iterate(name: str, iterable: Iterable, size: Callable = None) -> Iterable:
+    """Times producing each item of <iterable> as stage <name> while profiling, counting the items and, with <size>,
+    their total size in bytes. Suits streamed stages, whose work happens a piece at a time as they're consumed."""
+    if _active is None:
+        return iterable
+    return _iterate(_active, name, iter(iterable), size)
+
+def _iterate(profile: Profile, name: str, iterator: Iterator, size: Callable) -> Iterator:
+    profile.count(name)
+    while True:
+        profile.enter(name)
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            profile.exit(time.perf_counter() - start)
+            return
+        except BaseException:
+            profile.exit(time.perf_counter() - start)
+            raise
+        profile.exit(time.perf_counter() - start, 1, size(item) if size else 0)
+        yield item
+
+def append_record(profile: Profile, path: Path) -> None:
+    """Appends the run to <path> as a line of JSON, so runs can be compared over time."""
+    with open(path, 'a', encoding="utf-8") as f:
+        f.write(json.dumps(profile.record()) + "\n")
@@ -0,0 +1,90 @@
+"""Registration types and jurisdiction of each attorney packed into the bits of one small integer, worked out once
+per snapshot, so filtering attorneys is integer masking rather than matching strings."""
+from __future__ import annotations
+
+import re
+from typing import TYPE_CHECKING
+
+# numpy and pandas are imported where used, as store imports this module and listing snapshots shouldn't need them
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
+
+MASK_COLUMN = 'Registration mask'
+# Columns the mask is worked out from, when a snapshot doesn't have it stored
+SOURCE_COLUMNS = ['Registered as', 'Address']
+
+# Bits for each registration type, as named in the Registered as column
+PATENTS = 1
+TRADE_MARKS = 2
+TYPE_BITS = {'Patents': PATENTS, 'Trade marks': TRADE_MARKS}
+
+# Bits for the jurisdiction an attorney is based in, going by their address. Attorneys based overseas,
+# or with addresses too short to tell, have neither.
+AU = 1 << 4
+NZ = 1 << 5
+JURISDICTION_BITS = {'AU': AU, 'NZ': NZ}
+# State abbreviations are matched in capitals only, so words like 'was' or 'act' don't count, and like state names
+# only next to a postcode or 'Australia' or at the end of the address, so streets named after them don't count either
+AU_STATES = r"(?:NSW|VIC|Vic|QLD|Qld|SA|WA|TAS|Tas|ACT|NT|(?i:New South Wales|Victoria|Queensland|Tasmania" \
+            r"|Northern Territory|Australian Capital Territory))"
+JURISDICTION_PATTERNS = [
+    (NZ, re.compile(r"New Zealand|\bAuckland\b|\bChristchurch\b", re.IGNORECASE)),
+    # Addresses naming another country are overseas, whatever cities or states they share names with
+    (0, re.compile(r"\b(United Kingdom|UK|Great Britain|England|Scotland|United States?|USA|Canada|Singapore|Hong Kong"
+                   r"|China|Japan|Korea|Taiwan|Germany|France|Switzerland|Austria|Sweden|Norway|Denmark|Ireland"
+                   r"|Luxembourg|Philippines?|Malaysia|Chile|Cyprus|India|Netherlands|Belgium|Italy|Spain)\b", re.IGNORECASE)),
+    (AU, re.compile(r"(?i:\bAustralia\b)|\b\d{4},?\s+" + AU_STATES + r"\b|\b" + AU_STATES
+                    + r"(?:,?\s+\d{4}\b|,?\s+(?i:Australia)\b|\W*$)"
+                    r"|(?i:\b(Sydney|Melbourne|Brisbane|Perth|Adelaide|Hobart|Canberra|Darwin)\b)")),
+]
+
+def types_bits(registeredAs: str) -> int:
+    """Returns the bits of the registration types listed in a Registered as value, like 'Patents, Trade marks'."""
+    bits = 0
+    for name in registeredAs.split(','):
+        bits |= TYPE_BITS.get(name.strip(), 0)
+    return bits
+
+def jurisdiction_bits(address: str) -> int:
+    for bits, pattern in JURISDICTION_PATTERNS:
+        if pattern.search(address):
+            return bits
+    return 0
+
+def unique_bits(values: pd.Series, bits_of) -> np.ndarray:
+    """Applies <bits_of> to each distinct value only, as a snapshot repeats a handful of them."""
+    import numpy as np
+    import pandas as pd
+    codes, uniques = pd.factorize(values)
+    table = np.fromiter((bits_of(value) for value in uniques.astype(str)), dtype=np.uint8, count=len(uniques))
+    # Missing values are coded -1, and have no bits
+    return np.where(codes >= 0, table.take(codes, mode='clip'), 0).astype(np.uint8)
+
+def compute_mask(df: pd.DataFrame) -> np.ndarray:
+    """Returns the mask of each attorney in <df>, with jurisdiction bits only if it has an Address column."""
+    mask = unique_bits(df['Registered as'], types_bits)
+    if 'Address' in df.columns:
+        mask |= unique_bits(df['Address'], jurisdiction_bits)
+    return mask
+
+def with_mask(df: pd.DataFrame, columns: list[str]) -> pd.DataFrame:
+    """Returns <columns> of <df>, with the mask worked out from the source columns it holds."""
+    return df.assign(**{MASK_COLUMN: compute_mask(df)})[columns]
+
+def source_columns(columns: list[str]) -> list[str]:
+    """Returns the columns to load in place of <columns> to work out the mask from them."""
+    columns = [column for column in columns if column != MASK_COLUMN]
+    return columns + [column for column in SOURCE_COLUMNS if column not in columns]
+
+def required_bits(pat: bool, tm: bool) -> int:
+    return (PATENTS if pat else 0) | (TRADE_MARKS if tm else 0)
+
+def select(mask: np.ndarray, required: int = 0, jurisdiction: str = None) -> np.ndarray:
+    """Returns which attorneys have all the <required> registration type bits, and are based in <jurisdiction> if given."""
+    rows = (mask & required) == required
+    if jurisdiction is not None:
+        if jurisdiction not in JURISDICTION_BITS:
+            raise ValueError("Invalid jurisdiction.")
+        rows &= (mask & JURISDICTION_BITS[jurisdiction]) != 0
+    return rows
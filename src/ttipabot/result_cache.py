@@ -0,0 +1,143 @@
+"""Outputs of comparisons and rankings already worked out, so asking the same question again loads nothing.
+Entries are keyed by the content of the snapshots involved rather than their dates, so every date aliased
+to a snapshot by the date table shares the same entries."""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from pathlib import Path
+
+from ttipabot import deltas, firm_rules, scraper
+
+# Changed whenever the output for the same question changes, so older entries on disk are never used
+CACHE_VERSION = 2
+# Outputs kept in memory
+MEMORY_ENTRIES = 256
+# Bytes of outputs kept on disk by default, when outputs are kept on disk at all
+DISK_BYTES = 64 * 1024 * 1024
+SUFFIX = ".result"
+
+# Content hash of each version of a snapshot file already hashed, keyed by path, modification time and size
+_digests: dict[tuple, str] = {}
+# Hash index of each scrapes folder as last read, with the modification time and size it was read at
+_indexes: dict[Path, tuple[tuple, dict[str, str]]] = {}
+
+def recorded_digests(dirPath: Path) -> tuple[int, dict[str, str]]:
+    """Returns when the hash index of <dirPath> was last written and the digests it records, reading it again
+    only once it has changed."""
+    try:
+        stat = (dirPath / "hash_index.txt").stat()
+    except OSError:
+        return 0, {}
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    if dirPath not in _indexes or _indexes[dirPath][0] != stamp:
+        _indexes[dirPath] = (stamp, scraper.read_hash_index(dirPath))
+    return stat.st_mtime_ns, _indexes[dirPath][1]
+
+def content_key(path: Path) -> str:
+    """Returns the SHA-256 of a snapshot file. Stored snapshots use the digest recorded in the hash index,
+    which deltas keep from the csv they replaced, and any other file is hashed once per version."""
+    stat = path.stat()
+    written, index = recorded_digests(path.parent)
+    date = scraper.filepaths_to_dates([path])[0]
+    # A csv rewritten since the index was last written may no longer match what it records, while deltas are
+    # written after the digest of the csv they replace is recorded, and never rewritten
+    if date in index and (deltas.is_delta(path) or stat.st_mtime_ns <= written):
+        return index[date]
+    key = (str(path), stat.st_mtime_ns, stat.st_size)
+    if key not in _digests:
+        _digests[key] = scraper.hash_file(path)
+    return _digests[key]
+
+def make_key(kind: str, paths: list[Path], *args) -> str:
+    """Returns the key of a <kind> of output from the snapshots at <paths> with the other arguments <args>.
+    Outputs depending on firm names also depend on the firm rules, so the rules version is part of every key."""
+    parts = [CACHE_VERSION, kind, [content_key(path) for path in paths], firm_rules.rules_version(), *args]
+    return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()
+
+class ResultCache:
+    """The <size> most recently used outputs in memory, in front of an optional folder at <dirPath>
+    holding those used most recently up to <maxBytes>."""
+
+    def __init__(self, size: int = MEMORY_ENTRIES, dirPath: Path = None, maxBytes: int = DISK_BYTES):
+        self.size = size
+        self.dirPath = dirPath
+        self.maxBytes = maxBytes
+        self.entries: OrderedDict[str, str] = OrderedDict()
+
+    def get(self, key: str) -> str | None:
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        if self.dirPath is None:
+            return None
+        path = self.dirPath / f"{key}{SUFFIX}"
+        try:
+            output = path.read_text(encoding="utf-8")
+            # The modification time orders eviction, so reading an entry marks it as recently used
+            os.utime(path)
+        except OSError:
+            return None
+        self.remember(key, output)
+        return output
+
+    def put(self, key: str, output: str) -> None:
+        self.remember(key, output)
+        if self.dirPath is not None:
+            self.write(key, output)
+
+    def remember(self, key: str, output: str) -> None:
+        self.entries[key] = output
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def write(self, key: str, output: str) -> None:
+        self.dirPath.mkdir(parents=True, exist_ok=True)
+        path = self.dirPath / f"{key}{SUFFIX}"
+        # Write then rename, with a file per process, so a reader or a concurrent batch worker never sees a partial entry
+        tmpPath = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmpPath.write_text(output, encoding="utf-8")
+        os.replace(tmpPath, path)
+        self.evict()
+
+    def evict(self) -> None:
+        """Removes the least recently used outputs on disk until the rest fit in <maxBytes>."""
+        files = []
+        for path in self.dirPath.glob(f"*{SUFFIX}"):
+            try:
+                stat = path.stat()
+            except OSError:
+                # Evicted by another process meanwhile
+                continue
+            files.append((stat.st_mtime_ns, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.maxBytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def clear(self) -> None:
+        self.entries.clear()
+        if self.dirPath is not None:
+            for path in self.dirPath.glob(f"*{SUFFIX}"):
+                path.unlink(missing_ok=True)
+
+_cache: ResultCache = None
+
+def get_cache() -> ResultCache:
+    """Returns the cache for this process, keeping outputs on disk too if TTIPABOT_RESULT_CACHE names a folder,
+    up to TTIPABOT_RESULT_CACHE_MB megabytes."""
+    global _cache
+    if _cache is None:
+        dirPath = os.environ.get("TTIPABOT_RESULT_CACHE")
+        maxBytes = int(os.environ.get("TTIPABOT_RESULT_CACHE_MB", DISK_BYTES // 2 ** 20)) * 2 ** 20
+        _cache = ResultCache(dirPath=Path(dirPath) if dirPath else None, maxBytes=maxBytes)
+    return _cache
+
+def set_cache(cache: ResultCache) -> None:
+    global _cache
+    _cache = cache
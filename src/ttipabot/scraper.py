@@ -1,38 +1,87 @@
+from __future__ import annotations
+
 import datetime
 import csv
 from pathlib import Path
 import logging
-from filecmp import cmp
 import os
+import codecs
+import hashlib
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator, TYPE_CHECKING
+
+from ttipabot import store, deltas, history, profiling
+from ttipabot.catalogue import DateCatalogue, parse_date_spec
 
-import requests
-from bs4 import BeautifulSoup
+# The network and HTML libraries are only imported by the functions that scrape, so that
+# listing and resolving dates stays cheap for the cli
+if TYPE_CHECKING:
+    import requests
+    from bs4 import BeautifulSoup
 
 logger = logging.getLogger(__name__)
 
 #TODO Refactor directory lookup to avoid using global
-CSV_FOLDER = Path(__file__).parents[0] / "scrapes"
+CSV_FOLDER = Path(os.environ.get("TTIPABOT_SCRAPES", Path(__file__).parents[0] / "scrapes"))
+# Bytes read from the register response at a time when streaming
+CHUNK_SIZE = 64 * 1024
+# Public API endpoint as determined by Inspect Element > Network > Requests on Google Chrome
+REGISTER_URL = "https://www.ttipattorney.gov.au//sxa/search/results/"
+# Seconds to wait for each page of a paged scrape, as (connect, read)
+PAGE_TIMEOUT = (10, 60)
+# Seconds before the first retry of a failed page, doubling after each further failure
+RETRY_BACKOFF = 1.0
+# Everything in a register response before its results is query timing, which differs on every request
+RESULTS_MARKER = b'"Results":'
+# Bytes of a response held in memory while it is checked against the last scrape, beyond which it spools to disk
+SPOOL_SIZE = 16 * 1024 * 1024
+# What was recorded about the register response at the last scrape, for telling whether the register has changed
+FINGERPRINT_FILE = "register_fingerprint.txt"
+
+# Catalogues of the scrapes folders already listed, keyed by folder
+_catalogues: dict[Path, DateCatalogue] = {}
 
-def scrape_register() -> bool:
+def scrape_register(pageSize: int = 0, workers: int = 4) -> bool:
+    """Scrapes the register in a single streamed request, or in pages of <pageSize> fetched by <workers> threads."""
     if check_already_scraped(CSV_FOLDER): return False
-    results = get_full_register()
-    data = parse_register(results)
-    write_to_csv(data)
-    # Avoid keeping sequences of multiple identical csvs, but record them in a table
-    clean_csvs(recentOnly=True, dirPath=CSV_FOLDER)
+    fingerprint = {}
+    if pageSize > 0:
+        data = get_register_paged(pageSize, workers)
+    else:
+        data, fingerprint = scrape_register_if_changed(CSV_FOLDER)
+    if data is None:
+        map_unchanged_scrape(CSV_FOLDER)
+    else:
+        write_to_csv(data)
+        with profiling.stage("clean"):
+            # Avoid keeping sequences of multiple identical csvs, but record them in a table
+            clean_csvs(recentOnly=True, dirPath=CSV_FOLDER)
+            keyframeInterval = read_keyframe_interval(CSV_FOLDER)
+            if keyframeInterval > 0:
+                pack_csvs(keyframeInterval, CSV_FOLDER)
+    if fingerprint:
+        write_fingerprint(CSV_FOLDER, fingerprint)
+    with profiling.stage("history"):
+        update_history(CSV_FOLDER)
     return True
 
-def ttipab_request(count: int):
-    """Makes a GET request to the TTIPA register asking for <count> results."""
-    # Public API endpoint as determined by Inspect Element > Network > Requests on Google Chrome
-    urlBase = "https://www.ttipattorney.gov.au//sxa/search/results/"
-    urlOptions1 = "?s={21522AF6-8499-4C63-8CFA-02E2B97737BE}&itemid={8B94FE47-304A-4629-AD46-DD208EEF71AA}&sig=als&e=0&p="
+def register_url(count: int, offset: int = 0) -> str:
+    """Returns the register search URL for <count> results starting from result number <offset>."""
+    urlOptions1 = "?s={21522AF6-8499-4C63-8CFA-02E2B97737BE}&itemid={8B94FE47-304A-4629-AD46-DD208EEF71AA}&sig=als"
     urlOptions2 = "&v=%7B2FCA44D4-EE00-43EC-BBBF-858C31387413%7D"
-    url =  f"{urlBase}{urlOptions1}{count}{urlOptions2}"
-    return requests.get(url, stream=True)
+    return f"{REGISTER_URL}{urlOptions1}&e={offset}&p={count}{urlOptions2}"
 
-def get_full_register() -> list[BeautifulSoup]:
-    """Scrapes the register, cleans the HTML, and returns a list of Soup objects representing attorneys."""
+def ttipab_request(count: int, offset: int = 0, session: requests.Session = None, timeout=None, headers: dict = None):
+    """Makes a GET request to the TTIPA register asking for <count> results."""
+    import requests
+    get = session.get if session is not None else requests.get
+    with profiling.stage("request"):
+        return get(register_url(count, offset), stream=True, timeout=timeout, headers=headers)
+
+def get_register_html() -> str:
+    """Scrapes the register and returns the HTML with escaped control characters removed."""
     
     try:
         #Do an intial ping of the register to determine the total number of results to be requested
@@ -50,6 +99,222 @@ def get_full_register() -> list[BeautifulSoup]:
     rawHTML = rawHTML.replace("\\r", "")
     rawHTML = rawHTML.replace("\\n", "")
     rawHTML = rawHTML.replace("\\", "")
+    return rawHTML
+
+def stream_register_html(chunkSize: int = CHUNK_SIZE) -> Iterator[str]:
+    """Scrapes the register, yielding the cleaned HTML in chunks as it downloads."""
+    try:
+        initialResponse = ttipab_request(1)
+        resultsCount = initialResponse.json().get("Count")
+        with ttipab_request(resultsCount) as response:
+            yield from iter_register_html(response, chunkSize)
+        logger.debug(f"Successfully scraped {resultsCount} results from the register.")
+    except Exception as ex:
+        logger.error("Failed to scrape register, could be a server-side problem.", exc_info= ex)
+        raise ex
+
+def iter_register_html(response: requests.Response, chunkSize: int = CHUNK_SIZE) -> Iterator[str]:
+    """Decodes and unescapes a streamed register response without holding the whole body in memory."""
+    chunks = profiling.iterate("download", response.iter_content(chunkSize), len)
+    return unescape_register(chunks, response.encoding or "utf-8")
+
+def unescape_register(chunks: Iterable[bytes], encoding: str) -> Iterator[str]:
+    """Decodes and unescapes the bytes of a register response."""
+    return profiling.iterate("unescape", unescape_stream(decode_stream(chunks, encoding)), len)
+
+def decode_stream(chunks: Iterable[bytes], encoding: str) -> Iterator[str]:
+    """Incrementally decodes bytes, so multi-byte characters split between chunks survive."""
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    for chunk in chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    text = decoder.decode(b"", final=True)
+    if text:
+        yield text
+
+def replace_stream(chunks: Iterable[str], old: str, new: str) -> Iterator[str]:
+    """Equivalent of str.replace over a stream, holding back any match split between chunks."""
+    carry = ""
+    for chunk in chunks:
+        text = carry + chunk
+        cut = max(len(text) - len(old) + 1, 0)
+        # Move the cut past any match that straddles it, following str.replace's left to right matching
+        start = text.find(old)
+        while start != -1 and start < cut:
+            end = start + len(old)
+            if end > cut:
+                cut = end
+                break
+            start = text.find(old, end)
+        if cut:
+            yield text[:cut].replace(old, new)
+        carry = text[cut:]
+    if carry:
+        yield carry.replace(old, new)
+
+def unescape_stream(chunks: Iterable[str]) -> Iterator[str]:
+    """Streaming version of the control character clean up in get_register_html."""
+    chunks = replace_stream(chunks, "\\r", "")
+    chunks = replace_stream(chunks, "\\n", "")
+    return (chunk.replace("\\", "") for chunk in chunks)
+
+class ResponseFingerprint:
+    """Hashes a register response as it streams past, from the start of its results on, so that two responses
+    listing the same results have the same fingerprint. A response without the usual results field is hashed whole."""
+
+    def __init__(self):
+        self.digest = hashlib.sha256()
+        self.head = b""
+        self.found = False
+
+    def update(self, chunk: bytes) -> None:
+        if self.found:
+            self.digest.update(chunk)
+            return
+        # The marker could be split between chunks, so hold the head of the response until it turns up
+        self.head += chunk
+        start = self.head.find(RESULTS_MARKER)
+        if start != -1 or len(self.head) > CHUNK_SIZE:
+            self.digest.update(self.head[max(start, 0):])
+            self.head = b""
+            self.found = True
+
+    def stream(self, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        for chunk in chunks:
+            self.update(chunk)
+            yield chunk
+
+    def hexdigest(self) -> str:
+        if not self.found:
+            self.digest.update(self.head)
+            self.head = b""
+            self.found = True
+        return self.digest.hexdigest()
+
+def read_fingerprint(dirPath: Path) -> dict[str, str]:
+    """Returns the date, result count and fingerprint of the register response at the last scrape,
+    and any ETag or Last-Modified validators the server sent with it."""
+    path = dirPath / FINGERPRINT_FILE
+    d = {}
+    if not path.exists():
+        return d
+    with open(path, 'r', encoding="utf-8") as f:
+        for line in f:
+            (key, val) = line.split(" : ", 1)
+            d[key] = val.strip()
+    return d
+
+def write_fingerprint(dirPath: Path, fingerprint: dict[str, str]) -> None:
+    with open(dirPath / FINGERPRINT_FILE, 'w', encoding="utf-8") as f:
+        for key, val in fingerprint.items():
+            if val:
+                f.write(f"{key} : {val}\n")
+
+def last_fingerprint(dirPath: Path) -> dict[str, str]:
+    """Returns the fingerprint recorded at the last scrape, or nothing if that wasn't the latest date with data
+    (like a paged scrape since, which records none) or its data is no longer stored."""
+    fingerprint = read_fingerprint(dirPath)
+    catalogue = get_catalogue(dirPath)
+    if not catalogue.dates or fingerprint.get("date") != catalogue.dates[-1]:
+        return {}
+    if not catalogue.path(fingerprint["date"]).exists():
+        return {}
+    return fingerprint
+
+def scrape_register_if_changed(dirPath: Path = CSV_FOLDER) -> tuple[list[list[str]] | None, dict[str, str]]:
+    """Scrapes the register in a single streamed request, unless its response is the same as at the last scrape.
+    Returns the parsed data, or None if the register is unchanged, and the fingerprint of the response.
+    A change in the result count means the register has changed, so the response is parsed as it downloads.
+    Otherwise the server is asked for the response only if modified, and the response is spooled and fingerprinted
+    and only parsed if its fingerprint differs from the last scrape's."""
+    import requests
+    previous = last_fingerprint(dirPath)
+    try:
+        initialResponse = ttipab_request(1)
+        initialResponse.raise_for_status()
+        resultsCount = initialResponse.json().get("Count")
+        fingerprint = {"date": today(), "count": str(resultsCount)}
+        sameCount = previous.get("count") == fingerprint["count"]
+        headers = {}
+        if sameCount and "etag" in previous:
+            headers["If-None-Match"] = previous["etag"]
+        if sameCount and "last_modified" in previous:
+            headers["If-Modified-Since"] = previous["last_modified"]
+        with ttipab_request(resultsCount, headers=headers) as response:
+            if response.status_code == 304:
+                logger.debug(f"Register not modified since {previous['date']}.")
+                return None, {**previous, "date": fingerprint["date"]}
+            # Anything but the register itself, like an error page, must not be taken for an empty register
+            response.raise_for_status()
+            if response.status_code != 200:
+                raise requests.HTTPError(f"Unexpected status {response.status_code} from the register", response=response)
+            fingerprint["etag"] = response.headers.get("ETag", "")
+            fingerprint["last_modified"] = response.headers.get("Last-Modified", "")
+            encoding = response.encoding or "utf-8"
+            hasher = ResponseFingerprint()
+            chunks = hasher.stream(profiling.iterate("download", response.iter_content(CHUNK_SIZE), len))
+            if not sameCount:
+                data = parse_register_html(unescape_register(chunks, encoding))
+            else:
+                with tempfile.SpooledTemporaryFile(SPOOL_SIZE) as spool:
+                    for chunk in chunks:
+                        spool.write(chunk)
+                    if hasher.hexdigest() == previous.get("fingerprint"):
+                        logger.debug(f"Register unchanged since {previous['date']}, skipped parsing {resultsCount} results.")
+                        return None, {**fingerprint, "fingerprint": hasher.hexdigest()}
+                    spool.seek(0)
+                    data = parse_register_html(unescape_register(iter(lambda: spool.read(CHUNK_SIZE), b""), encoding))
+            fingerprint["fingerprint"] = hasher.hexdigest()
+        logger.debug(f"Successfully scraped {resultsCount} results from the register.")
+    except Exception as ex:
+        logger.error("Failed to scrape register, could be a server-side problem.", exc_info= ex)
+        raise ex
+    return data, fingerprint
+
+def map_unchanged_scrape(dirPath: Path) -> None:
+    """Records today in the date table against the date holding the data of the last scrape, which it repeats."""
+    catalogue = get_catalogue(dirPath)
+    original = filepaths_to_dates([catalogue.path(catalogue.dates[-1])])[0]
+    append_to_date_table(dirPath, [today(), original])
+
+def get_register_page(session: requests.Session, offset: int, count: int, retries: int = 3) -> list[list[str]]:
+    """Fetches and parses one page of the register, retrying with backoff if the request fails."""
+    import requests
+    for attempt in range(retries + 1):
+        try:
+            with ttipab_request(count, offset, session, PAGE_TIMEOUT) as response:
+                response.raise_for_status()
+                return parse_register_html(iter_register_html(response))
+        except requests.RequestException as ex:
+            if attempt == retries:
+                logger.error(f"Failed to scrape results {offset} to {offset + count} after {retries} retries.", exc_info=ex)
+                raise ex
+            logger.debug(f"Retrying results {offset} to {offset + count} after error: {ex}")
+            time.sleep(RETRY_BACKOFF * 2 ** attempt)
+
+def get_register_paged(pageSize: int, workers: int = 4, retries: int = 3) -> list[list[str]]:
+    """Scrapes the register as pages fetched concurrently over a shared session, merged back in register order."""
+    import requests
+    from requests.adapters import HTTPAdapter
+    with requests.Session() as session:
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        with ttipab_request(1, session=session, timeout=PAGE_TIMEOUT) as response:
+            resultsCount = response.json().get("Count")
+        offsets = range(0, resultsCount, pageSize)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # map yields pages in offset order regardless of which finishes first
+            pages = executor.map(lambda offset: get_register_page(session, offset, pageSize, retries), offsets)
+            data = [row for page in pages for row in page]
+    logger.debug(f"Successfully scraped {resultsCount} results from the register in {len(offsets)} pages.")
+    return data
+
+def get_full_register() -> list[BeautifulSoup]:
+    """Scrapes the register, cleans the HTML, and returns a list of Soup objects representing attorneys."""
+    from bs4 import BeautifulSoup
+    rawHTML = get_register_html()
 
     # Parse and extract all the data
     soup = BeautifulSoup(rawHTML, 'lxml')
@@ -79,14 +344,125 @@ def parse_register(attorneys: list[BeautifulSoup]) -> list[list[str]]:
             if get_contact_data(attorney, " Attorney ") != ""]
     return data
 
+class RegisterTarget:
+    """lxml parser target that extracts attorney rows in a single pass over the register HTML.
+    
+    Mirrors get_contact_data: the first span whose only content is a field label marks the field,
+    and the stripped strings of the element that follows it are comma joined as the value."""
+    
+    fields = [" Attorney ", " Phone ", " Email ", " Firm ", " Address ", " Registered as"]
+
+    def __init__(self):
+        self.rows = []
+        # One entry per open element: [tag, child count, text children]
+        self.stack = []
+        self.text = []
+        self.attorneyDepth = None
+        self.values = {}
+        # Label waiting for its next sibling, and the depth of the shared parent
+        self.pending = None
+        # Label being captured, the depth of the value element and the strings seen so far
+        self.capture = None
+
+    def flush(self) -> None:
+        """Treat buffered data as a single text node, as BeautifulSoup would."""
+        if not self.text:
+            return
+        text = "".join(self.text)
+        self.text = []
+        if self.stack:
+            self.stack[-1][1] += 1
+            self.stack[-1][2].append(text)
+        if self.capture is not None and text.strip():
+            self.capture[2].append(text.strip())
+
+    def start(self, tag, attrib) -> None:
+        self.flush()
+        if self.stack:
+            self.stack[-1][1] += 1
+        if self.pending is not None and len(self.stack) == self.pending[1]:
+            self.capture = (self.pending[0], len(self.stack) + 1, [])
+            self.pending = None
+        self.stack.append([tag, 0, []])
+        if self.attorneyDepth is None and tag == "div" and attrib.get("class") == "list-item attorney":
+            self.attorneyDepth = len(self.stack)
+            self.values = {}
+
+    def end(self, tag) -> None:
+        self.flush()
+        depth = len(self.stack)
+        element = self.stack.pop()
+        if self.attorneyDepth is None:
+            return
+        if self.capture is not None and depth == self.capture[1]:
+            self.values[self.capture[0]] = ", ".join(self.capture[2])
+            self.capture = None
+        elif self.pending is not None and depth == self.pending[1]:
+            # Parent closed before the label had a sibling
+            self.pending = None
+        if element[0] == "span" and self.capture is None and element[1] == 1 and len(element[2]) == 1:
+            label = element[2][0]
+            if label in self.fields and label not in self.values:
+                self.values[label] = ""
+                self.pending = (label, depth - 1)
+        if depth == self.attorneyDepth:
+            self.attorneyDepth = None
+            self.pending = None
+            self.capture = None
+            if self.values.get(" Attorney ", "") != "":
+                self.rows.append([self.values.get(field, "") for field in self.fields])
+
+    def data(self, data: str) -> None:
+        self.text.append(data)
+
+    def comment(self, text: str) -> None:
+        # Comments split text nodes but never count as data
+        self.flush()
+        if self.stack:
+            self.stack[-1][1] += 1
+
+    def close(self) -> None:
+        self.flush()
+
+    def pop_rows(self) -> list[list[str]]:
+        rows = self.rows
+        self.rows = []
+        return rows
+
+def iter_register_rows(chunks: Iterable[str]) -> Iterator[list[str]]:
+    """Parses register HTML fed in chunks, yielding each attorney's data as soon as its block closes."""
+    from lxml import etree
+    target = RegisterTarget()
+    parser = etree.HTMLParser(target=target)
+    fed = False
+    for chunk in chunks:
+        if not chunk:
+            continue
+        parser.feed(chunk)
+        fed = True
+        yield from target.pop_rows()
+    if fed:
+        parser.close()
+    yield from target.pop_rows()
+
+def parse_register_html(chunks: Iterable[str]) -> list[list[str]]:
+    """Streaming alternative to parse_register that never builds a Soup tree of the full register."""
+    return list(profiling.iterate("parse", iter_register_rows(chunks)))
+
 def write_to_csv(data: list[list[str]]) -> None:
     """Write the register data to an ISO-dated CSV file with an appropriate header."""
-    spreadsheet_name = CSV_FOLDER / (str(datetime.date.today()) + '.csv')
+    spreadsheet_name = CSV_FOLDER / (today() + '.csv')
     header = ['Name', 'Phone', 'Email', 'Firm', 'Address', 'Registered as']
-    with spreadsheet_name.open('w', encoding="utf-8", newline='') as f:
-        writer = csv.writer(f)
-        writer.writerow(header)
-        writer.writerows(data)
+    with profiling.stage("write") as stage:
+        with spreadsheet_name.open('w', encoding="utf-8", newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            writer.writerows(data)
+        store.write_mask(spreadsheet_name)
+        if store.available():
+            store.write_columnar(spreadsheet_name)
+        stage.rows, stage.bytes = len(data), spreadsheet_name.stat().st_size
+    invalidate_catalogue(CSV_FOLDER)
 
 def write_raw_html(rawHTML: str) -> None:
     """Testing function to dump the HTML to a txt file instead of parsing and writing to csv."""
@@ -99,57 +475,178 @@ def append_to_date_table(dirPath: Path, dates: list[str]):
     with open(table, 'a', encoding="utf-8") as f:
         
         f.write(f"{dates[0]} : {dates[1]}\n")
-        
+    invalidate_catalogue(dirPath)
+
+def hash_file(path: Path) -> str:
+    """Returns the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def read_hash_index(dirPath: Path) -> dict[str, str]:
+    """Returns the content hash recorded for each date with a stored csv."""
+    index = dirPath / ("hash_index.txt")
+    d = {}
+    if not index.exists():
+        return d
+    with open(index, 'r', encoding="utf-8") as f:
+        for line in f:
+            (key, val) = line.split(" : ")
+            d[key] = val.strip()
+    return d
+
+def append_to_hash_index(dirPath: Path, date: str, digest: str) -> None:
+    index = dirPath / ("hash_index.txt")
+    with open(index, 'a', encoding="utf-8") as f:
+        f.write(f"{date} : {digest}\n")
+
 def clean_csvs(recentOnly: bool, dirPath: Path = CSV_FOLDER) -> int:
-    filepaths = get_csv_filepaths(dirPath)
+    """Maps any csv identical to an earlier one onto the earlier date, returning the number removed.
+    Each csv is hashed once and recorded in the hash index, so duplicates are found against every
+    earlier snapshot rather than only the previous one."""
+    filepaths = get_snapshot_filepaths(dirPath)
+    index = read_hash_index(dirPath)
+    # Earliest stored date for each content hash
+    originals = {}
     new_table_entries = 0
-    i = 0
-    if recentOnly:
-        i = len(filepaths) - 2
-    j = i + 1
-    while True:
-        if j == len(filepaths):
-            return new_table_entries
-        csv1 = filepaths[i]
-        csv2 = filepaths[j]
-        if cmp(csv1, csv2, shallow=False):
-            append_to_date_table(dirPath, filepaths_to_dates([csv2, csv1]))
-            new_table_entries += 1
-            os.remove(csv2)
-            j += 1
-        else:
-            i = j
-            j += 1
-        
+    for i, path in enumerate(filepaths):
+        date = filepaths_to_dates([path])[0]
+        digest = index.get(date)
+        if deltas.is_delta(path):
+            # Deltas keep the hash of the csv they replaced
+            if digest is not None:
+                originals.setdefault(digest, date)
+            continue
+        if digest is None:
+            digest = hash_file(path)
+            append_to_hash_index(dirPath, date, digest)
+        original = originals.setdefault(digest, date)
+        # Only the newest csv is a candidate for removal when cleaning up after a scrape
+        if original == date or (recentOnly and i < len(filepaths) - 1):
+            continue
+        append_to_date_table(dirPath, [date, original])
+        new_table_entries += 1
+        os.remove(path)
+        store.remove_columnar(path)
+    invalidate_catalogue(dirPath)
+    return new_table_entries
+
+def read_keyframe_interval(dirPath: Path) -> int:
+    """Returns how often a full csv is kept when storing deltas, or 0 if delta storage is off."""
+    config = dirPath / ("delta_config.txt")
+    if not config.exists():
+        return 0
+    with open(config, 'r', encoding="utf-8") as f:
+        for line in f:
+            (key, val) = line.split(" : ")
+            if key == "keyframe_interval":
+                return int(val)
+    return 0
+
+def write_keyframe_interval(dirPath: Path, keyframeInterval: int) -> None:
+    config = dirPath / ("delta_config.txt")
+    with open(config, 'w', encoding="utf-8") as f:
+        f.write(f"keyframe_interval : {keyframeInterval}\n")
+
+def pack_csvs(keyframeInterval: int, dirPath: Path = CSV_FOLDER) -> int:
+    """Replaces csvs with deltas against the previous snapshot, keeping every <keyframeInterval>th
+    snapshot as a full csv. Returns the number of csvs replaced."""
+    from ttipabot import analyser
+    index = read_hash_index(dirPath)
+    packed = 0
+    sinceKeyframe = None
+    previous = None
+    previous_df = None
+    for path in get_snapshot_filepaths(dirPath):
+        date = filepaths_to_dates([path])[0]
+        isKeyframe = not deltas.is_delta(path) and (sinceKeyframe is None or sinceKeyframe + 1 >= keyframeInterval)
+        if isKeyframe or deltas.is_delta(path):
+            sinceKeyframe = 0 if isKeyframe else sinceKeyframe + 1
+            previous, previous_df = date, None
+            continue
+        df = analyser.csv_to_df(path)
+        if previous_df is None:
+            previous_df = analyser.csv_to_df(select_filepaths_for_dates(dirPath, [previous])[0])
+        # Keep the hash so later scrapes can still be deduplicated against this date
+        if date not in index:
+            append_to_hash_index(dirPath, date, hash_file(path))
+        deltas.write_delta(deltas.delta_path(dirPath, date), previous, deltas.compute_delta(previous_df, df))
+        os.remove(path)
+        store.remove_columnar(path)
+        packed += 1
+        sinceKeyframe += 1
+        previous, previous_df = date, df
+    write_keyframe_interval(dirPath, keyframeInterval)
+    invalidate_catalogue(dirPath)
+    return packed
+
+def update_history(dirPath: Path = CSV_FOLDER, rebuild: bool = False) -> int:
+    """Brings the attorney history index up to date with the stored scrapes, returning the number of dates added."""
+    def load(path: Path):
+        from ttipabot import analyser
+        return analyser.csv_to_df(path, ['Name', 'Firm', 'Registered as'])
+    return history.update_index(dirPath, get_date_paths(dirPath), load, rebuild)
+
 def get_csv_filepaths(dirPath: Path) -> list[Path]:
     """Returns a list of filepaths to all the csv files in time order."""
     # ISO naming format means default sort will time-order
     return sorted(list(dirPath.glob('*.csv')))
 
+def get_snapshot_filepaths(dirPath: Path) -> list[Path]:
+    """Returns a list of filepaths to all the stored snapshots, csv or delta, in time order."""
+    paths = get_csv_filepaths(dirPath) + list(dirPath.glob(f"*{deltas.DELTA_SUFFIX}"))
+    return sorted(paths, key=lambda path: path.name.split('.')[0])
+
 def dates_to_filepaths(dates: list[str], dirPath: Path = CSV_FOLDER) -> list[Path]:
     return select_filepaths_for_dates(dirPath, dates)
 
 def filepaths_to_dates(paths: list[Path]) -> list[str]:
-    return [path.stem for path in paths]
+    # Deltas have a compound suffix, so take everything before the first dot rather than the stem
+    return [path.name.split('.')[0] for path in paths]
+
+def catalogue_stamp(dirPath: Path) -> tuple:
+    """Identifies the state of a scrapes folder, which changes whenever a snapshot is added or removed or the date table is written."""
+    table = (dirPath / ("date_table.txt")).stat()
+    return (dirPath.stat().st_mtime_ns, table.st_mtime_ns, table.st_size)
+
+def get_catalogue(dirPath: Path = CSV_FOLDER) -> DateCatalogue:
+    """Returns the catalogue of available dates, only listing the folder again if it has changed since last time."""
+    stamp = catalogue_stamp(dirPath)
+    catalogue = _catalogues.get(dirPath)
+    if catalogue is None or catalogue.stamp != stamp:
+        snapshots = get_snapshot_filepaths(dirPath)
+        catalogue = DateCatalogue(dirPath, dict(zip(filepaths_to_dates(snapshots), snapshots)), read_date_table(dirPath), stamp)
+        _catalogues[dirPath] = catalogue
+    return catalogue
+
+def invalidate_catalogue(dirPath: Path) -> None:
+    """Drops the cached catalogue of a folder, for changes made within the resolution of its timestamps."""
+    _catalogues.pop(dirPath, None)
+
+def get_date_paths(dirPath: Path) -> dict[str, Path]:
+    """Returns the snapshot holding the data for every available date, including those in the date table."""
+    return dict(get_catalogue(dirPath).paths)
 
 def select_filepaths_for_dates(dirPath:Path, dates: list[str]) -> list[Path]:
     """Returns a list of paths to files with names matching input dates."""
-    date_paths=[]
-    filepaths = get_csv_filepaths(dirPath)
-    date_table = read_date_table(dirPath)
-    
+    catalogue = get_catalogue(dirPath)
+    selected = []
     for date in dates:
         validate_date(date)
-        if date in filepaths_to_dates(filepaths):
-            datePath = dirPath / (f"{date}.csv")
-        elif date in date_table.keys():
-            substitute_date = date_table[date]
-            datePath = dirPath / (f"{substitute_date}.csv")
-        else:
-            raise ValueError(f"No file exists for {date}")
-        date_paths.append(datePath)
+        selected.append(catalogue.path(date))
+    return selected
 
-    return date_paths
+def resolve_dates(dates: list[str], snap: str = None, dirPath: Path = CSV_FOLDER) -> list[str]:
+    """Resolves ISO or relative date specs to dates with available scrapes.
+    Without a <snap> mode, ISO dates must match exactly and relative ones take the latest scrape on or before."""
+    catalogue = get_catalogue(dirPath)
+    resolved = []
+    for spec in dates:
+        date, relative = parse_date_spec(spec)
+        resolved.append(catalogue.resolve(date, snap or ('before' if relative else 'exact')))
+    return resolved
 
 def validate_date(date: str) -> None:
     """Raises an error if <date> is not in ISO format."""
@@ -167,29 +664,24 @@ def read_date_table(dirPath: Path) -> dict[str:str]:
             d[key] = val.strip()
     return d
      
+def today() -> str:
+    return str(datetime.date.today())
+
 def check_already_scraped(dirPath: Path) -> bool:
-    date = str(datetime.date.today())
+    date = today()
     # Check dates from both the csvs and the date table
-    return date in get_dates(num=count_dates(dirPath), dirPath=dirPath)
+    return date in get_catalogue(dirPath)
 
-def get_dates(num: int, oldest: bool = False, changes_only: bool = False, dirPath: Path = CSV_FOLDER) -> list[str]:
-    """Gets <num> dates from among those with available scrapes."""
-    filepaths = get_csv_filepaths(dirPath)
-    dates = filepaths_to_dates(filepaths)
-    dates_from_table = list(read_date_table(dirPath).keys())
+def get_dates(num: int, oldest: bool = False, changes_only: bool = False, dirPath: Path = CSV_FOLDER,
+              since: str = None, until: str = None) -> list[str]:
+    """Gets <num> dates from among those with available scrapes, optionally only those from <since> to <until>."""
+    catalogue = get_catalogue(dirPath)
     # Can skip the dates in the date table if getting only dates with changed data
-    if not changes_only:
-        dates += dates_from_table
-    
-    if oldest:
-        dates = sorted(dates)[:num]
-    else:
-        dates = sorted(dates)[-num:]
-    return dates
+    if since is None and until is None:
+        return catalogue.select(num, oldest, changes_only)
+    dates = catalogue.between(since, until, changes_only)
+    return dates[:num] if oldest else dates[-num:]
 
 def count_dates(dirPath: Path = CSV_FOLDER, changes_only=False) -> int:
-    count = len(get_csv_filepaths(dirPath))
     # Can skip the dates in the date table if counting only dates with changed data
-    if changes_only:
-        return count 
-    return count + len(read_date_table(dirPath).keys())
\ No newline at end of file
+    return get_catalogue(dirPath).count(changes_only)
@@ -0,0 +1,234 @@
+"""Long running service that scrapes the register on a schedule and answers queries over a local HTTP JSON API,
+keeping the latest snapshots and the diffs between them loaded from one query to the next."""
+from __future__ import annotations
+
+import asyncio
+import datetime
+import json
+import logging
+import random
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable
+from urllib.parse import parse_qs, urlsplit
+
+from ttipabot import api, scraper
+
+logger = logging.getLogger(__name__)
+
+# Seconds before the first retry of a failed scrape, doubling after each further failure up to the cap
+RETRY_BACKOFF = 60.0
+RETRY_CAP = 3600.0
+RETRIES = 5
+DEFAULT_MODES = ['registrations', 'movements', 'lapses']
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+
+class ResidentContext(api.CompareContext):
+    """A compare context kept for the life of the server, holding the <size> most recently used snapshots
+    and the diffs between them."""
+
+    def __init__(self, size: int):
+        super().__init__()
+        self.size = size
+        self.frames = OrderedDict()
+
+    def load(self, csv: Path, identify: bool = False, masked: bool = False):
+        frame = super().load(csv, identify, masked)
+        self.frames.move_to_end(csv)
+        while len(self.frames) > self.size:
+            evicted, _ = self.frames.popitem(last=False)
+            self.diffs = {key: diff for key, diff in self.diffs.items() if evicted not in key[:2]}
+        return frame
+
+    def diff(self, csv1: Path, csv2: Path, pat: bool, tm: bool, identify: bool = False):
+        diff = super().diff(csv1, csv2, pat, tm, identify)
+        # Loading the second snapshot can evict the first, and a diff is only kept along with both
+        if csv1 not in self.frames or csv2 not in self.frames:
+            self.diffs.pop((csv1, csv2, pat, tm, identify), None)
+        return diff
+
+    def warm(self) -> None:
+        """Loads the latest snapshots with changed data, and diffs each against the one before."""
+        paths = scraper.dates_to_filepaths(scraper.get_dates(self.size, changes_only=True))
+        for csv in paths:
+            self.load(csv)
+        for csv1, csv2 in zip(paths, paths[1:]):
+            self.diff(csv1, csv2, False, False)
+
+def backoff_delay(attempt: int, base: float = RETRY_BACKOFF, cap: float = RETRY_CAP) -> float:
+    """Returns the seconds to wait after failed attempt number <attempt>, from 0, jittered so that retries
+    from several machines don't all land on the register at once."""
+    return random.uniform(0.5, 1) * min(cap, base * 2 ** attempt)
+
+def seconds_until(at: datetime.time, now: datetime.datetime = None) -> float:
+    """Returns the seconds from <now> until the next time of day <at>."""
+    now = now or datetime.datetime.now()
+    next_run = datetime.datetime.combine(now.date(), at)
+    if next_run <= now:
+        next_run += datetime.timedelta(days=1)
+    return (next_run - now).total_seconds()
+
+def one(params: dict[str, list[str]], name: str, default: str = None) -> str:
+    return params.get(name, [default])[-1]
+
+def flag(params: dict[str, list[str]], name: str) -> bool:
+    return one(params, name, "").lower() in ("1", "true", "yes")
+
+def number(params: dict[str, list[str]], name: str, default: int) -> int:
+    try:
+        return int(one(params, name, default))
+    except ValueError:
+        raise ValueError(f"{name} should be a whole number")
+
+def error(message: str) -> str:
+    return json.dumps({"error": message})
+
+class Server:
+    """Answers queries and runs scrapes one at a time on a worker thread, so the event loop stays free to accept
+    connections and no query reads the archive halfway through a scrape. Scrapes run daily at <scrapeAt>, if given,
+    retrying with jittered exponential backoff, and reload the latest <keep> snapshots once done."""
+
+    def __init__(self, keep: int = 3, scrapeAt: datetime.time = None):
+        self.context = ResidentContext(keep)
+        self.scrapeAt = scrapeAt
+        self.worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ttipabot-serve")
+        self.status = {"started": datetime.datetime.now().isoformat(timespec='seconds'), "next_scrape": None,
+                       "last_scrape": None, "last_scrape_result": None, "failed_attempts": 0}
+        # The method each path answers, and the worker function answering it
+        self.routes: dict[str, tuple[str, Callable]] = {
+            "/dates": ("GET", self.dates),
+            "/compare": ("GET", self.compare),
+            "/rank": ("GET", self.rank),
+            "/status": ("GET", self.get_status),
+            "/scrape": ("POST", self.scrape),
+        }
+
+    async def call(self, func: Callable, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.worker, func, *args)
+
+    async def run(self, host: str = "127.0.0.1", port: int = 8765, socketPath: str = None) -> None:
+        """Serves until cancelled, on a Unix socket at <socketPath> if given or else on <host> and <port>."""
+        if socketPath is not None:
+            server = await asyncio.start_unix_server(self.handle, path=socketPath)
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+        logger.debug(f"Serving on {socketPath or f'{host}:{port}'}")
+        # Queued on the worker ahead of any query, so the first queries find the latest snapshots loaded
+        tasks = [asyncio.ensure_future(self.call(self.warm))]
+        if self.scrapeAt is not None:
+            tasks.append(asyncio.ensure_future(self.schedule()))
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for task in tasks:
+                task.cancel()
+            self.worker.shutdown(wait=False, cancel_futures=True)
+
+    async def schedule(self) -> None:
+        while True:
+            wait = seconds_until(self.scrapeAt)
+            self.status["next_scrape"] = (datetime.datetime.now() + datetime.timedelta(seconds=wait)).isoformat(timespec='seconds')
+            await asyncio.sleep(wait)
+            await self.scrape_with_retries()
+
+    async def scrape_with_retries(self, retries: int = RETRIES) -> bool:
+        """Scrapes, retrying failures after a jittered backoff. Returns whether a scrape was made."""
+        for attempt in range(retries + 1):
+            try:
+                return json.loads(await self.call(self.scrape, {}))["scraped"]
+            except Exception as ex:
+                self.status["failed_attempts"] += 1
+                if attempt == retries:
+                    logger.error(f"Giving up on today's scrape after {retries} retries.", exc_info=ex)
+                    return False
+                delay = backoff_delay(attempt)
+                logger.debug(f"Scrape failed, retrying in {delay:.0f} seconds: {ex}")
+                await asyncio.sleep(delay)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Answers one HTTP request on the connection, then closes it."""
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+            method, target, _ = head.split(b"\r\n", 1)[0].decode("latin-1").split(" ", 2)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            status, body = 400, error("Malformed request")
+        else:
+            status, body = await self.respond(method, target)
+        content = body.encode("utf-8")
+        writer.write(f"HTTP/1.1 {status} {REASONS[status]}\r\nContent-Type: application/json; charset=utf-8\r\n"
+                     f"Content-Length: {len(content)}\r\nConnection: close\r\n\r\n".encode("latin-1") + content)
+        try:
+            await writer.drain()
+            writer.close()
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+    async def respond(self, method: str, target: str) -> tuple[int, str]:
+        url = urlsplit(target)
+        if url.path not in self.routes:
+            return 404, error(f"No such query {url.path}, try one of {', '.join(self.routes)}")
+        allowed, func = self.routes[url.path]
+        if method != allowed:
+            return 405, error(f"{url.path} only answers {allowed}")
+        try:
+            return 200, await self.call(func, parse_qs(url.query))
+        except ValueError as ex:
+            return 400, error(str(ex))
+        except Exception as ex:
+            logger.error(f"Failed to answer {target}", exc_info=ex)
+            return 500, error("Internal error, see the log")
+
+    # Worker functions, each answering a query with a JSON string
+
+    def warm(self) -> None:
+        try:
+            self.context.warm()
+        except Exception as ex:
+            # Queries still work, loading snapshots as they need them
+            logger.error("Failed to load the latest snapshots.", exc_info=ex)
+
+    def dates(self, params: dict[str, list[str]]) -> str:
+        dates = api.get_dates(number(params, "num", api.count_dates()), flag(params, "oldest"), flag(params, "changes"),
+                              one(params, "since"), one(params, "until"))
+        return json.dumps([date for date in dates if date])
+
+    def compare(self, params: dict[str, list[str]]) -> str:
+        dates = params.get("date") or api.get_dates(2, changesOnly=True)
+        if len(dates) != 2:
+            raise ValueError("Give two dates to compare")
+        dates = sorted(api.resolve_dates(dates, one(params, "snap")))
+        modes = params.get("mode", DEFAULT_MODES)
+        outputs = api.compare_data_modes(dates, flag(params, "pat"), flag(params, "tm"), modes, json=True,
+                                         context=self.context, identify=flag(params, "renames"))
+        # The outputs are already JSON, so are spliced in rather than parsed and dumped again
+        results = ",".join(f"{json.dumps(mode)}:{output}" for mode, output in outputs.items())
+        return f'{{"dates":{json.dumps(dates)},"results":{{{results}}}}}'
+
+    def rank(self, params: dict[str, list[str]]) -> str:
+        date = api.resolve_dates([one(params, "date") or api.get_latest_date()], one(params, "snap"))[0]
+        output = api.rank_data(date, number(params, "num", 10), flag(params, "pat"), flag(params, "tm"),
+                               one(params, "mode", "names"), json=True, context=self.context)
+        return f'{{"date":{json.dumps(date)},"ranking":{output}}}'
+
+    def get_status(self, params: dict[str, list[str]]) -> str:
+        resident = [scraper.filepaths_to_dates([csv])[0] for csv in self.context.frames]
+        return json.dumps({**self.status, "resident": resident, "latest": api.get_latest_date()})
+
+    def scrape(self, params: dict[str, list[str]]) -> str:
+        scraped = api.scrape_register()
+        self.status["last_scrape"] = datetime.datetime.now().isoformat(timespec='seconds')
+        self.status["last_scrape_result"] = "scraped" if scraped else "already scraped"
+        if scraped:
+            self.warm()
+        return json.dumps({"scraped": scraped})
+
+def serve(host: str = "127.0.0.1", port: int = 8765, socketPath: str = None, keep: int = 3,
+          scrapeAt: datetime.time = None) -> None:
+    """Runs the server until interrupted."""
+    try:
+        asyncio.run(Server(keep, scrapeAt).run(host, port, socketPath))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,182 @@
+"""Columnar copies of the dated csv snapshots, for loading only the columns an analysis needs, and the registration
+mask of each snapshot, which is kept next to the csv too so installs without pyarrow needn't work it out every load."""
+from __future__ import annotations
+
+from importlib.util import find_spec
+from pathlib import Path
+from typing import Callable, TYPE_CHECKING
+
+from ttipabot import registrations
+
+# pandas and the optional pyarrow are imported where used, as listing snapshots shouldn't need them
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
+
+# Columns with few distinct values, held as categoricals in compact frames
+COMPACT_COLUMNS = ['Phone', 'Firm', 'Address', 'Registered as']
+
+# Format used for new columnar snapshots, keyed by file suffix
+COLUMNAR_FORMAT = ".parquet"
+
+# Sidecar holding the registration mask of a csv snapshot, one byte per attorney in row order
+MASK_SUFFIX = ".mask"
+
+# Writers and readers for each columnar format, keyed by file suffix
+WRITERS: dict[str, Callable] = {}
+READERS: dict[str, Callable] = {}
+SCHEMAS: dict[str, Callable] = {}
+
+def columnar_format(suffix: str):
+    """Registers a writer and reader pair for a columnar snapshot format."""
+    def register(cls):
+        WRITERS[suffix] = cls.write
+        READERS[suffix] = cls.read
+        SCHEMAS[suffix] = cls.columns
+        return cls
+    return register
+
+@columnar_format(".parquet")
+class Parquet:
+    @staticmethod
+    def write(table, path: Path) -> None:
+        import pyarrow.parquet as pq
+        pq.write_table(table, path, use_dictionary=True, compression="zstd")
+
+    @staticmethod
+    def read(path: Path, columns: list[str] = None):
+        import pyarrow.parquet as pq
+        return pq.read_table(path, columns=columns, memory_map=True)
+
+    @staticmethod
+    def columns(path: Path) -> list[str]:
+        import pyarrow.parquet as pq
+        return pq.read_schema(path).names
+
+@columnar_format(".arrow")
+class ArrowIPC:
+    @staticmethod
+    def write(table, path: Path) -> None:
+        import pyarrow as pa
+        import pyarrow.feather as feather
+        # Uncompressed so the file can be memory mapped without copying
+        table = pa.table({name: column.dictionary_encode() if pa.types.is_string(column.type) else column
+                          for name, column in zip(table.column_names, table.columns)})
+        feather.write_feather(table, path, compression="uncompressed")
+
+    @staticmethod
+    def read(path: Path, columns: list[str] = None):
+        import pyarrow.feather as feather
+        return feather.read_table(path, columns=columns, memory_map=True)
+
+    @staticmethod
+    def columns(path: Path) -> list[str]:
+        import pyarrow as pa
+        with pa.memory_map(str(path)) as source:
+            return pa.ipc.open_file(source).schema.names
+
+def available() -> bool:
+    """Returns whether the optional pyarrow dependency is installed."""
+    return find_spec("pyarrow") is not None
+
+def columnar_paths(csvPath: Path) -> list[Path]:
+    """Returns the paths of any columnar copies of a csv snapshot."""
+    return [csvPath.with_suffix(suffix) for suffix in READERS if csvPath.with_suffix(suffix).exists()]
+
+def write_columnar(csvPath: Path, suffix: str = COLUMNAR_FORMAT) -> Path:
+    """Writes a columnar copy of a csv snapshot next to it, with identical values to reading the csv,
+    along with the registration mask of each attorney."""
+    import pyarrow as pa
+    df = read_csv(csvPath)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.cast(pa.schema([(name, pa.string()) for name in table.column_names]))
+    table = table.append_column(pa.field(registrations.MASK_COLUMN, pa.uint8()), pa.array(registrations.compute_mask(df)))
+    path = csvPath.with_suffix(suffix)
+    WRITERS[suffix](table, path)
+    return path
+
+def remove_columnar(csvPath: Path) -> None:
+    """Deletes any columnar copies and mask sidecar of a csv snapshot."""
+    for path in columnar_paths(csvPath):
+        path.unlink()
+    mask_path(csvPath).unlink(missing_ok=True)
+
+def mask_path(csvPath: Path) -> Path:
+    return csvPath.with_suffix(MASK_SUFFIX)
+
+def write_mask(csvPath: Path) -> Path:
+    """Writes the registration mask of a csv snapshot to a sidecar next to it."""
+    mask = registrations.compute_mask(read_csv(csvPath, registrations.SOURCE_COLUMNS))
+    path = mask_path(csvPath)
+    path.write_bytes(mask.tobytes())
+    return path
+
+def read_mask(csvPath: Path, rows: int = None) -> np.ndarray | None:
+    """Returns the registration mask in the sidecar of a csv snapshot, or None if there isn't one or the csv
+    has been written since, or the mask doesn't have <rows> attorneys."""
+    import numpy as np
+    path = mask_path(csvPath)
+    try:
+        if path.stat().st_mtime_ns < csvPath.stat().st_mtime_ns:
+            return None
+        mask = np.fromfile(path, dtype=np.uint8)
+    except OSError:
+        return None
+    return mask if rows is None or len(mask) == rows else None
+
+def has_mask(path: Path) -> bool:
+    """Returns whether a columnar copy stores the registration mask, which copies written before it was added lack."""
+    return registrations.MASK_COLUMN in SCHEMAS[path.suffix](path)
+
+def migrate(csvPaths: list[Path], suffix: str = COLUMNAR_FORMAT) -> int:
+    """Writes mask sidecars for any csv snapshots that lack one, and with pyarrow installed, columnar copies for any
+    that lack one or whose copy lacks the registration mask. Returns the number of snapshots written to."""
+    written = 0
+    for csvPath in csvPaths:
+        path = csvPath.with_suffix(suffix)
+        wrote = read_mask(csvPath) is None
+        if wrote:
+            write_mask(csvPath)
+        if available() and (not path.exists() or not has_mask(path)):
+            write_columnar(csvPath, suffix)
+            wrote = True
+        written += wrote
+    return written
+
+def read_csv(csvPath: Path, columns: list[str] = None) -> pd.DataFrame:
+    import pandas as pd
+    df = pd.read_csv(csvPath, dtype='string', usecols=columns).fillna('')
+    # usecols keeps file order, so match the requested order as the columnar readers do
+    return df if columns is None else df[columns]
+
+def read_snapshot(csvPath: Path, columns: list[str] = None) -> pd.DataFrame:
+    """Loads <columns> of a snapshot, from a memory mapped columnar copy where one exists.
+    The registration mask is only loaded when asked for, from the columnar copy or else the sidecar,
+    and is worked out if the snapshot doesn't store it."""
+    if available():
+        for path in columnar_paths(csvPath):
+            stored = SCHEMAS[path.suffix](path)
+            if columns is None:
+                columns = [column for column in stored if column != registrations.MASK_COLUMN]
+            if set(columns) <= set(stored):
+                df = READERS[path.suffix](path, columns).to_pandas()
+                return df.astype({column: 'string' for column in columns if column != registrations.MASK_COLUMN})
+    if columns is not None and registrations.MASK_COLUMN in columns:
+        others = [column for column in columns if column != registrations.MASK_COLUMN]
+        df = read_snapshot(csvPath, others) if others else None
+        mask = read_mask(csvPath, None if df is None else len(df))
+        if mask is not None:
+            import pandas as pd
+            df = df if df is not None else pd.DataFrame(index=range(len(mask)))
+            return df.assign(**{registrations.MASK_COLUMN: mask})[columns]
+        return registrations.with_mask(read_snapshot(csvPath, registrations.source_columns(columns)), columns)
+    return read_csv(csvPath, columns)
+
+def compact_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Returns <df> with its repetitive columns as categoricals, which store each distinct value once."""
+    return df.astype({column: 'category' for column in COMPACT_COLUMNS if column in df.columns})
+
+def expand_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Returns <df> with any categorical columns back as strings."""
+    import pandas as pd
+    return df.astype({column: 'string' for column in df.columns if isinstance(df[column].dtype, pd.CategoricalDtype)})
@@ -0,0 +1,197 @@
+"""Writers streaming dataframes out as NDJSON, CSV or markdown a chunk of rows at a time, formatting each chunk
+with whole column string operations rather than row by row, so large outputs are never held in memory at once."""
+from __future__ import annotations
+
+import io
+import json
+from typing import Callable, TextIO, TYPE_CHECKING
+
+# pandas and numpy are imported where used, like the rest of the output path
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
+
+# Rows formatted and written at a time
+CHUNK_ROWS = 10_000
+
+# Writer for each output format, keyed by name
+WRITERS: dict[str, Callable] = {}
+
+def output_format(name: str):
+    """Registers a function writing a dataframe to a text stream in an output format."""
+    def register(func):
+        WRITERS[name] = func
+        return func
+    return register
+
+def chunks(df: pd.DataFrame, chunkRows: int = CHUNK_ROWS):
+    for start in range(0, len(df), chunkRows):
+        yield df.iloc[start:start + chunkRows]
+
+def column_strings(column: pd.Series) -> np.ndarray:
+    """Returns the values of <column> as an object array of strings, with missing values as empty strings."""
+    if column.dtype.kind in "iub":
+        return column.astype(str).to_numpy(dtype=object)
+    return column.astype('string').fillna('').to_numpy(dtype=object)
+
+def join_columns(columns: list[np.ndarray], separators: list[str]) -> np.ndarray:
+    """Concatenates equal length string arrays elementwise, with separators[i] before columns[i] and the last
+    separator after all of them."""
+    import numpy as np
+    lines = np.full(len(columns[0]) if columns else 0, separators[0], dtype=object)
+    for column, separator in zip(columns, separators[1:]):
+        lines = lines + column + separator
+    return lines
+
+def write_lines(lines: np.ndarray, stream: TextIO) -> None:
+    if len(lines):
+        stream.write("\n".join(lines.tolist()) + "\n")
+
+def json_strings(column: pd.Series) -> np.ndarray:
+    """Returns each value of <column> as a JSON string or number, with missing values as null."""
+    if column.dtype.kind in "iu":
+        return column.astype(str).to_numpy(dtype=object)
+    values = column.astype('string')
+    missing = values.isna().to_numpy()
+    escaped = values.fillna('').str.replace('\\', '\\\\', regex=False).str.replace('"', '\\"', regex=False)
+    encoded = ('"' + escaped + '"').to_numpy(dtype=object)
+    # Control characters need escapes of their own, and are rare enough to leave to the json module
+    control = values.fillna('').str.contains(r'[\x00-\x1f]').to_numpy(dtype=bool)
+    if control.any():
+        encoded[control] = [json.dumps(value, ensure_ascii=False) for value in values[control]]
+    encoded[missing] = 'null'
+    return encoded
+
+@output_format("ndjson")
+def write_ndjson(df: pd.DataFrame, stream: TextIO, fields: dict = None, chunkRows: int = CHUNK_ROWS) -> None:
+    """Writes a JSON object per row, led by any constant <fields>, keeping the text as UTF-8 rather than escapes."""
+    lead = "".join(f"{json.dumps(key, ensure_ascii=False)}:{json.dumps(value, ensure_ascii=False)}," for key, value in (fields or {}).items())
+    keys = [f"{json.dumps(str(column), ensure_ascii=False)}:" for column in df.columns]
+    separators = ["{" + lead + keys[0]] + [f",{key}" for key in keys[1:]] + ["}"]
+    for chunk in chunks(df, chunkRows):
+        write_lines(join_columns([json_strings(chunk[column]) for column in chunk.columns], separators), stream)
+
+def csv_field(value: str) -> str:
+    return '"' + value.replace('"', '""') + '"' if any(char in value for char in '",\r\n') else value
+
+def csv_strings(column: pd.Series) -> np.ndarray:
+    """Returns each value of <column> as a CSV field, quoted only when it has to be, as the csv module does."""
+    values = column_strings(column)
+    if column.dtype.kind in "iub":
+        return values
+    strings = column.astype('string').fillna('')
+    quote = strings.str.contains(r'[",\r\n]').to_numpy(dtype=bool)
+    if quote.any():
+        values[quote] = ('"' + strings[quote].str.replace('"', '""', regex=False) + '"').to_numpy(dtype=object)
+    return values
+
+@output_format("csv")
+def write_csv(df: pd.DataFrame, stream: TextIO, header: bool = True, chunkRows: int = CHUNK_ROWS) -> None:
+    """Writes <df> as CSV without its index, optionally without the header for appending to earlier rows."""
+    separators = [""] + [","] * (len(df.columns) - 1) + [""]
+    if header:
+        stream.write(",".join(csv_field(str(column)) for column in df.columns) + "\n")
+    for chunk in chunks(df, chunkRows):
+        write_lines(join_columns([csv_strings(chunk[column]) for column in chunk.columns], separators), stream)
+
+def visible_widths(values: np.ndarray) -> np.ndarray:
+    """Returns the width each string takes up in a terminal, counting wide characters twice as tabulate does."""
+    import numpy as np
+    import pandas as pd
+    strings = pd.Series(values, dtype='string')
+    widths = strings.str.len().to_numpy(dtype=np.int64)
+    wide = ~strings.str.isascii().to_numpy(dtype=bool)
+    if wide.any():
+        try:
+            from wcwidth import wcswidth
+        except ImportError:
+            # tabulate counts characters too when wcwidth isn't installed
+            return widths
+        # Unprintable characters make the width -1, which tabulate pads by all the same
+        widths[wide] = [wcswidth(value) for value in values[wide]]
+    return widths
+
+def tabulates_alike(df: pd.DataFrame) -> bool:
+    """Returns whether markdown formatted here comes out the same as tabulate's, which treats columns of numbers
+    in text, missing values, multiline values and escape codes in ways not worth repeating here."""
+    import pandas as pd
+    if df.empty or df.index.dtype.kind not in "iu" or df.index.name is not None or df.isna().any().any():
+        return False
+    for column in df.columns:
+        values = df[column]
+        if values.dtype.kind in "iu":
+            continue
+        if not (pd.api.types.is_string_dtype(values) or isinstance(values.dtype, pd.CategoricalDtype)):
+            return False
+        strings = values.astype('string').str.strip()
+        if strings.str.contains(r'[\n\r\x1b]').any():
+            return False
+        # tabulate only reads a column as numbers when every value is one, so the first is enough to rule it out
+        first = strings[strings != ''].head(1).tolist()
+        if first and is_number(first[0]):
+            return False
+    return True
+
+def is_number(value: str) -> bool:
+    try:
+        float(value)
+    except ValueError:
+        return False
+    return True
+
+@output_format("markdown")
+def write_markdown(df: pd.DataFrame, stream: TextIO, chunkRows: int = CHUNK_ROWS) -> None:
+    """Writes <df> with its index as a pipe table laid out as DataFrame.to_markdown does. Column widths are measured
+    over every row first, then rows are padded and written a chunk at a time."""
+    import numpy as np
+    if not tabulates_alike(df):
+        stream.write(df.to_markdown() + "\n")
+        return
+    names = [""] + [str(column) for column in df.columns]
+    columns = [df.index.to_series()] + [df[column] for column in df.columns]
+    # Numbers are aligned right and text left, with whitespace around text dropped as tabulate does
+    right = [column.dtype.kind in "iu" for column in columns]
+    strip = lambda column, isRight: column_strings(column) if isRight else column.astype('string').str.strip().to_numpy(dtype=object)
+    widths = [max(len(name) + 2, int(visible_widths(strip(column, isRight)).max()))
+              for name, column, isRight in zip(names, columns, right)]
+    spaces = np.array([" " * count for count in range(max(widths) + 2)], dtype=object)
+
+    def pad(values: np.ndarray, width: int, isRight: bool) -> np.ndarray:
+        fill = spaces[width - visible_widths(values)]
+        return fill + values if isRight else values + fill
+
+    separators = ["| "] + [" | "] * (len(columns) - 1) + [" |"]
+    header = [pad(np.array([name], dtype=object), width, isRight) for name, width, isRight in zip(names, widths, right)]
+    rule = "|" + "|".join("-" * (width + 1) + ":" if isRight else ":" + "-" * (width + 1) for width, isRight in zip(widths, right)) + "|"
+    write_lines(np.append(join_columns(header, separators), rule), stream)
+    for start in range(0, len(df), chunkRows):
+        cells = [pad(strip(column.iloc[start:start + chunkRows], isRight), width, isRight)
+                 for column, width, isRight in zip(columns, widths, right)]
+        write_lines(join_columns(cells, separators), stream)
+
+def write(df: pd.DataFrame, stream: TextIO, format: str, **options) -> None:
+    """Writes <df> to <stream> in any of the registered output formats."""
+    if format not in WRITERS:
+        raise ValueError("Invalid output format.")
+    WRITERS[format](df, stream, **options)
+
+def render(df: pd.DataFrame, format: str, **options) -> str:
+    """Returns <df> as it would be written in <format>, without the final newline."""
+    buffer = io.StringIO()
+    write(df, buffer, format, **options)
+    return buffer.getvalue().removesuffix("\n")
+
+def write_sections(frames: dict[str, pd.DataFrame], stream: TextIO, format: str, key: str = 'Mode') -> None:
+    """Writes several frames as one NDJSON or CSV output, with each row led by the <key> of the frame it came from.
+    CSV rows take the columns of every frame, left blank where a frame lacks them."""
+    if format == "ndjson":
+        for name, df in frames.items():
+            write_ndjson(df, stream, fields={key: name})
+        return
+    if format != "csv":
+        raise ValueError("Sections can only be written as ndjson or csv.")
+    columns = list(dict.fromkeys(column for df in frames.values() for column in df.columns))
+    for i, (name, df) in enumerate(frames.items()):
+        df = df.reindex(columns=columns, fill_value='')
+        df.insert(0, key, name)
+        write_csv(df, stream, header=i == 0)
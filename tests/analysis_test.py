@@ -35,4 +35,125 @@ def test_compare_csvs(examples):
 
 
 def test_filter_attorneys(examples):
-    assert analyser.filter_attorneys(examples[0], pat=True, tm=False).equals(examples[0][1:3])
\ No newline at end of file
+    assert analyser.filter_attorneys(examples[0], pat=True, tm=False).equals(examples[0][1:3])
+
+def test_composed_filters(examples):
+    df = examples[1]
+    assert analyser.filter_attorneys(df, False, True, jurisdiction='AU')['Name'].tolist() == ["Daniel Bolderston", "Michelle Catto", "Albert Abram"]
+    assert analyser.filter_attorneys(df, True, False, jurisdiction='NZ')['Name'].tolist() == ["Angela Aitchison Searle"]
+    assert analyser.filter_attorneys(df, False, True, firms=["FB Rice Pty Ltd", "AJ Park"])['Name'].tolist() == ["Daniel Bolderston", "Michelle Catto"]
+    # A loaded mask gives the same attorneys, and isn't passed on
+    masked = analyser.csv_to_df(EXAMPLES_FOLDER / "csvExample2.csv", analyser.masked(analyser.COMPARE_COLUMNS, True, False))
+    filtered = analyser.filter_attorneys(masked, True, False, jurisdiction='AU')
+    assert filtered['Name'].tolist() == ["Michelle Catto"] and list(filtered.columns) == analyser.COMPARE_COLUMNS
+
+def test_jurisdiction_from_address():
+    from ttipabot import registrations
+    for address in ["Level 20 600 Bourke Street MELBOURNE VIC 3000 Australia", "Mawson 2607 ACT  AUSTRALIA", "Melbourne, Victoria", "Sydney NSW"]:
+        assert registrations.jurisdiction_bits(address) == registrations.AU
+    # Streets named after states, lowercase words and other countries' states aren't Australian
+    for address in ["100 Victoria Embankment London EC4Y ODH United Kingdom", "1 Pike Street, Seattle, WA 98101",
+                    "Perth PH1 5AA Scotland", "Where it was, as per the act"]:
+        assert registrations.jurisdiction_bits(address) == 0
+    assert registrations.jurisdiction_bits("Level 7 158 Victoria Street Te Aro Wellington 6011 New Zealand") == registrations.NZ
+
+def test_diffs_change_classes(examples):
+    df1, df2 = examples
+    # Same firm with a new phone number is a detail change, not a move
+    df2 = df2.copy()
+    df2.loc[df2['Name'] == "Michelle Catto", 'Phone'] = "02 0000 0000"
+    df_diffs = analyser.get_diffs_df(df1, df2)
+    changes = dict(zip(df_diffs['Name'], df_diffs['Change']))
+    assert changes["Albert Abram"] == 'new'
+    assert changes["Daniel Bolderston"] == 'moved'
+    assert changes["Michelle Catto"] == 'changed'
+    assert "Angela Aitchison Searle" not in changes
+
+def test_diffs_respelt_firm_not_moved(examples):
+    df1, df2 = examples
+    df2 = df2.copy()
+    df2.loc[df2['Name'] == "Michelle Catto", 'Firm'] = "FB RICE PTY. LTD."
+    changes = dict(zip(*analyser.get_diffs_df(df1, df2)[['Name', 'Change']].to_dict('list').values()))
+    assert changes["Michelle Catto"] == 'changed'
+
+def test_diffs_repeated_names(examples):
+    df1 = examples[0]
+    repeat = df1.iloc[[0]].assign(Firm="AJ Park")
+    df2 = pd.concat([df1, repeat], ignore_index=True)
+    # An extra attorney sharing a name is new, while the unchanged original is matched by its whole row
+    df_diffs = analyser.get_diffs_df(df1, df2)
+    assert list(df_diffs['Change']) == ['new']
+    assert df_diffs.iloc[0]['Firm_y'] == "AJ Park"
+    # Identical repeated rows on both sides are unchanged
+    assert analyser.get_diffs_df(df2, df2.iloc[::-1]).empty
+
+def test_compare_data_modes():
+    csv1, csv2 = EXAMPLES_FOLDER / "csvExample1.csv", EXAMPLES_FOLDER / "csvExample2.csv"
+    views = analyser.compare_data_modes(csv1, csv2, False, False, ['registrations', 'movements', 'lapses'])
+    for mode, view in views.items():
+        assert view.equals(analyser.compare_data(csv1, csv2, False, False, mode))
+    with pytest.raises(ValueError):
+        analyser.compare_data_modes(csv1, csv2, False, False, ['garbage'])
+
+def test_compare_context_reuses_diff():
+    from ttipabot.api import CompareContext
+    csv1, csv2 = EXAMPLES_FOLDER / "csvExample1.csv", EXAMPLES_FOLDER / "csvExample2.csv"
+    context = CompareContext()
+    diffs = context.diff(csv1, csv2, False, False)
+    assert context.diff(csv1, csv2, False, False) is diffs
+    # A different filter reuses the loaded frames but needs its own diff
+    assert context.diff(csv1, csv2, True, False) is not diffs
+    assert list(context.frames) == [csv1, csv2]
+
+def test_timeline_df():
+    csv1, csv2 = EXAMPLES_FOLDER / "csvExample1.csv", EXAMPLES_FOLDER / "csvExample2.csv"
+    snapshots = [('2024-01-30', csv1), ('2024-02-01', csv2), ('2024-02-02', csv1)]
+    timeline = analyser.timeline_df(snapshots, False, False, firms=["AJ Park"])
+    assert list(timeline['Registrations']) == [0, 1, 0]
+    assert list(timeline['Lapses']) == [0, 0, 1]
+    assert list(timeline['Net']) == [0, 1, -1]
+    assert list(timeline['Moves']) == [0, 1, 1]
+    assert list(timeline['AJ Park']) == [0, 1, 0]
+    monthly = analyser.timeline_df(snapshots, False, False, period='month')
+    assert list(monthly['Date']) == ['2024-01', '2024-02']
+    assert list(monthly['Registrations']) == [0, 1]
+    assert list(monthly['Attorneys']) == [3, 3]
+
+def test_compact_csv_to_df():
+    csv = EXAMPLES_FOLDER / "csvExample1.csv"
+    compact = analyser.csv_to_df(csv, compact=True)
+    assert isinstance(compact['Registered as'].dtype, pd.CategoricalDtype)
+    assert compact.astype('string').equals(analyser.csv_to_df(csv))
+
+def test_diffs_of_compact_frames(examples):
+    compact = [analyser.csv_to_df(EXAMPLES_FOLDER / name, compact=True) for name in ["csvExample1.csv", "csvExample2.csv"]]
+    assert analyser.get_diffs_df(*compact).equals(analyser.get_diffs_df(*examples))
+    assert analyser.filter_attorneys(compact[1], True, False)['Name'].tolist() == analyser.filter_attorneys(examples[1], True, False)['Name'].tolist()
+
+def test_df_to_attorneys(examples):
+    attorneys = analyser.df_to_attorneys(examples[1])
+    assert attorneys[0] == analyser.Attorney("Daniel Bolderston", *examples[1].iloc[0, 1:].fillna(''))
+    # Repeated values are shared rather than copied
+    firms = pd.DataFrame({'Name': ["A", "B"], 'Firm': ["".join(["Acme ", "IP"]), "".join(["Acme ", "IP"])]})
+    attorneys = analyser.df_to_attorneys(firms)
+    assert attorneys[0].firm is attorneys[1].firm and attorneys[0].registered_as == ''
+
+def test_consecutive_pairs_in_range():
+    from ttipabot import api
+    assert api.consecutive_pairs('2024-10-01', '2024-12-31') == [('2024-09-03', '2024-10-26'), ('2024-10-26', '2024-12-28')]
+    assert api.consecutive_pairs('2024-09-03', '2024-10-26') == [('2024-08-30', '2024-09-03'), ('2024-09-03', '2024-10-26')]
+    # Nothing comes before the first scrape
+    assert api.consecutive_pairs(until='2023-01-28') == [('2023-01-27', '2023-01-28')]
+
+def test_compare_many_in_order(monkeypatch):
+    from ttipabot import api
+    csv1, csv2 = EXAMPLES_FOLDER / "csvExample1.csv", EXAMPLES_FOLDER / "csvExample2.csv"
+    pairs = [(i, *pair) for i, pair in enumerate([(csv1, csv2), (csv2, csv1), (csv1, csv2), (csv2, csv2)])]
+    modes = ['registrations', 'lapses']
+    serial = list(api.compare_many(pairs, False, False, modes, json=True, workers=1))
+    assert [key for key, _ in serial] == [0, 1, 2, 3]
+    assert serial[0][1] == api.compare_paths(csv1, csv2, False, False, modes, json=True)
+    assert '"Albert Abram"' in serial[1][1]['lapses'] and serial[3][1] == {'registrations': "[]", 'lapses': "[]"}
+    # Spread over processes one pair at a time, results still come back in the order given
+    monkeypatch.setattr(api.os, "cpu_count", lambda: 2)
+    assert list(api.compare_many(pairs, False, False, modes, json=True, workers=2, chunkSize=1)) == serial
@@ -0,0 +1,7 @@
+import pytest
+from ttipabot import firm_rules
+
+@pytest.fixture(autouse=True)
+def firm_cache(tmp_path, monkeypatch):
+    # Names worked out by tests are cached in the test's own folder rather than next to the real scrapes
+    monkeypatch.setattr(firm_rules, "_rules", firm_rules.FirmRules.load(cachePath=tmp_path / firm_rules.CACHE_NAME))
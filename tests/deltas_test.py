@@ -0,0 +1,54 @@
+import shutil
+from pathlib import Path
+import pandas as pd
+import pytest
+from ttipabot import analyser, deltas, scraper
+
+EXAMPLES_FOLDER = Path.cwd() / "tests/Examples"
+
+@pytest.fixture
+def examples():
+    return analyser.csvs_to_dfs([EXAMPLES_FOLDER / "csvExample1.csv", EXAMPLES_FOLDER / "csvExample2.csv"])
+
+def test_delta_round_trip(examples):
+    base, df = examples
+    delta = deltas.compute_delta(base, df)
+    assert [row[0] for row in delta["added"]] == ["Albert Abram"]
+    assert deltas.apply_delta(base, delta).equals(df)
+
+def test_delta_duplicate_names_and_order(examples):
+    base = examples[0]
+    # Repeat a name with different details and shuffle the rows
+    df = pd.concat([base, base.iloc[[0]].assign(Firm="AJ Park")], ignore_index=True).iloc[[3, 1, 0, 2]].reset_index(drop=True)
+    delta = deltas.compute_delta(base, df)
+    assert deltas.apply_delta(base, delta).equals(df)
+
+def test_to_runs():
+    positions = [5, 6, 7, 0, 1, 9]
+    assert deltas.to_runs(positions) == [[5, 3], [0, 2], [9, 1]]
+    assert deltas.from_runs(deltas.to_runs(positions)) == positions
+
+def test_pack_csvs(tmp_path: Path, examples):
+    dates = ['2024-01-01', '2024-01-02', '2024-01-03', '2024-01-04']
+    sources = ["csvExample1.csv", "csvExample2.csv", "csvExample1.csv", "csvExample2.csv"]
+    for date, source in zip(dates, sources):
+        shutil.copy(EXAMPLES_FOLDER / source, tmp_path / f"{date}.csv")
+    # Make the copies differ so cleaning them doesn't collapse them
+    (tmp_path / '2024-01-03.csv').write_text((EXAMPLES_FOLDER / "csvExample1.csv").read_text().replace("FB Rice", "Spruson"))
+    (tmp_path / 'date_table.txt').write_text('')
+    expected = {date: analyser.csv_to_df(tmp_path / f"{date}.csv") for date in dates}
+
+    assert scraper.pack_csvs(3, tmp_path) == 3 - 1
+    assert scraper.filepaths_to_dates(scraper.get_csv_filepaths(tmp_path)) == ['2024-01-01', '2024-01-04']
+    assert scraper.get_dates(10, dirPath=tmp_path) == dates
+    deltas.set_cache_size(0)
+    for date in dates:
+        path = scraper.select_filepaths_for_dates(tmp_path, [date])[0]
+        assert analyser.csv_to_df(path).equals(expected[date])
+    deltas.set_cache_size(8)
+
+    # A new scrape matching a packed date is still recognised as a duplicate
+    shutil.copy(EXAMPLES_FOLDER / "csvExample2.csv", tmp_path / '2024-01-05.csv')
+    assert scraper.clean_csvs(recentOnly=True, dirPath=tmp_path) == 1
+    assert scraper.read_date_table(tmp_path) == {'2024-01-05': '2024-01-02'}
+    assert scraper.select_filepaths_for_dates(tmp_path, ['2024-01-05']) == [deltas.delta_path(tmp_path, '2024-01-02')]
@@ -1,5 +1,5 @@
 import pytest
-from ttipabot import scraper
+from ttipabot import scraper, catalogue
 from pathlib import Path
 import datetime
 
@@ -62,3 +62,87 @@ def test_check_already_scraped_table(paths: tuple[Path, Path]):
     scraper.append_to_date_table(dirPath, [datetime.date.today(), "2024-10-26"])
     assert scraper.check_already_scraped(dirPath)
     
+
+def test_clean_csvs_non_adjacent(tmp_path: Path):
+    contents = {'2024-01-01': 'a', '2024-01-02': 'b', '2024-01-03': 'a', '2024-01-04': 'b', '2024-01-05': 'c'}
+    for date, content in contents.items():
+        (tmp_path / f"{date}.csv").write_text(content)
+    assert scraper.clean_csvs(recentOnly=False, dirPath=tmp_path) == 2
+    assert scraper.filepaths_to_dates(scraper.get_csv_filepaths(tmp_path)) == ['2024-01-01', '2024-01-02', '2024-01-05']
+    assert scraper.read_date_table(tmp_path) == {'2024-01-03': '2024-01-01', '2024-01-04': '2024-01-02'}
+    assert scraper.select_filepaths_for_dates(tmp_path, ['2024-01-04']) == [tmp_path / '2024-01-02.csv']
+
+def test_return_to_earlier_snapshot_is_a_change(tmp_path: Path):
+    # The third scrape maps onto the first, but still differs from the second
+    for date, content in {'2024-01-01': 'a', '2024-01-02': 'b', '2024-01-03': 'a'}.items():
+        (tmp_path / f"{date}.csv").write_text(content)
+    assert scraper.clean_csvs(recentOnly=True, dirPath=tmp_path) == 1
+    assert scraper.get_dates(2, changes_only=True, dirPath=tmp_path) == ['2024-01-02', '2024-01-03']
+    assert scraper.get_catalogue(tmp_path).changes() == [('2024-01-01', tmp_path / '2024-01-01.csv'),
+                                                         ('2024-01-02', tmp_path / '2024-01-02.csv'),
+                                                         ('2024-01-03', tmp_path / '2024-01-01.csv')]
+
+def test_clean_csvs_hashes_once(tmp_path: Path, monkeypatch):
+    for date in ['2024-01-01', '2024-01-02']:
+        (tmp_path / f"{date}.csv").write_text(date)
+    scraper.clean_csvs(recentOnly=True, dirPath=tmp_path)
+    assert set(scraper.read_hash_index(tmp_path)) == {'2024-01-01', '2024-01-02'}
+    # A later scrape only needs its own file hashed
+    (tmp_path / '2024-01-03.csv').write_text('2024-01-01')
+    hashed = []
+    original_hash_file = scraper.hash_file
+    monkeypatch.setattr(scraper, "hash_file", lambda path: hashed.append(path) or original_hash_file(path))
+    assert scraper.clean_csvs(recentOnly=True, dirPath=tmp_path) == 1
+    assert hashed == [tmp_path / '2024-01-03.csv']
+    assert scraper.read_date_table(tmp_path) == {'2024-01-03': '2024-01-01'}
+
+def test_catalogue_queries(tmp_path: Path):
+    for date in ['2024-01-01', '2024-01-05', '2024-01-09']:
+        (tmp_path / f"{date}.csv").touch()
+    (tmp_path / 'date_table.txt').write_text('2024-01-03 : 2024-01-01\n')
+    catalogue = scraper.get_catalogue(tmp_path)
+    assert catalogue.between('2024-01-02', '2024-01-05') == ['2024-01-03', '2024-01-05']
+    assert catalogue.between(end='2024-01-03', changes_only=True) == ['2024-01-01']
+    assert catalogue.at_or_before('2024-01-04') == '2024-01-03'
+    assert catalogue.at_or_before('2024-01-04', changes_only=True) == '2024-01-01'
+    assert catalogue.at_or_before('2023-12-31') is None
+    assert catalogue.at_or_after('2024-01-06') == '2024-01-09'
+    assert catalogue.at_or_after('2024-01-10') is None
+    assert catalogue.path('2024-01-03') == tmp_path / '2024-01-01.csv'
+
+def test_catalogue_cached_until_folder_changes(tmp_path: Path, monkeypatch):
+    (tmp_path / '2024-01-01.csv').touch()
+    (tmp_path / 'date_table.txt').touch()
+    assert scraper.get_dates(5, dirPath=tmp_path) == ['2024-01-01']
+    listed = []
+    original_get_snapshot_filepaths = scraper.get_snapshot_filepaths
+    monkeypatch.setattr(scraper, "get_snapshot_filepaths", lambda dirPath: listed.append(dirPath) or original_get_snapshot_filepaths(dirPath))
+    assert scraper.count_dates(tmp_path) == 1
+    assert scraper.select_filepaths_for_dates(tmp_path, ['2024-01-01']) == [tmp_path / '2024-01-01.csv']
+    assert listed == []
+    scraper.append_to_date_table(tmp_path, ['2024-01-02', '2024-01-01'])
+    assert scraper.get_dates(5, dirPath=tmp_path) == ['2024-01-01', '2024-01-02']
+    assert listed == [tmp_path]
+
+def test_parse_date_spec():
+    today = datetime.date(2024, 3, 1)
+    assert catalogue.parse_date_spec('2024-01-05', today) == ('2024-01-05', False)
+    assert catalogue.parse_date_spec('today', today) == ('2024-03-01', True)
+    assert catalogue.parse_date_spec('30d', today) == ('2024-01-31', True)
+    assert catalogue.parse_date_spec('2w', today) == ('2024-02-16', True)
+    with pytest.raises(ValueError, match="Missing or incorrectly formatted date, should be YYYY-MM-DD"):
+        catalogue.parse_date_spec('30x', today)
+
+def test_resolve_dates(tmp_path: Path):
+    for date in ['2024-01-01', '2024-01-05', '2024-01-09']:
+        (tmp_path / f"{date}.csv").touch()
+    (tmp_path / 'date_table.txt').touch()
+    with pytest.raises(ValueError, match="No file exists for 2024-01-06"):
+        scraper.resolve_dates(['2024-01-06'], dirPath=tmp_path)
+    assert scraper.resolve_dates(['2024-01-06', '2024-01-06'], 'before', tmp_path) == ['2024-01-05', '2024-01-05']
+    assert scraper.resolve_dates(['2024-01-06'], 'after', tmp_path) == ['2024-01-09']
+    assert scraper.resolve_dates(['2024-01-08', '2024-01-03'], 'nearest', tmp_path) == ['2024-01-09', '2024-01-01']
+    assert scraper.resolve_dates(['today'], dirPath=tmp_path) == ['2024-01-09']
+    with pytest.raises(ValueError, match="No scrape exists on or before 2023-12-31"):
+        scraper.resolve_dates(['2023-12-31'], 'before', tmp_path)
+    assert scraper.get_dates(10, dirPath=tmp_path, since='2024-01-02', until='2024-01-09') == ['2024-01-05', '2024-01-09']
@@ -0,0 +1,59 @@
+import json
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from ttipabot import firm_rules, analyser
+
+def test_default_rules():
+    firms = pd.Series(["Spruson and Ferguson Pty Ltd", "Griffth Legal Pty Ltd", "Davies Collison Cave Law",
+                       "Smith Patent and Trade Mark Attorneys", "FPA Patents Pty Ltd", "", "Acme IP Ltd"], dtype='string')
+    assert firm_rules.canonicalise(firms).tolist() == ["SPRUSON & FERGUSON", "GRIFFITH LEGAL", "DAVIES COLLISON CAVE",
+                                                       "SMITH", "FPA PATENT ATTORNEYS", "", "ACME IP"]
+
+def test_rules_apply_in_order(tmp_path: Path):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps({"rules": [
+        {"type": "replace", "replacements": {"A": "B", "B": "C"}},
+        {"type": "removesuffix", "suffixes": [" X", " Y"]},
+    ]}))
+    rules = firm_rules.FirmRules.load(path)
+    # Later rules see the output of earlier ones, as the column passes they replace did
+    assert rules.canonicalise(pd.Series(["A", "Q Y X", "Q X Y"], dtype='string')).tolist() == ["C", "Q", "Q X"]
+
+def test_unknown_rule_type(tmp_path: Path):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps({"rules": [{"type": "lower"}]}))
+    with pytest.raises(ValueError, match="Unknown firm rule type 'lower'"):
+        firm_rules.FirmRules.load(path)
+
+def test_distinct_names_consolidated_once(monkeypatch):
+    rules = firm_rules.FirmRules([firm_rules.Upper()])
+    seen = []
+    original_apply = firm_rules.Upper.apply
+    monkeypatch.setattr(firm_rules.Upper, "apply", lambda self, firm: seen.append(firm) or original_apply(self, firm))
+    monkeypatch.setattr(firm_rules, "_rules", rules)
+    df = pd.DataFrame({'Firm': ["a", "b", "a", pd.NA]}, dtype='string')
+    assert analyser.consolidate_firms(df)['Firm'].tolist() == ["A", "B", "A", pd.NA]
+    analyser.consolidate_firms(pd.DataFrame({'Firm': ["b", "c"]}, dtype='string'))
+    assert seen == ["a", "b", "c"]
+
+def test_cache_persists_by_rules_version(tmp_path: Path):
+    rulesPath, cachePath = tmp_path / "rules.json", tmp_path / "cache.json"
+    rulesPath.write_text(json.dumps({"rules": [{"type": "upper"}]}))
+    firm_rules.FirmRules.load(rulesPath, cachePath).canonicalise(pd.Series(["a", "b"], dtype='string'))
+    assert firm_rules.FirmRules.load(rulesPath, cachePath).canonical == {"a": "A", "b": "B"}
+    # Names worked out under other rules aren't reused
+    rulesPath.write_text(json.dumps({"rules": []}))
+    assert firm_rules.FirmRules.load(rulesPath, cachePath).canonical == {}
+
+def test_cache_follows_scrapes_folder(tmp_path: Path, monkeypatch):
+    from ttipabot import scraper
+    monkeypatch.setattr(scraper, "CSV_FOLDER", tmp_path / "scrapes")
+    rules = firm_rules.FirmRules([firm_rules.Upper()], cachePath=firm_rules.default_cache_path)
+    # A folder that can't be written to only means the names aren't remembered
+    assert rules.canonicalise(pd.Series(["a"], dtype='string')).tolist() == ["A"]
+    (tmp_path / "scrapes").mkdir()
+    rules.canonicalise(pd.Series(["b"], dtype='string'))
+    assert json.loads((tmp_path / "scrapes" / firm_rules.CACHE_NAME).read_text())["canonical"] == {"a": "A", "b": "B"}
@@ -0,0 +1,44 @@
+import shutil
+from pathlib import Path
+import pytest
+from ttipabot import history, scraper
+
+EXAMPLES_FOLDER = Path.cwd() / "tests/Examples"
+
+@pytest.fixture
+def dirPath(tmp_path: Path) -> Path:
+    shutil.copy(EXAMPLES_FOLDER / "csvExample1.csv", tmp_path / "2024-01-01.csv")
+    shutil.copy(EXAMPLES_FOLDER / "csvExample2.csv", tmp_path / "2024-01-03.csv")
+    # An unchanged day mapped onto the first scrape
+    (tmp_path / "date_table.txt").write_text("2024-01-02 : 2024-01-01\n")
+    return tmp_path
+
+def test_attorney_history(dirPath: Path):
+    assert scraper.update_history(dirPath) == 3
+    assert history.attorney_history(dirPath, "bolderston") == [
+        ("Daniel Bolderston", "Allens Patent and Trade Marks Attorneys", "Trade marks", "2024-01-01", "2024-01-02"),
+        ("Daniel Bolderston", "AJ Park", "Trade marks", "2024-01-03", "2024-01-03"),
+    ]
+    assert history.attorney_history(dirPath, "Albert Abram")[0][3:] == ("2024-01-03", "2024-01-03")
+
+def test_firm_history(dirPath: Path):
+    scraper.update_history(dirPath)
+    assert [interval[0] for interval in history.firm_history(dirPath, "fb rice")] == ["Michelle Catto"]
+
+def test_firm_history_canonical(dirPath: Path):
+    (dirPath / "2024-01-04.csv").write_text("Name,Phone,Email,Firm,Address,Registered as\n"
+                                            "Jane Doe,,,Griffth Hack Lawyers,,Patents\n")
+    scraper.update_history(dirPath)
+    # The misspelt firm is only found through its canonical form
+    assert [interval[0] for interval in history.firm_history(dirPath, "griffith hack")] == ["Jane Doe"]
+
+def test_update_history_incremental(dirPath: Path):
+    scraper.update_history(dirPath)
+    assert scraper.update_history(dirPath) == 0
+    shutil.copy(EXAMPLES_FOLDER / "csvExample2.csv", dirPath / "2024-01-04.csv")
+    assert scraper.update_history(dirPath) == 1
+    assert history.attorney_history(dirPath, "Albert Abram")[0][3:] == ("2024-01-03", "2024-01-04")
+    # Rebuilding from scratch gives the same intervals
+    intervals = history.firm_history(dirPath, "")
+    assert scraper.update_history(dirPath, rebuild=True) == 4
+    assert history.firm_history(dirPath, "") == intervals
@@ -0,0 +1,39 @@
+import pandas as pd
+
+from ttipabot import identity, analyser
+
+def frame(rows: list[tuple]) -> pd.DataFrame:
+    return pd.DataFrame(rows, columns=['Name', 'Firm', 'Email', 'Phone'], dtype='string')
+
+def test_find_renames():
+    left = frame([("Jane Smith", "Acme IP", "jane@acme.com", "02 9000 0001"),
+                  ("Jon Citizen", "Acme IP Pty Ltd", "", ""),
+                  ("Sam Jones", "Acme IP", "info@acme.com", "02 9000 0000")])
+    right = frame([("Jane Doe", "Acme IP", "jane@acme.com", "+61 2 9000 0009"),
+                   ("John Citizen", "ACME IP", "", ""),
+                   ("Alex Brown", "Acme IP", "info@acme.com", "02 9000 0000")])
+    # Same personal email, and a near identical name at the same firm, but a shared inbox and phone aren't enough alone
+    assert identity.find_renames(left, right) == [(0, 0), (1, 1)]
+
+def test_shared_email_not_identifying():
+    left = frame([("Jane Smith", "", "info@acme.com", ""), ("Sam Jones", "", "info@acme.com", "")])
+    right = frame([("Jane Doe", "", "info@acme.com", "")])
+    assert identity.find_renames(left, right) == []
+
+def test_each_attorney_paired_once():
+    left = frame([("Jane Smith", "", "", "0290000001")])
+    right = frame([("Jane Doe", "", "", "0290000001"), ("Jane Smith-Doe", "", "", "0290000001")])
+    assert identity.find_renames(left, right) == [(0, 1)]
+
+def test_match_renames():
+    df1 = pd.DataFrame({'Name': ["Jane Smith", "Sam Jones"], 'Firm': ["Acme IP", "Acme IP"], 'Registered as': ["Patents"] * 2,
+                        'Email': ["jane@acme.com", "sam@acme.com"], 'Phone': ["", ""]}, dtype='string')
+    df2 = df1.copy()
+    df2.loc[0, ['Name', 'Firm']] = ["Jane Doe", "Beta IP"]
+    df_diffs = analyser.diff_dfs(df1, df2, False, False, identify=True)
+    views = analyser.project_diffs(df_diffs, ['registrations', 'lapses', 'renames'])
+    assert views['registrations'].empty and views['lapses'].empty
+    assert views['renames'].to_dict('records') == [{'Former name': "Jane Smith", 'Name': "Jane Doe", 'Old firm': "Acme IP", 'New firm': "Beta IP"}]
+    # Without matching, the same change is a lapse and a registration
+    views = analyser.project_diffs(analyser.diff_dfs(df1, df2, False, False), ['registrations', 'lapses', 'renames'])
+    assert len(views['registrations']) == 1 and len(views['lapses']) == 1 and views['renames'].empty
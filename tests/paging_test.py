@@ -0,0 +1,150 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlparse, parse_qs
+import pytest
+from ttipabot import scraper
+
+EXAMPLES_FOLDER = Path.cwd() / "tests/Examples"
+
+def fixture_results() -> list[str]:
+    """Builds a register's worth of attorney HTML from the examples, including blank entries."""
+    template = (EXAMPLES_FOLDER / "attorneyHTMLExample2.txt").read_text(encoding="utf-8")
+    blank = (EXAMPLES_FOLDER / "blankAttorneyExample.txt").read_text(encoding="utf-8")
+    results = []
+    for i in range(53):
+        results.append(blank if i % 10 == 0 else template.replace("Donald Iain Angus", f"Attorney Number {i}"))
+    return results
+
+class RegisterHandler(BaseHTTPRequestHandler):
+    """Serves pages of the fixture register the way the search endpoint does."""
+    results = fixture_results()
+    failures = set()
+    # Status of a server error page sent in place of every full register, if any
+    errorStatus = None
+    # ETag sent with full responses, if any, and the validators requests came with
+    etag = None
+    validators = []
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        offset, count = int(query["e"][0]), int(query["p"][0])
+        self.validators.append(self.headers.get("If-None-Match"))
+        if self.etag is not None and self.headers.get("If-None-Match") == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        if self.errorStatus is not None and count > 1:
+            body = b"<html>Service Unavailable</html>"
+            self.send_response(self.errorStatus)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        # Fail the first request for any offset marked as flaky
+        if offset in self.failures:
+            self.failures.discard(offset)
+            self.send_response(503)
+            self.end_headers()
+            return
+        page = [{"Html": html} for html in self.results[offset:offset+count]]
+        # Query timings differ on every request
+        body = json.dumps({"TotalTime": len(self.validators), "Count": len(self.results), "Results": page}).encode("utf-8")
+        self.send_response(200)
+        if self.etag is not None:
+            self.send_header("ETag", self.etag)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture()
+def register_server(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RegisterHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(scraper, "REGISTER_URL", f"http://127.0.0.1:{server.server_address[1]}/results/")
+    monkeypatch.setattr(scraper, "RETRY_BACKOFF", 0)
+    yield server
+    server.shutdown()
+
+def test_register_url_offset():
+    url = scraper.register_url(50, offset=100)
+    assert "&e=100&p=50&" in url
+
+def test_paged_matches_single_request(register_server):
+    single = scraper.parse_register_html(scraper.stream_register_html())
+    assert len(single) == 47
+    for pageSize in [1, 7, 10, 100]:
+        assert scraper.get_register_paged(pageSize, workers=3) == single
+
+def test_paged_retries_failed_page(register_server):
+    RegisterHandler.failures.update({10, 20})
+    paged = scraper.get_register_paged(10, workers=2)
+    assert not RegisterHandler.failures
+    assert paged == scraper.parse_register_html(scraper.stream_register_html())
+
+def test_paged_gives_up(register_server):
+    RegisterHandler.failures.update({30})
+    with pytest.raises(Exception):
+        scraper.get_register_paged(10, workers=2, retries=0)
+    RegisterHandler.failures.clear()
+
+@pytest.fixture()
+def scrapes_folder(tmp_path, monkeypatch):
+    (tmp_path / "date_table.txt").touch()
+    monkeypatch.setattr(scraper, "CSV_FOLDER", tmp_path)
+    monkeypatch.setattr(scraper, "today", lambda: "2026-01-01")
+    assert scraper.scrape_register()
+    monkeypatch.setattr(scraper, "today", lambda: "2026-01-02")
+    return tmp_path
+
+def test_unchanged_register_not_parsed(register_server, scrapes_folder, monkeypatch):
+    monkeypatch.setattr(scraper, "parse_register_html", lambda chunks: pytest.fail("parsed an unchanged register"))
+    assert scraper.scrape_register()
+    assert not (scrapes_folder / "2026-01-02.csv").exists()
+    assert scraper.read_date_table(scrapes_folder) == {"2026-01-02": "2026-01-01"}
+    assert scraper.read_fingerprint(scrapes_folder)["date"] == "2026-01-02"
+    # The next day compares against the mapped date
+    monkeypatch.setattr(scraper, "today", lambda: "2026-01-03")
+    assert scraper.scrape_register()
+    assert scraper.read_date_table(scrapes_folder)["2026-01-03"] == "2026-01-01"
+
+def test_changed_register_parsed(register_server, scrapes_folder, monkeypatch):
+    results = [html.replace("Attorney Number 1<", "Renamed Attorney<") for html in RegisterHandler.results]
+    monkeypatch.setattr(RegisterHandler, "results", results)
+    assert scraper.scrape_register()
+    assert "Renamed Attorney" in (scrapes_folder / "2026-01-02.csv").read_text(encoding="utf-8")
+    assert scraper.read_date_table(scrapes_folder) == {}
+
+def test_error_page_not_recorded(register_server, scrapes_folder, monkeypatch):
+    monkeypatch.setattr(RegisterHandler, "errorStatus", 503)
+    fingerprint = scraper.read_fingerprint(scrapes_folder)
+    with pytest.raises(Exception):
+        scraper.scrape_register()
+    assert not (scrapes_folder / "2026-01-02.csv").exists()
+    assert scraper.read_date_table(scrapes_folder) == {}
+    assert scraper.read_fingerprint(scrapes_folder) == fingerprint
+
+def test_fingerprint_ignores_query_timing():
+    first, second = scraper.ResponseFingerprint(), scraper.ResponseFingerprint()
+    for chunk in [b'{"TotalTime":1,"Count":2,"Resu', b'lts":[{"Html":"a"}]}']:
+        first.update(chunk)
+    second.update(b'{"TotalTime":250,"Count":2,"Results":[{"Html":"a"}]}')
+    assert first.hexdigest() == second.hexdigest()
+
+def test_not_modified_register(register_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(RegisterHandler, "etag", '"v1"')
+    monkeypatch.setattr(RegisterHandler, "validators", [])
+    (tmp_path / "date_table.txt").touch()
+    monkeypatch.setattr(scraper, "CSV_FOLDER", tmp_path)
+    for date in ["2026-01-01", "2026-01-02"]:
+        monkeypatch.setattr(scraper, "today", lambda: date)
+        assert scraper.scrape_register()
+    assert RegisterHandler.validators[-1] == '"v1"'
+    assert scraper.read_date_table(tmp_path) == {"2026-01-02": "2026-01-01"}
+    assert scraper.read_fingerprint(tmp_path)["etag"] == '"v1"'
@@ -80,4 +80,49 @@ def test_all_data_parse(examples: Examples):
 def test_multiple_attorneys_data_parse(examples: Examples):
     data = [examples.exampleAttorneys[1].allData, examples.exampleAttorneys[2].allData]
     html = [attorney.rawHTML for attorney in examples.exampleAttorneys]
-    assert scraper.parse_register(html) == data
\ No newline at end of file
+    assert scraper.parse_register(html) == data
+
+@pytest.fixture(scope="session")
+def register_dump() -> str:
+    with open(EXAMPLES_FOLDER / "registerDumpExample.txt", 'r', encoding="utf-8") as f:
+        return f.read()
+
+def test_streaming_parse_matches_soup(register_dump: str):
+    soup = BeautifulSoup(register_dump, 'lxml')
+    expected = scraper.parse_register(soup.find_all(class_="list-item attorney"))
+    assert scraper.parse_register_html([register_dump]) == expected
+
+def test_streaming_parse_chunked(register_dump: str):
+    whole = scraper.parse_register_html([register_dump])
+    chunks = (register_dump[i:i+1000] for i in range(0, len(register_dump), 1000))
+    assert scraper.parse_register_html(chunks) == whole
+
+def test_streaming_parse_examples(examples: Examples):
+    html = "".join(str(attorney.rawHTML) for attorney in examples.exampleAttorneys)
+    assert scraper.parse_register_html([html]) == [examples.exampleAttorneys[1].allData, examples.exampleAttorneys[2].allData]
+
+def clean_whole(text: str) -> str:
+    return text.replace("\\r", "").replace("\\n", "").replace("\\", "")
+
+@pytest.mark.parametrize("chunkSize", [1, 2, 3, 7, 64])
+def test_unescape_stream(chunkSize: int):
+    text = 'a\\r\\nb\\\\rn\\\\\\nc\\"d\\' * 20 + '\\rr\\\\r\\'
+    chunks = [text[i:i+chunkSize] for i in range(0, len(text), chunkSize)]
+    assert "".join(scraper.unescape_stream(chunks)) == clean_whole(text)
+
+class FakeResponse:
+    """Stand-in for a streamed requests response."""
+    def __init__(self, body: bytes, encoding: str = "utf-8"):
+        self.body = body
+        self.encoding = encoding
+
+    def iter_content(self, chunkSize: int):
+        for i in range(0, len(self.body), chunkSize):
+            yield self.body[i:i+chunkSize]
+
+def test_iter_register_html(register_dump: str):
+    escaped = register_dump.replace('"', '\\"').replace("</div>", "</div>\\r\\n") + "Ä€"
+    response = FakeResponse(escaped.encode("utf-8"))
+    streamed = "".join(scraper.iter_register_html(response, chunkSize=4093))
+    assert streamed == clean_whole(escaped)
+    assert scraper.parse_register_html(scraper.iter_register_html(response, chunkSize=4093)) == scraper.parse_register_html([register_dump])
@@ -0,0 +1,49 @@
+import json
+import time
+from pathlib import Path
+
+import pytest
+
+from ttipabot import profiling, scraper
+
+@pytest.fixture
+def profile():
+    run = profiling.start("test")
+    yield run
+    profiling.stop()
+
+def test_disabled_stages_do_nothing():
+    items = [1, 2]
+    assert profiling.iterate("parse", items) is items
+    with profiling.stage("load") as stage:
+        stage.rows = 3
+    assert profiling.active() is None
+
+def test_nested_stages_exclusive(profile):
+    with profiling.stage("outer") as stage:
+        stage.rows = 5
+        with profiling.stage("inner"):
+            time.sleep(0.05)
+    stages = profile.record()["stages"]
+    assert stages["inner"]["seconds"] >= 0.05
+    assert stages["outer"]["seconds"] < 0.05
+    assert stages["outer"]["rows"] == 5 and stages["outer"]["calls"] == 1
+
+def test_scrape_stages(profile):
+    body = (Path.cwd() / "tests/Examples/registerDumpExample.txt").read_bytes()
+    response = type("Response", (), {"encoding": "utf-8", "iter_content": lambda self, size: (body[i:i + size] for i in range(0, len(body), size))})()
+    rows = scraper.parse_register_html(scraper.iter_register_html(response, chunkSize=4096))
+    stages = profile.record()["stages"]
+    assert stages["download"]["bytes"] == len(body)
+    assert stages["parse"]["rows"] == len(rows)
+    assert set(stages) == {"download", "unescape", "parse"}
+
+def test_append_record(profile, tmp_path: Path):
+    with profiling.stage("load"):
+        pass
+    path = tmp_path / "runs.jsonl"
+    profiling.append_record(profile, path)
+    profiling.append_record(profile, path)
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert len(records) == 2 and records[0]["command"] == "test" and records[0]["stages"]["load"]["calls"] == 1
+    assert "load" in profile.report()
@@ -0,0 +1,78 @@
+import os
+from pathlib import Path
+import pytest
+from ttipabot import api, result_cache, scraper
+
+EXAMPLES_FOLDER = Path.cwd() / "tests/Examples"
+
+@pytest.fixture()
+def cache(monkeypatch):
+    cache = result_cache.ResultCache(size=2)
+    monkeypatch.setattr(result_cache, "_cache", cache)
+    return cache
+
+def test_memory_lru(cache):
+    for key in ["a", "b", "c"]:
+        cache.put(key, key.upper())
+    assert cache.get("a") is None and cache.get("b") == "B"
+    cache.put("d", "D")
+    # b was used more recently than c
+    assert list(cache.entries) == ["b", "d"]
+
+def test_disk_tier_bounded(tmp_path):
+    cache = result_cache.ResultCache(size=1, dirPath=tmp_path, maxBytes=10)
+    for key in ["a", "b", "c"]:
+        cache.put(key, "x" * 4)
+    # Only the two most recent fit on disk
+    assert sorted(path.stem for path in tmp_path.glob("*.result")) == ["b", "c"]
+    # Another process finds them on disk
+    assert result_cache.ResultCache(dirPath=tmp_path).get("b") == "xxxx"
+
+def test_aliased_snapshots_share_entries(cache, tmp_path, monkeypatch):
+    csv1, csv2 = EXAMPLES_FOLDER / "csvExample1.csv", EXAMPLES_FOLDER / "csvExample2.csv"
+    modes = ['registrations', 'lapses']
+    outputs = api.compare_paths(csv1, csv2, False, False, modes, json=True)
+    copy1, copy2 = tmp_path / "2024-01-01.csv", tmp_path / "2024-01-02.csv"
+    copy1.write_bytes(csv1.read_bytes())
+    copy2.write_bytes(csv2.read_bytes())
+    diffs = []
+    diff = api.CompareContext.diff
+    monkeypatch.setattr(api.CompareContext, "diff", lambda self, *args: diffs.append(args) or diff(self, *args))
+    assert api.compare_paths(copy1, copy2, False, False, modes, json=True) == outputs
+    assert not diffs
+    # Other arguments are cached separately
+    api.compare_paths(copy1, copy2, True, False, modes, json=True)
+    assert len(diffs) == 1
+
+def test_changed_snapshot_misses(cache, tmp_path):
+    csv = tmp_path / "2024-01-01.csv"
+    csv.write_bytes((EXAMPLES_FOLDER / "csvExample1.csv").read_bytes())
+    key = result_cache.make_key("rank", [csv], 'names', 10, False, False, False)
+    csv.write_bytes((EXAMPLES_FOLDER / "csvExample2.csv").read_bytes())
+    assert result_cache.make_key("rank", [csv], 'names', 10, False, False, False) != key
+
+def test_recorded_digests_not_rehashed(tmp_path, monkeypatch):
+    csv = tmp_path / "2024-01-01.csv"
+    csv.write_bytes((EXAMPLES_FOLDER / "csvExample1.csv").read_bytes())
+    scraper.append_to_hash_index(tmp_path, "2024-01-01", "recorded")
+    hashed = []
+    monkeypatch.setattr(scraper, "hash_file", lambda path: hashed.append(path) or "hashed")
+    assert result_cache.content_key(csv) == "recorded"
+    assert not hashed
+    # Rewriting the csv after the index means the recorded digest can't be trusted
+    os.utime(csv, ns=(csv.stat().st_atime_ns, (tmp_path / "hash_index.txt").stat().st_mtime_ns + 1))
+    assert result_cache.content_key(csv) == "hashed"
+    assert hashed == [csv]
+
+def test_delta_reuses_recorded_digest(tmp_path, monkeypatch):
+    for date, source in [('2024-01-01', "csvExample1.csv"), ('2024-01-02', "csvExample2.csv")]:
+        (tmp_path / f"{date}.csv").write_bytes((EXAMPLES_FOLDER / source).read_bytes())
+    (tmp_path / 'date_table.txt').write_text('')
+    digest = scraper.hash_file(tmp_path / '2024-01-02.csv')
+    assert scraper.pack_csvs(2, tmp_path) == 1
+    delta = scraper.select_filepaths_for_dates(tmp_path, ['2024-01-02'])[0]
+    assert delta.name.endswith(".delta.json")
+    hashed = []
+    monkeypatch.setattr(scraper, "hash_file", lambda path: hashed.append(path) or "hashed")
+    assert result_cache.content_key(delta) == digest
+    assert not hashed
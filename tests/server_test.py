@@ -0,0 +1,101 @@
+import asyncio
+import datetime
+import json
+from pathlib import Path
+import pytest
+from ttipabot import api, server, result_cache
+
+EXAMPLES_FOLDER = Path.cwd() / "tests/Examples"
+
+@pytest.fixture(autouse=True)
+def empty_result_cache(monkeypatch):
+    # Answers cached by earlier tests would skip the diffs these tests look for
+    monkeypatch.setattr(result_cache, "_cache", result_cache.ResultCache())
+
+def test_backoff_delay():
+    for attempt in range(8):
+        delay = server.backoff_delay(attempt, base=1, cap=30)
+        assert min(30, 2 ** attempt) / 2 <= delay <= min(30, 2 ** attempt)
+
+def test_seconds_until():
+    now = datetime.datetime(2026, 1, 1, 8, 0)
+    assert server.seconds_until(datetime.time(9, 0), now) == 3600
+    assert server.seconds_until(datetime.time(7, 0), now) == 23 * 3600
+
+def test_resident_context_evicts(tmp_path):
+    csv1, csv2 = EXAMPLES_FOLDER / "csvExample1.csv", EXAMPLES_FOLDER / "csvExample2.csv"
+    csv3 = tmp_path / "csvExample3.csv"
+    csv3.write_bytes(csv1.read_bytes())
+    context = server.ResidentContext(2)
+    diffs = context.diff(csv1, csv2, False, False)
+    context.load(csv1)
+    assert context.diff(csv1, csv2, False, False) is diffs
+    # A third snapshot evicts the least recently used, and the diffs made from it
+    context.load(csv3)
+    assert list(context.frames) == [csv1, csv3]
+    assert not context.diffs
+
+def test_resident_context_too_small_for_diff():
+    csv1, csv2 = EXAMPLES_FOLDER / "csvExample1.csv", EXAMPLES_FOLDER / "csvExample2.csv"
+    context = server.ResidentContext(1)
+    context.diff(csv1, csv2, False, False)
+    assert list(context.frames) == [csv2]
+    assert not context.diffs
+
+def query(app: server.Server, method: str, target: str) -> tuple[int, object]:
+    status, body = asyncio.run(app.respond(method, target))
+    return status, json.loads(body)
+
+def test_compare_query():
+    app = server.Server()
+    dates = api.get_dates(2, oldest=True)
+    status, body = query(app, "GET", f"/compare?date={dates[1]}&date={dates[0]}&mode=registrations&mode=lapses")
+    assert status == 200 and body["dates"] == dates
+    expected = api.compare_data_modes(dates, False, False, ['registrations', 'lapses'], json=True)
+    assert body["results"] == {mode: json.loads(output) for mode, output in expected.items()}
+    # The diff stays loaded for the next query
+    assert len(app.context.diffs) == 1
+
+def test_compare_query_defaults_to_warmed_dates():
+    app = server.Server()
+    app.warm()
+    warmed = list(app.context.diffs)
+    assert warmed
+    status, body = query(app, "GET", "/compare?mode=registrations")
+    # The latest two changed scrapes, rather than two dates aliased to the same snapshot
+    assert status == 200 and body["dates"] == sorted(api.get_dates(2, changesOnly=True))
+    assert list(app.context.diffs) == warmed
+
+def test_rank_and_dates_queries():
+    app = server.Server()
+    status, body = query(app, "GET", "/rank?mode=firms&num=3")
+    assert status == 200 and body["date"] == api.get_latest_date() and len(body["ranking"]) == 3
+    status, body = query(app, "GET", "/dates?num=2&oldest=1")
+    assert body == api.get_dates(2, oldest=True)
+
+def test_bad_queries():
+    app = server.Server()
+    assert query(app, "GET", "/nothing")[0] == 404
+    assert query(app, "GET", "/scrape")[0] == 405
+    assert query(app, "GET", "/compare?date=2020-13-45&date=2021-01-01")[0] == 400
+    assert query(app, "GET", "/rank?num=ten")[0] == 400
+
+def test_serve_unix_socket(tmp_path):
+    socketPath = str(tmp_path / "ttipabot.sock")
+
+    async def exchange():
+        task = asyncio.ensure_future(server.Server(keep=2).run(socketPath=socketPath))
+        for _ in range(100):
+            if Path(socketPath).exists():
+                break
+            await asyncio.sleep(0.01)
+        reader, writer = await asyncio.open_unix_connection(socketPath)
+        writer.write(b"GET /dates?num=1 HTTP/1.1\r\nHost: localhost\r\n\r\n")
+        response = await reader.read()
+        writer.close()
+        task.cancel()
+        return response
+
+    head, _, body = asyncio.run(exchange()).partition(b"\r\n\r\n")
+    assert head.startswith(b"HTTP/1.1 200 OK")
+    assert json.loads(body) == [api.get_latest_date()]
@@ -0,0 +1,70 @@
+import shutil
+from pathlib import Path
+import pytest
+from ttipabot import store, analyser, registrations
+
+pytest.importorskip("pyarrow")
+
+EXAMPLES_FOLDER = Path.cwd() / "tests/Examples"
+
+@pytest.fixture()
+def csvPath(tmp_path: Path) -> Path:
+    path = tmp_path / "2024-01-01.csv"
+    shutil.copy(EXAMPLES_FOLDER / "csvExample1.csv", path)
+    return path
+
+@pytest.mark.parametrize("suffix", [".parquet", ".arrow"])
+def test_columnar_matches_csv(csvPath: Path, suffix: str):
+    expected = analyser.csv_to_df(csvPath)
+    store.write_columnar(csvPath, suffix)
+    assert store.columnar_paths(csvPath) == [csvPath.with_suffix(suffix)]
+    assert analyser.csv_to_df(csvPath).equals(expected)
+
+@pytest.mark.parametrize("suffix", [".parquet", ".arrow"])
+def test_columnar_select_columns(csvPath: Path, suffix: str):
+    columns = ['Name', 'Registered as', 'Firm']
+    expected = analyser.csv_to_df(csvPath, columns)
+    assert list(expected.columns) == columns
+    store.write_columnar(csvPath, suffix)
+    assert analyser.csv_to_df(csvPath, columns).equals(expected)
+
+def test_migrate(csvPath: Path):
+    assert store.migrate([csvPath]) == 1
+    assert store.migrate([csvPath]) == 0
+    store.remove_columnar(csvPath)
+    assert store.columnar_paths(csvPath) == []
+
+@pytest.mark.parametrize("suffix", [".parquet", ".arrow"])
+def test_columnar_stores_mask(csvPath: Path, suffix: str):
+    columns = ['Name', registrations.MASK_COLUMN]
+    # Worked out from the csv without a columnar copy
+    expected = analyser.csv_to_df(csvPath, columns)
+    assert list(expected[registrations.MASK_COLUMN]) == [registrations.TRADE_MARKS | registrations.AU,
+                                                         registrations.PATENTS | registrations.TRADE_MARKS | registrations.AU,
+                                                         registrations.PATENTS | registrations.TRADE_MARKS | registrations.NZ]
+    store.write_columnar(csvPath, suffix)
+    assert store.has_mask(csvPath.with_suffix(suffix))
+    assert analyser.csv_to_df(csvPath, columns).equals(expected)
+    assert registrations.MASK_COLUMN not in analyser.csv_to_df(csvPath).columns
+
+def test_migrate_adds_mask(csvPath: Path):
+    import pyarrow.parquet as pq
+    path = store.write_columnar(csvPath)
+    pq.write_table(pq.read_table(path).drop_columns([registrations.MASK_COLUMN]), path)
+    assert store.migrate([csvPath]) == 1
+    assert store.has_mask(path)
+
+def test_mask_sidecar(csvPath: Path, monkeypatch):
+    columns = ['Name', registrations.MASK_COLUMN]
+    expected = analyser.csv_to_df(csvPath, columns)
+    # Installs without pyarrow keep the mask next to the csv instead
+    monkeypatch.setattr(store, "available", lambda: False)
+    assert store.migrate([csvPath]) == 1
+    assert store.migrate([csvPath]) == 0
+    computed = []
+    monkeypatch.setattr(registrations, "with_mask", lambda *args: computed.append(args))
+    assert analyser.csv_to_df(csvPath, columns).equals(expected)
+    assert list(store.read_snapshot(csvPath, [registrations.MASK_COLUMN])[registrations.MASK_COLUMN]) == list(expected[registrations.MASK_COLUMN])
+    assert not computed
+    store.remove_columnar(csvPath)
+    assert not store.mask_path(csvPath).exists()
@@ -0,0 +1,44 @@
+import csv
+import io
+import json
+from pathlib import Path
+import pytest
+import pandas as pd
+from ttipabot import analyser, writers
+
+EXAMPLES_FOLDER = Path.cwd() / "tests/Examples"
+
+@pytest.fixture
+def attorneys():
+    df = analyser.csv_to_df(EXAMPLES_FOLDER / "csvExample2.csv")
+    df.index += 1
+    return df
+
+def test_markdown_matches_to_markdown(attorneys):
+    assert writers.tabulates_alike(attorneys)
+    assert writers.render(attorneys, 'markdown', chunkRows=3) == attorneys.to_markdown()
+    # Wide characters, surrounding whitespace and numbers are laid out as tabulate does
+    odd = pd.DataFrame({'Name': [" 東京 ", "Zoë"], 'Firm': ["", "A"], 'Length': [2, 13]}).astype({'Name': 'string', 'Firm': 'string'})
+    assert writers.render(odd, 'markdown') == odd.to_markdown()
+    # Text tabulate would read as numbers is left to tabulate
+    numbers = pd.DataFrame({'Phone': ["123", "456"]}, dtype='string')
+    assert not writers.tabulates_alike(numbers)
+    assert writers.render(numbers, 'markdown') == numbers.to_markdown()
+
+def test_ndjson(attorneys):
+    attorneys.loc[1, 'Name'] = 'Back\\slash "quoted"\ttab'
+    lines = writers.render(attorneys, 'ndjson', fields={'Mode': 'lapses'}, chunkRows=2).split("\n")
+    records = [json.loads(line) for line in lines]
+    assert records == [{'Mode': 'lapses', **record} for record in json.loads(attorneys.to_json(orient='records'))]
+
+def test_csv(attorneys):
+    attorneys.loc[2, 'Firm'] = 'Smith, "Jones"\nand Co'
+    output = writers.render(attorneys, 'csv', chunkRows=3)
+    assert list(csv.reader(io.StringIO(output))) == [list(attorneys.columns)] + attorneys.values.tolist()
+
+def test_sections_share_csv_columns():
+    frames = {'movements': pd.DataFrame({'Name': ["A"], 'Old firm': ["X"], 'New firm': ["Y"]}),
+              'lapses': pd.DataFrame({'Name': ["B"], 'Firm': ["Z"]})}
+    stream = io.StringIO()
+    writers.write_sections(frames, stream, 'csv')
+    assert stream.getvalue() == "Mode,Name,Old firm,New firm,Firm\nmovements,A,X,Y,\nlapses,B,,,Z\n"